@@ -0,0 +1,35 @@
+"""add_conversation_summary
+
+Revision ID: a8e6b7c9d0f1
+Revises: f7d5a6b8c9e0
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8e6b7c9d0f1'
+down_revision: Union[str, None] = 'f7d5a6b8c9e0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('conversations', sa.Column('summary_seq', sa.Integer(), nullable=True, comment='最新压缩摘要消息的序号'))
+    op.add_column(
+        'conversations',
+        sa.Column('summarized_seq', sa.Integer(), server_default='0', nullable=False, comment='序号不超过该值的消息已包含在摘要中'),
+    )
+    op.add_column(
+        'conversations',
+        sa.Column('summarized_tokens', sa.Integer(), server_default='0', nullable=False, comment='摘要所替代的原始消息估算 Token 数'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('conversations', 'summarized_tokens')
+    op.drop_column('conversations', 'summarized_seq')
+    op.drop_column('conversations', 'summary_seq')
@@ -0,0 +1,36 @@
+"""add_api_key_rate_limits
+
+Revision ID: b3f1c2d4e5a6
+Revises: 8ecc365fdb32
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3f1c2d4e5a6'
+down_revision: Union[str, None] = '8ecc365fdb32'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('api_keys', sa.Column('rate_limit_rpm', sa.Integer(), nullable=True, comment='每分钟请求数限额，为空使用全局默认，0 表示不限'))
+    op.add_column('api_keys', sa.Column('rate_limit_tpm', sa.Integer(), nullable=True, comment='每分钟 Token 数限额，为空使用全局默认，0 表示不限'))
+    op.create_table(
+        'rate_limit_buckets',
+        sa.Column('bucket', sa.String(length=64), nullable=False, comment='桶标识，如 rpm:1 / tpm:1'),
+        sa.Column('tokens', sa.Float(), nullable=False, comment='当前令牌数（可为负，表示透支）'),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False, comment='最后补充时间'),
+        sa.PrimaryKeyConstraint('bucket'),
+        comment='限流令牌桶表',
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('rate_limit_buckets')
+    op.drop_column('api_keys', 'rate_limit_tpm')
+    op.drop_column('api_keys', 'rate_limit_rpm')
@@ -0,0 +1,25 @@
+"""add_api_key_similarity_threshold
+
+Revision ID: d5b3e4f6a7c8
+Revises: c4a2d3e5f6b7
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5b3e4f6a7c8'
+down_revision: Union[str, None] = 'c4a2d3e5f6b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('api_keys', sa.Column('similarity_threshold', sa.Float(), nullable=True, comment='近似缓存的相似度阈值，为空表示不使用近似缓存'))
+
+
+def downgrade() -> None:
+    op.drop_column('api_keys', 'similarity_threshold')
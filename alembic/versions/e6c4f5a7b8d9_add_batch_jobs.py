@@ -0,0 +1,73 @@
+"""add_batch_jobs
+
+Revision ID: e6c4f5a7b8d9
+Revises: d5b3e4f6a7c8
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6c4f5a7b8d9'
+down_revision: Union[str, None] = 'd5b3e4f6a7c8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'batch_jobs',
+        sa.Column('id', sa.Integer(), nullable=False, comment='任务ID'),
+        sa.Column('api_key_id', sa.Integer(), nullable=False, comment='API Key ID'),
+        sa.Column('status', sa.String(length=20), nullable=False, comment='状态: pending/running/completed/cancelled'),
+        sa.Column('total', sa.Integer(), nullable=False, comment='请求总数'),
+        sa.Column('completed', sa.Integer(), nullable=False, comment='成功数'),
+        sa.Column('failed', sa.Integer(), nullable=False, comment='失败数'),
+        sa.Column('prompt_tokens', sa.Integer(), nullable=False, comment='输入Token数'),
+        sa.Column('completion_tokens', sa.Integer(), nullable=False, comment='输出Token数'),
+        sa.Column('cost', sa.Float(), nullable=False, comment='成本(USD)'),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True, comment='完成时间'),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False, comment='创建时间'),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False, comment='更新时间'),
+        sa.ForeignKeyConstraint(['api_key_id'], ['api_keys.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        comment='批量任务表',
+    )
+    op.create_index(op.f('ix_batch_jobs_id'), 'batch_jobs', ['id'], unique=False)
+    op.create_index(op.f('ix_batch_jobs_api_key_id'), 'batch_jobs', ['api_key_id'], unique=False)
+    op.create_index(op.f('ix_batch_jobs_status'), 'batch_jobs', ['status'], unique=False)
+
+    op.create_table(
+        'batch_items',
+        sa.Column('id', sa.Integer(), nullable=False, comment='请求ID'),
+        sa.Column('job_id', sa.Integer(), nullable=False, comment='任务ID'),
+        sa.Column('line', sa.Integer(), nullable=False, comment='在上传文件中的行号（从 1 开始）'),
+        sa.Column('custom_id', sa.String(length=200), nullable=True, comment='调用方自定义ID'),
+        sa.Column('provider', sa.String(length=50), nullable=False, comment='供应商'),
+        sa.Column('status', sa.String(length=20), nullable=False, comment='状态: pending/running/completed/failed'),
+        sa.Column('attempts', sa.Integer(), nullable=False, comment='执行次数'),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True, comment='最近一次开始执行的时间（租约起点）'),
+        sa.Column('request', sa.JSON(), nullable=False, comment='请求体'),
+        sa.Column('response', sa.JSON(), nullable=True, comment='响应体'),
+        sa.Column('error', sa.Text(), nullable=True, comment='错误信息'),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False, comment='创建时间'),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False, comment='更新时间'),
+        sa.ForeignKeyConstraint(['job_id'], ['batch_jobs.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        comment='批量任务请求表',
+    )
+    op.create_index('ix_batch_items_job_line', 'batch_items', ['job_id', 'line'], unique=True)
+    op.create_index('ix_batch_items_claim', 'batch_items', ['provider', 'status', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_batch_items_claim', table_name='batch_items')
+    op.drop_index('ix_batch_items_job_line', table_name='batch_items')
+    op.drop_table('batch_items')
+    op.drop_index(op.f('ix_batch_jobs_status'), table_name='batch_jobs')
+    op.drop_index(op.f('ix_batch_jobs_api_key_id'), table_name='batch_jobs')
+    op.drop_index(op.f('ix_batch_jobs_id'), table_name='batch_jobs')
+    op.drop_table('batch_jobs')
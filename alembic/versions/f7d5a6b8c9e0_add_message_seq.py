@@ -0,0 +1,56 @@
+"""add_message_seq
+
+Revision ID: f7d5a6b8c9e0
+Revises: e6c4f5a7b8d9
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7d5a6b8c9e0'
+down_revision: Union[str, None] = 'e6c4f5a7b8d9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('messages', sa.Column('seq', sa.Integer(), nullable=True, comment='对话内序号（从 1 开始单调递增）'))
+    op.add_column(
+        'conversations',
+        sa.Column('last_seq', sa.Integer(), server_default='0', nullable=False, comment='最后一条消息的序号（分配消息序号用）'),
+    )
+
+    # 已有消息按原来的顺序（created_at, id）编号
+    op.execute(
+        """
+        UPDATE messages AS m SET seq = numbered.seq
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY conversation_id ORDER BY created_at, id) AS seq
+            FROM messages
+        ) AS numbered
+        WHERE m.id = numbered.id
+        """
+    )
+    op.execute(
+        """
+        UPDATE conversations AS c SET last_seq = counted.last_seq
+        FROM (SELECT conversation_id, MAX(seq) AS last_seq FROM messages GROUP BY conversation_id) AS counted
+        WHERE c.id = counted.conversation_id
+        """
+    )
+    op.alter_column('messages', 'seq', nullable=False)
+
+    # (conversation_id, seq) 复合索引取代单列 conversation_id 索引
+    op.create_index('ix_messages_conversation_seq', 'messages', ['conversation_id', 'seq'], unique=True)
+    op.drop_index(op.f('ix_messages_conversation_id'), table_name='messages')
+
+
+def downgrade() -> None:
+    op.create_index(op.f('ix_messages_conversation_id'), 'messages', ['conversation_id'], unique=False)
+    op.drop_index('ix_messages_conversation_seq', table_name='messages')
+    op.drop_column('conversations', 'last_seq')
+    op.drop_column('messages', 'seq')
@@ -5,8 +5,8 @@
 """
 
 import httpx
-from app.adapters.base import BaseLLMAdapter, ChatRequest, ChatResponse, ModelRequestError, StreamChunk
-from app.core.config import settings
+from app.adapters.base import BaseLLMAdapter, ChatRequest, ChatResponse, ModelRequestError, StreamChunk, normalize_usage
+from app.adapters.sse import iter_stream_chunks
 from app.core.enums import ModelProvider
 import logging
 from collections.abc import AsyncIterator
@@ -22,14 +22,6 @@ class AliyunAsapter(BaseLLMAdapter):
         self.base_url = base_url or 'https://dashscope.aliyuncs.com/compatible-mode/v1'
         self.provider = ModelProvider.ALIYUNCS
 
-    async def _get_client(self) -> httpx.AsyncClient:
-        """获取 HTTP 客户端"""
-        return httpx.AsyncClient(
-            base_url=self.base_url,
-            headers={'Authorization': f'Bearer {self.api_key}', 'Content-Type': 'application/json'},
-            timeout=settings.CONNECT_TIMEOUT,
-        )
-
     def _build_payload(self, request: ChatRequest, is_stream: bool = False, is_enable_thinking: bool = False) -> dict:
         """构建请求 payload"""
         return {
@@ -50,34 +42,50 @@ class AliyunAsapter(BaseLLMAdapter):
         await self.validate_request(request)
         try:
             payload = self._build_payload(request, is_stream=False, is_enable_thinking=False)
-            async with await self._get_client() as client:
-                response = await client.post('/chat/completions', json=payload)
-                response.raise_for_status()
-                data = response.json()
+            client = self._get_client()
+            response = await client.post('/chat/completions', json=payload)
+            response.raise_for_status()
+            data = response.json()
             return ChatResponse(
                 id=data['id'],
                 model=data['model'],
                 content=data['choices'][0]['message']['content'],
                 finish_reason=data['choices'][0]['finish_reason'],
-                usage={
-                    'prompt_tokens': data['usage'].get('prompt_tokens', 0),
-                    'completion_tokens': data['usage'].get('completion_tokens', 0),
-                    'total_tokens': data['usage'].get('total_tokens', 0),
-                },
+                usage=normalize_usage(data.get('usage')),
                 provider=self.provider,
             )
         except httpx.HTTPStatusError as e:
             log.error(f'aliyuncs API error: {e.response.status_code} - {e.response.text}')
-            raise ModelRequestError(f'aliyuncs API error: {e.response.text}')
+            raise ModelRequestError(f'aliyuncs API error: {e.response.text}', status_code=e.response.status_code)
 
         except Exception as e:
             log.error(f'Unexpected aliyuncs error: {str(e)}')
-            raise ModelRequestError(str(e))
+            raise ModelRequestError(str(e)) from e
 
     async def chat_stream(self, request: ChatRequest) -> AsyncIterator[StreamChunk]:
-        """流式聊天"""
-        raise NotImplementedError("Aliyun stream not implemented")
-        yield StreamChunk(content="", finish_reason="")
+        """
+        流式聊天（compatible-mode /chat/completions）
+        开启 enable_thinking 时，思考过程通过 StreamChunk.reasoning_content 单独推送
+        """
+        await self.validate_request(request)
+        payload = self._stream_options(
+            self._build_payload(request, is_stream=True, is_enable_thinking=bool(request.enable_thinking))
+        )
+
+        try:
+            client = self._get_client()
+            async with client.stream('POST', '/chat/completions', json=payload) as response:
+                await self._raise_for_status(response)
+
+                async for chunk in iter_stream_chunks(response.aiter_bytes()):
+                    yield chunk
+
+        except httpx.HTTPStatusError as e:
+            log.error(f'aliyuncs streaming error: {e.response.status_code} - {e.response.text}')
+            raise ModelRequestError(f'aliyuncs streaming error: {e.response.text}', status_code=e.response.status_code)
+        except Exception as e:
+            log.error(f'Unexpected aliyuncs streaming error: {str(e)}')
+            raise
 
     async def get_available_models(self) -> list[str]:
         """获取可用模型列表（同步方法）"""
@@ -164,7 +172,3 @@ class AliyunAsapter(BaseLLMAdapter):
             'qwen1.5-0.5b-chat',
             'codeqwen1.5-7b-chat',
         ]
-
-    def calculate_cost(self, usage: dict[str, int], model: str) -> float:
-        """计算成本"""
-        return 0.0
@@ -5,13 +5,20 @@
 @Desc    : 适配器基类（适配器层独立使用）
 """
 
+import httpx
+import logging
 from abc import ABC, abstractmethod
+from app.adapters.concurrency import AdaptiveLimiter
+from app.adapters.http_client import build_http_client
 from app.core.config import settings
 from app.core.enums import ModelProvider
+from app.core.model_catalog import model_catalog
 from collections.abc import AsyncIterator
 from pydantic import BaseModel
 from typing import Union, List, Dict, Any
 
+log = logging.getLogger('app')
+
 # ==================== 适配器层的数据模型 ====================
 
 
@@ -34,6 +41,7 @@ class ChatRequest(BaseModel):
     top_p: float = 1.0
     frequency_penalty: float = 0.0
     presence_penalty: float = 0.0
+    enable_thinking: bool | None = None  # 深度思考开关（阿里云 Qwen3 等支持）
 
 
 class ChatResponse(BaseModel):
@@ -47,11 +55,43 @@ class ChatResponse(BaseModel):
     provider: ModelProvider  # ← 枚举
 
 
+class RawChatRequest(BaseModel):
+    """OpenAI 协议的原始请求体（透传接口使用，字段不做转换）"""
+
+    model: str
+    body: dict[str, Any]
+
+    def for_model(self, model: str) -> dict[str, Any]:
+        """替换为实际路由的模型名后的请求体"""
+        return {**self.body, 'model': model}
+
+
 class StreamChunk(BaseModel):
     """流式响应块"""
 
     content: str
     finish_reason: str | None = None
+    reasoning_content: str | None = None  # 思考过程（与回答内容分开推送）
+    usage: dict[str, int] | None = None  # 上游返回 usage 时携带（通常是最后一个块）
+
+
+def normalize_usage(raw: dict | None) -> dict[str, int]:
+    """
+    只保留 prompt_tokens / completion_tokens / total_tokens 三个字段，
+    上游返回缓存命中数时附带 cached_tokens（OpenAI 的 prompt_tokens_details 或 DeepSeek 的 prompt_cache_hit_tokens）
+    """
+    raw = raw or {}
+    prompt_tokens = int(raw.get('prompt_tokens') or 0)
+    completion_tokens = int(raw.get('completion_tokens') or 0)
+    usage = {
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'total_tokens': int(raw.get('total_tokens') or prompt_tokens + completion_tokens),
+    }
+    cached_tokens = (raw.get('prompt_tokens_details') or {}).get('cached_tokens') or raw.get('prompt_cache_hit_tokens')
+    if cached_tokens:
+        usage['cached_tokens'] = int(cached_tokens)
+    return usage
 
 
 def inject_system_prompt(messages: list[ChatMessage]) -> list[ChatMessage]:
@@ -69,10 +109,51 @@ class BaseLLMAdapter(ABC):
     所有模型适配器都必须继承此类
     """
 
+    # 流式请求是否附带 stream_options.include_usage（上游支持时才开启）
+    STREAM_INCLUDE_USAGE: bool = True
+    # 上游是否兼容 OpenAI 协议（/chat/completions），兼容时 /v1 接口直接透传请求体与 SSE 字节
+    OPENAI_COMPATIBLE: bool = True
+
     def __init__(self, api_key: str, base_url: str | None = None):
         self.api_key = api_key
         self.base_url = base_url
         self.provider: ModelProvider = ModelProvider.OPENAI
+        self._client: httpx.AsyncClient | None = None
+        # 按实例（即按供应商凭据）限制并发
+        self.limiter = AdaptiveLimiter()
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """获取长连接 HTTP 客户端（按需创建，实例内复用）"""
+        if self._client is None or self._client.is_closed:
+            self._client = build_http_client(
+                self.base_url,
+                {'Authorization': f'Bearer {self.api_key}', 'Content-Type': 'application/json'},
+                event_hooks={'response': [self.limiter.on_response]},
+            )
+        return self._client
+
+    def _stream_options(self, payload: dict) -> dict:
+        """为流式请求补充 stream_options，让上游在最后一个块返回 usage"""
+        if self.STREAM_INCLUDE_USAGE:
+            payload['stream_options'] = {'include_usage': True}
+        return payload
+
+    @staticmethod
+    async def _raise_for_status(response: httpx.Response) -> None:
+        """流式响应出错时先读取响应体，保证异常里能拿到上游的错误信息"""
+        if response.is_error:
+            await response.aread()
+        response.raise_for_status()
+
+    async def open(self) -> None:
+        """预先建立连接池（应用启动时调用）"""
+        self._get_client()
+
+    async def close(self) -> None:
+        """关闭连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
     @abstractmethod
     async def chat(self, request: ChatRequest) -> ChatResponse:
@@ -84,15 +165,32 @@ class BaseLLMAdapter(ABC):
         """流式聊天"""
         pass
 
+    async def chat_raw(self, payload: dict) -> httpx.Response:
+        """透传非流式请求，返回已读完的上游响应（响应体不做解析）"""
+        response = await self._get_client().post('/chat/completions', json=payload)
+        response.raise_for_status()
+        return response
+
+    async def chat_stream_raw(self, payload: dict) -> AsyncIterator[bytes]:
+        """透传流式请求，原样产出上游的 SSE 字节"""
+        async with self._get_client().stream('POST', '/chat/completions', json=payload) as response:
+            await self._raise_for_status(response)
+            # aiter_bytes 只解开 Content-Encoding，不做任何 SSE 解析
+            async for raw in response.aiter_bytes():
+                yield raw
+
     @abstractmethod
     async def get_available_models(self) -> list[str]:
         """获取可用模型列表（同步方法）"""
         pass
 
-    @abstractmethod
     def calculate_cost(self, usage: dict[str, int], model: str) -> float:
-        """计算成本"""
-        pass
+        """按模型目录计算成本，未收录的模型返回 0"""
+        spec = model_catalog.lookup(self.provider, model)
+        if spec is None:
+            log.warning(f'No pricing info for model: {self.provider.value}:{model}')
+            return 0.0
+        return spec.cost(usage)
 
     async def validate_request(self, request: ChatRequest) -> None:
         """验证请求参数"""
@@ -117,6 +215,31 @@ class ModelFetchError(Exception):
 
 
 class ModelRequestError(Exception):
-    """自定义模型请求错误"""
+    """自定义模型请求错误（status_code 为上游 HTTP 状态码，网络错误时为 None）"""
 
-    pass
+    def __init__(self, message: str = '', status_code: int | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# 可重试的上游状态码：限流、超时与服务端错误
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 425, 429, 500, 502, 503, 504})
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """
+    判断上游错误是否可重试 / 可故障转移
+    沿异常链（raise ... from e）查找网络错误或可重试的 HTTP 状态码
+    """
+    seen = 0
+    while exc is not None and seen < 5:
+        if isinstance(exc, (httpx.TimeoutException, httpx.TransportError, TimeoutError)):
+            return True
+        if isinstance(exc, httpx.HTTPStatusError):
+            return exc.response.status_code in RETRYABLE_STATUS_CODES
+        status_code = getattr(exc, 'status_code', None)
+        if status_code is not None:
+            return status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+        exc = exc.__cause__
+        seen += 1
+    return False
@@ -0,0 +1,149 @@
+"""
+@File    : circuit_breaker.py
+@Author  : Martin
+@Desc    : 适配器熔断器：按滑动窗口内的错误率与慢调用率在 closed / open / half_open 间切换
+"""
+
+import time
+from collections import deque
+from enum import Enum
+from app.core.config import settings
+
+
+class CircuitState(str, Enum):
+    """熔断器状态"""
+
+    CLOSED = 'closed'  # 正常放行
+    OPEN = 'open'  # 熔断中，直接拒绝
+    HALF_OPEN = 'half_open'  # 冷却结束，放行少量探测请求
+
+
+class CircuitBreaker:
+    """
+    单个适配器实例的熔断器
+    只统计上游故障（网络错误、超时、429/5xx），4xx 等请求错误视为上游正常
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window_seconds: float | None = None,
+        min_requests: int | None = None,
+        failure_rate: float | None = None,
+        slow_call_seconds: float | None = None,
+        slow_call_rate: float | None = None,
+        open_seconds: float | None = None,
+        half_open_probes: int | None = None,
+    ):
+        self.name = name
+        self.enabled = settings.CIRCUIT_BREAKER_ENABLED
+        self.window_seconds = window_seconds or settings.CIRCUIT_WINDOW_SECONDS
+        self.min_requests = min_requests or settings.CIRCUIT_MIN_REQUESTS
+        self.failure_rate = failure_rate or settings.CIRCUIT_FAILURE_RATE
+        self.slow_call_seconds = slow_call_seconds or settings.CIRCUIT_SLOW_CALL_SECONDS
+        self.slow_call_rate = slow_call_rate or settings.CIRCUIT_SLOW_CALL_RATE
+        self.open_seconds = open_seconds or settings.CIRCUIT_OPEN_SECONDS
+        self.half_open_probes = half_open_probes or settings.CIRCUIT_HALF_OPEN_PROBES
+
+        self.state = CircuitState.CLOSED
+        self._calls: deque[tuple[float, bool, bool]] = deque()  # (时间, 是否失败, 是否慢调用)
+        self._failures = 0
+        self._slow = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self.trips = 0
+
+    def _trim(self, now: float) -> None:
+        cutoff = now - self.window_seconds
+        while self._calls and self._calls[0][0] < cutoff:
+            _, failed, slow = self._calls.popleft()
+            self._failures -= failed
+            self._slow -= slow
+
+    def _reset_window(self) -> None:
+        self._calls.clear()
+        self._failures = 0
+        self._slow = 0
+
+    def _trip(self, now: float) -> None:
+        self.state = CircuitState.OPEN
+        self._opened_at = now
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self.trips += 1
+        self._reset_window()
+
+    def allow(self) -> bool:
+        """是否放行一次请求；半开状态下占用一个探测名额"""
+        if self.state is CircuitState.OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                return False
+            self.state = CircuitState.HALF_OPEN
+        if self.state is CircuitState.HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_probes:
+                return False
+            self._probes_in_flight += 1
+        return True
+
+    def release(self) -> None:
+        """请求被取消（未得出结果）时归还探测名额"""
+        if self.state is CircuitState.HALF_OPEN and self._probes_in_flight:
+            self._probes_in_flight -= 1
+
+    def record(self, failed: bool, latency: float | None = None) -> None:
+        """记录一次调用结果"""
+        now = time.monotonic()
+        slow = not failed and latency is not None and latency >= self.slow_call_seconds
+
+        if self.state is CircuitState.HALF_OPEN:
+            self.release()
+            if failed or slow:
+                self._trip(now)
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_probes:
+                self.state = CircuitState.CLOSED
+                self._reset_window()
+            return
+        if self.state is CircuitState.OPEN:
+            # 熔断前已发出的请求，结果不再计入
+            return
+
+        self._calls.append((now, failed, slow))
+        self._failures += failed
+        self._slow += slow
+        self._trim(now)
+
+        total = len(self._calls)
+        if self.enabled and total >= self.min_requests and (
+            self._failures / total >= self.failure_rate or self._slow / total >= self.slow_call_rate
+        ):
+            self._trip(now)
+
+    @property
+    def score(self) -> float:
+        """健康分：窗口内正常且不慢的调用占比，无样本时为 1"""
+        if self.state is CircuitState.OPEN:
+            return 0.0
+        total = len(self._calls)
+        if not total:
+            return 1.0
+        return round((total - self._failures - self._slow) / total, 3)
+
+    def snapshot(self) -> dict:
+        """当前状态，用于 /health 展示"""
+        now = time.monotonic()
+        self._trim(now)
+        total = len(self._calls)
+        retry_in = max(0.0, self.open_seconds - (now - self._opened_at)) if self.state is CircuitState.OPEN else 0.0
+        return {
+            'name': self.name,
+            'state': self.state.value,
+            'score': self.score,
+            'requests': total,
+            'failure_rate': round(self._failures / total, 3) if total else 0.0,
+            'slow_call_rate': round(self._slow / total, 3) if total else 0.0,
+            'trips': self.trips,
+            'retry_in': round(retry_in, 1),
+        }
@@ -0,0 +1,186 @@
+"""
+@File    : concurrency.py
+@Author  : Martin
+@Desc    : 自适应并发限制（AIMD）：按 429、延迟与限流响应头调整每个供应商凭据的并发上限
+"""
+
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+import httpx
+from app.core.config import settings
+
+log = logging.getLogger('app')
+
+# OpenAI 风格的重置时间，例如 "1s"、"6m0s"、"20ms"
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+class ConcurrencyLimitError(Exception):
+    """排队超时或队列已满；按 429 处理，可触发故障转移"""
+
+    status_code = 429
+
+    def __init__(self, message: str = '', retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """解析 Retry-After（秒数或 HTTP 日期）"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_duration(value: str | None) -> float | None:
+    """解析 x-ratelimit-reset-* 中的时长；纯数字按秒处理"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        parts = _DURATION_PART.findall(value)
+        return sum(float(num) * _DURATION_UNITS[unit] for num, unit in parts) if parts else None
+
+
+class AdaptiveLimiter:
+    """
+    单个供应商凭据的自适应并发限制器
+    成功且延迟正常时加性增长（每轮约 +1），遇到 429 或延迟明显升高时乘性下降；
+    超出上限的请求在有界队列中等待，而不是发到上游再失败
+    """
+
+    def __init__(self):
+        self.limit = float(settings.PROVIDER_CONCURRENCY_INITIAL)
+        self.min_limit = settings.PROVIDER_CONCURRENCY_MIN
+        self.max_limit = settings.PROVIDER_CONCURRENCY_MAX
+        self.inflight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._baseline: float | None = None  # 延迟基线（慢速 EWMA）
+        self.throttled = 0  # 观测到的 429 次数
+        self.rejected = 0  # 排队失败次数
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _has_capacity(self) -> bool:
+        return self.inflight < int(self.limit) and time.monotonic() >= self._paused_until
+
+    async def acquire(self) -> None:
+        """获取一个并发名额，必要时排队等待"""
+        timeout = settings.PROVIDER_QUEUE_TIMEOUT
+        pause = self._paused_until - time.monotonic()
+        if pause > timeout:
+            self.rejected += 1
+            raise ConcurrencyLimitError('Upstream asked to retry later', retry_after=pause)
+
+        if not self._waiters and self._has_capacity():
+            self.inflight += 1
+            return
+        if len(self._waiters) >= settings.PROVIDER_QUEUE_SIZE:
+            self.rejected += 1
+            raise ConcurrencyLimitError('Provider concurrency queue is full')
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        if pause > 0:
+            # 等上游要求的暂停结束后再尝试放行
+            asyncio.get_running_loop().call_later(pause, self._wake)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # 已分到名额但调用方放弃，归还
+                self.release()
+            else:
+                waiter.cancel()
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, TimeoutError):
+                self.rejected += 1
+                raise ConcurrencyLimitError('Timed out waiting for provider concurrency') from e
+            raise
+
+    def release(self) -> None:
+        """归还名额"""
+        self.inflight = max(0, self.inflight - 1)
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self._has_capacity():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.inflight += 1
+                waiter.set_result(None)
+
+    def _decrease(self, factor: float) -> None:
+        """乘性下降；同一轮内的多次信号只下降一次"""
+        now = time.monotonic()
+        if now - self._last_decrease < (self._baseline or 1.0):
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_limit), self.limit * factor)
+        log.info(f'Concurrency limit decreased to {int(self.limit)}')
+
+    def observe_latency(self, seconds: float) -> None:
+        """记录一次成功调用的延迟（非流式为整体耗时，流式为首字耗时）"""
+        if self._baseline is None:
+            self._baseline = seconds
+        if seconds > self._baseline * settings.PROVIDER_LATENCY_TOLERANCE:
+            self._decrease(settings.PROVIDER_LATENCY_BACKOFF)
+        else:
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self._wake()
+        self._baseline += (seconds - self._baseline) * 0.05
+
+    def _pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def on_response(self, response: httpx.Response) -> None:
+        """httpx 响应钩子：读取 429、Retry-After 与 x-ratelimit-* 头"""
+        headers = response.headers
+        if response.status_code == 429:
+            self.throttled += 1
+            self._decrease(settings.PROVIDER_THROTTLE_BACKOFF)
+            retry_after = parse_retry_after(headers.get('retry-after'))
+            if retry_after:
+                self._pause(retry_after)
+
+        for kind in ('requests', 'tokens'):
+            remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+            if remaining is None or not remaining.strip().isdigit() or int(remaining) > 0:
+                continue
+            # 配额已用尽：不再扩张，并暂停到配额重置
+            self.limit = max(float(self.min_limit), min(self.limit, float(self.inflight)))
+            reset = parse_duration(headers.get(f'x-ratelimit-reset-{kind}'))
+            if reset:
+                self._pause(reset)
+
+    def snapshot(self) -> dict:
+        """当前限流状态，用于 /health 展示"""
+        return {
+            'limit': int(self.limit),
+            'inflight': self.inflight,
+            'queue_depth': self.queue_depth,
+            'paused_for': round(max(0.0, self._paused_until - time.monotonic()), 1),
+            'throttled': self.throttled,
+            'rejected': self.rejected,
+        }
@@ -6,9 +6,8 @@
 """
 
 import httpx
-import json
-from app.adapters.base import BaseLLMAdapter, ChatRequest, ChatResponse, ModelProvider, ModelRequestError, StreamChunk
-from app.core.config import settings
+from app.adapters.base import BaseLLMAdapter, ChatRequest, ChatResponse, ModelProvider, ModelRequestError, StreamChunk, normalize_usage
+from app.adapters.sse import iter_stream_chunks
 import logging
 from collections.abc import AsyncIterator
 
@@ -23,14 +22,6 @@ class DeepSeekerAdapter(BaseLLMAdapter):
         self.base_url = base_url or 'https://api.deepseek.com'
         self.provider = ModelProvider.DEEPSEEK
 
-    async def _get_client(self) -> httpx.AsyncClient:
-        """获取 HTTP 客户端"""
-        return httpx.AsyncClient(
-            base_url=self.base_url,
-            headers={'Authorization': f'Bearer {self.api_key}', 'Content-Type': 'application/json'},
-            timeout=settings.CONNECT_TIMEOUT,
-        )
-
     def _build_payload(self, request: ChatRequest, is_stream: bool = False) -> dict:
         """构建请求 payload"""
         return {
@@ -53,80 +44,43 @@ class DeepSeekerAdapter(BaseLLMAdapter):
         payload = self._build_payload(request, is_stream=False)
 
         try:
-            async with await self._get_client() as client:
-                response = await client.post('/chat/completions', json=payload)
-                response.raise_for_status()
-                data = response.json()
+            client = self._get_client()
+            response = await client.post('/chat/completions', json=payload)
+            response.raise_for_status()
+            data = response.json()
 
             choice = data['choices'][0]
             message = choice['message']
             # print('deepseek', data)
-            # 兼容适配器：usage = {prompt_tokens, completion_tokens, total_tokens}
-            raw_usage = data.get('usage', {})
-            filtered_usage = {
-                'prompt_tokens': raw_usage.get('prompt_tokens', 0),
-                'completion_tokens': raw_usage.get('completion_tokens', 0),
-                'total_tokens': raw_usage.get('total_tokens', 0),
-            }
             return ChatResponse(
                 id=data.get('id', ''),
                 model=data.get('model', request.model),
                 content=message.get('content', ''),
                 finish_reason=choice.get('finish_reason', ''),
-                usage=filtered_usage,
+                usage=normalize_usage(data.get('usage')),
                 provider=self.provider,
             )
 
         except httpx.HTTPStatusError as e:
             log.error(f'DeepSeek API error: {e.response.status_code} - {e.response.text}')
-            raise Exception(f'DeepSeek API error: {e.response.text}')
+            raise ModelRequestError(f'DeepSeek API error: {e.response.text}', status_code=e.response.status_code)
         except Exception as e:
             log.error(f'Unexpected DeepSeek error: {str(e)}')
-            raise ModelRequestError(str(e))
+            raise ModelRequestError(str(e)) from e
 
     async def chat_stream(self, request: ChatRequest) -> AsyncIterator[StreamChunk]:
         """流式回答"""
         await self.validate_request(request)
 
-        payload = self._build_payload(request, is_stream=True)
+        payload = self._stream_options(self._build_payload(request, is_stream=True))
 
         try:
-            async with await self._get_client() as client:
-                async with client.stream('POST', '/chat/completions', json=payload) as response:
-                    response.raise_for_status()
-
-                    # 按行读取 SSE 流
-                    async for line in response.aiter_lines():
-                        line = line.strip()
-
-                        # 跳过空行和注释
-                        if not line or line.startswith(':'):
-                            continue
-
-                        # 解析 "data: " 前缀
-                        if line.startswith('data: '):
-                            data = line[6:]  # 去掉 "data: " 前缀
-
-                            # 流结束标志
-                            if data == '[DONE]':
-                                break
-
-                            try:
-                                chunk = json.loads(data)
-                                delta = chunk['choices'][0].get('delta', {})
+            client = self._get_client()
+            async with client.stream('POST', '/chat/completions', json=payload) as response:
+                await self._raise_for_status(response)
 
-                                if 'content' in delta:
-                                    yield StreamChunk(
-                                        content=delta['content'], finish_reason=chunk['choices'][0].get('finish_reason')
-                                    )
-
-                                # 最后一个 chunk 可能包含 usage
-                                if 'usage' in chunk:
-                                    # 可以选择性地处理 usage
-                                    pass
-
-                            except json.JSONDecodeError:
-                                continue
+                async for chunk in iter_stream_chunks(response.aiter_bytes()):
+                    yield chunk
 
         except httpx.HTTPStatusError as e:
             log.error(f'DeepSeek API error: {e.response.status_code} - {e.response.text}')
@@ -139,19 +93,9 @@ class DeepSeekerAdapter(BaseLLMAdapter):
         """
         获取可用模型列表
         """
-        async with await self._get_client() as client:
-            res = await client.get('/models')
-            res.raise_for_status()
-            data = res.json()
+        client = self._get_client()
+        res = await client.get('/models')
+        res.raise_for_status()
+        data = res.json()
 
         return [id['id'] for id in data['data']]
-
-    def calculate_cost(self, usage: dict[str, int], model: str) -> float:
-        """
-        计算成本
-        """
-        return float(0)
-
-    async def close(self):
-        """关闭客户端"""
-        pass
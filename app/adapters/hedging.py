@@ -0,0 +1,88 @@
+"""
+@File    : hedging.py
+@Author  : Martin
+@Desc    : 对冲请求（hedged requests）：延迟统计、对冲策略、预算与计数
+"""
+
+import time
+from collections import deque
+from pydantic import BaseModel, Field
+
+# 统计分位数所需的最少样本数，样本不足时使用策略中的固定延迟
+MIN_LATENCY_SAMPLES = 20
+
+
+class HedgePolicy(BaseModel):
+    """单个模型别名的对冲策略"""
+
+    secondary: str = Field(..., description='对冲目标，格式 provider:model')
+    delay_ms: float | None = Field(default=None, description='固定对冲延迟；为空时使用观测到的分位数延迟')
+    percentile: float = Field(default=0.95, gt=0, lt=1, description='自适应延迟使用的分位数')
+    fallback_delay_ms: float = Field(default=2000, description='样本不足时的对冲延迟')
+    min_delay_ms: float = Field(default=50, description='对冲延迟下限')
+    max_extra_ratio: float = Field(default=0.1, ge=0, le=1, description='对冲请求占总请求的最大比例')
+
+
+class LatencyTracker:
+    """按 (provider, model, kind) 记录最近的延迟样本，kind 为 total（整体耗时）或 ttft（首字耗时）"""
+
+    def __init__(self, window: int = 200):
+        self._window = window
+        self._samples: dict[tuple[str, str, str], deque[float]] = {}
+
+    def record(self, provider: str, model: str, kind: str, seconds: float) -> None:
+        key = (provider, model, kind)
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self._window)
+        samples.append(seconds)
+
+    def percentile(self, provider: str, model: str, kind: str, q: float) -> float | None:
+        samples = self._samples.get((provider, model, kind))
+        if not samples or len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class HedgeBudget:
+    """
+    对冲预算：在滑动时间窗口内，对冲请求数不超过总请求数的 max_extra_ratio
+    """
+
+    def __init__(self, window_seconds: float = 60.0):
+        self._window = window_seconds
+        self._requests: deque[float] = deque()
+        self._hedges: deque[float] = deque()
+
+    def _trim(self, now: float) -> None:
+        cutoff = now - self._window
+        while self._requests and self._requests[0] < cutoff:
+            self._requests.popleft()
+        while self._hedges and self._hedges[0] < cutoff:
+            self._hedges.popleft()
+
+    def record_request(self) -> None:
+        self._requests.append(time.monotonic())
+
+    def try_acquire(self, max_extra_ratio: float) -> bool:
+        now = time.monotonic()
+        self._trim(now)
+        if len(self._hedges) + 1 > max_extra_ratio * len(self._requests):
+            return False
+        self._hedges.append(now)
+        return True
+
+
+class HedgeStats(BaseModel):
+    """对冲计数"""
+
+    fired: int = 0  # 发出的对冲请求数
+    wins: int = 0  # 对冲请求先返回
+    losses: int = 0  # 主请求在对冲后仍先返回
+    budget_denied: int = 0  # 因预算不足未发出对冲
+
+
+def parse_hedge_policies(raw: dict[str, dict]) -> dict[str, HedgePolicy]:
+    """解析配置中的对冲策略"""
+    return {alias: HedgePolicy.model_validate(policy) for alias, policy in raw.items()}
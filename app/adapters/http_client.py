@@ -0,0 +1,32 @@
+"""
+@File    : http_client.py
+@Author  : Martin
+@Desc    : 适配器共享的 HTTP 连接池客户端
+"""
+
+import httpx
+import importlib.util
+from app.core.config import settings
+
+# HTTP/2 依赖 h2 包（项目依赖 httpx[http2]），环境中缺少时自动回退到 HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+
+def build_http_client(base_url: str, headers: dict[str, str], event_hooks: dict | None = None) -> httpx.AsyncClient:
+    """
+    创建长连接 HTTP 客户端
+    每个适配器实例持有一个，连接在请求之间复用，避免重复 TCP/TLS 握手
+    """
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers=headers,
+        timeout=settings.CONNECT_TIMEOUT,
+        limits=limits,
+        http2=settings.HTTP2_ENABLED and HTTP2_AVAILABLE,
+        event_hooks=event_hooks,
+    )
@@ -5,18 +5,82 @@
 @Desc    :
 """
 
+import asyncio
+import httpx
+import time
 from app.adapters.ai_openai import OpenAIAdapter
 from app.adapters.aliyuncs import AliyunAsapter
-from app.adapters.base import BaseLLMAdapter, ChatRequest, ModelProvider
+from app.adapters.base import (
+    BaseLLMAdapter,
+    ChatRequest,
+    ChatResponse,
+    ModelProvider,
+    ModelRequestError,
+    RawChatRequest,
+    StreamChunk,
+    is_retryable_error,
+)
+from app.adapters.circuit_breaker import CircuitBreaker
 from app.adapters.deepseek import DeepSeekerAdapter
+from app.adapters.retry import retry_delay
+from app.adapters.hedging import HedgeBudget, HedgePolicy, HedgeStats, LatencyTracker, parse_hedge_policies
 from app.adapters.siliconflow import SiliconFlowAdapter
 from app.adapters.doubao import DoubaoAdapter
 from app.core.config import settings
 import logging
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
 
 log = logging.getLogger("app")
 
 
+@dataclass
+class ChatRoute:
+    """一次请求实际使用的路由（故障转移链中的某一跳）"""
+
+    provider: ModelProvider
+    model: str
+    adapter: BaseLLMAdapter
+    hop: int = 0  # 0 表示主路由，>0 表示故障转移后的第几跳
+    attempts: int = 1  # 本次请求向上游发起的尝试次数（含重试与故障转移）
+
+
+class PrefetchedStream:
+    """
+    已预取第一个块的流
+    关闭时关闭底层流并执行回调；即使从未被迭代（如对冲中落败的流）也能正确释放
+    """
+
+    def __init__(self, first: StreamChunk, stream: AsyncIterator[StreamChunk], on_close=None):
+        self._first: StreamChunk | None = first
+        self._stream = stream
+        self._on_close = on_close
+        self._closed = False
+
+    def __aiter__(self) -> 'PrefetchedStream':
+        return self
+
+    async def __anext__(self) -> StreamChunk:
+        if self._first is not None:
+            chunk, self._first = self._first, None
+            return chunk
+        try:
+            return await anext(self._stream)
+        except BaseException:
+            await self.aclose()
+            raise
+
+    async def aclose(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._on_close is not None:
+                self._on_close()
+
+
 class ModelRegistry:
     """
     模型注册中心
@@ -26,6 +90,12 @@ class ModelRegistry:
     def __init__(self):
         self._adapters: dict[ModelProvider, type[BaseLLMAdapter]] = {}
         self._instances: dict[str, BaseLLMAdapter] = {}
+        self._breakers: dict[BaseLLMAdapter, CircuitBreaker] = {}
+        self._fallback_chains = self._parse_fallback_chains(settings.MODEL_FALLBACK_CHAINS)
+        self._hedge_policies = parse_hedge_policies(settings.HEDGE_POLICIES)
+        self._hedge_budget = HedgeBudget()
+        self._latency = LatencyTracker()
+        self.hedge_stats = HedgeStats()
         self._register_default_adapters()
 
     async def chat(self, request: ChatRequest):
@@ -113,16 +183,331 @@ class ModelRegistry:
 
         return api_key
 
+    @staticmethod
+    def parse_target(target: str) -> tuple[ModelProvider, str]:
+        """解析 "provider:model" 形式的路由目标（故障转移链、对冲策略与对话压缩的模型配置共用）"""
+        provider, _, model = target.partition(':')
+        return ModelProvider(provider.strip().lower()), model.strip()
+
+    @classmethod
+    def _parse_fallback_chains(cls, raw: dict[str, list[str]]) -> dict[str, list[tuple[ModelProvider, str]]]:
+        """解析故障转移配置"""
+        chains: dict[str, list[tuple[ModelProvider, str]]] = {}
+        for alias, hops in raw.items():
+            parsed = []
+            for hop in hops:
+                try:
+                    parsed.append(cls.parse_target(hop))
+                except ValueError:
+                    log.warning(f'Invalid fallback hop for {alias}: {hop}')
+            chains[alias] = parsed
+        return chains
+
+    def resolve_routes(self, provider: ModelProvider, model: str) -> list[ChatRoute]:
+        """
+        解析请求的路由链：主路由 + 配置的故障转移跳
+        未配置 API Key 的供应商会被跳过（主路由除外，保持原有报错）
+        """
+        routes = [ChatRoute(provider=provider, model=model, adapter=self.get_adapter(provider))]
+        for hop, (fallback_provider, fallback_model) in enumerate(self._fallback_chains.get(model, []), start=1):
+            try:
+                adapter = self.get_adapter(fallback_provider)
+            except ValueError:
+                continue
+            routes.append(ChatRoute(provider=fallback_provider, model=fallback_model, adapter=adapter, hop=hop))
+        return routes
+
+    def _breaker(self, route: ChatRoute) -> CircuitBreaker:
+        """获取路由所用适配器实例的熔断器"""
+        breaker = self._breakers.get(route.adapter)
+        if breaker is None:
+            breaker = self._breakers[route.adapter] = CircuitBreaker(route.provider.value)
+        return breaker
+
+    def circuit_states(self) -> list[dict]:
+        """所有适配器实例的熔断器状态"""
+        return [
+            {**breaker.snapshot(), 'base_url': getattr(adapter, 'base_url', None)}
+            for adapter, breaker in self._breakers.items()
+        ]
+
+    def concurrency_states(self) -> list[dict]:
+        """所有适配器实例的并发限制状态（当前上限、排队深度等）"""
+        return [
+            {'name': adapter.provider.value, 'base_url': adapter.base_url, **adapter.limiter.snapshot()}
+            for adapter in self._instances.values()
+        ]
+
+    def _hedge_target(self, route: ChatRoute) -> tuple[HedgePolicy, ChatRoute] | None:
+        """主路由配置了对冲策略时，返回策略与对冲目标"""
+        policy = self._hedge_policies.get(route.model) if route.hop == 0 else None
+        if policy is None:
+            return None
+        try:
+            provider, model = self.parse_target(policy.secondary)
+            adapter = self.get_adapter(provider)
+        except ValueError:
+            return None
+        return policy, ChatRoute(provider=provider, model=model, adapter=adapter, hop=route.hop)
+
+    def _hedge_delay(self, route: ChatRoute, policy: HedgePolicy, kind: str) -> float:
+        """对冲延迟：固定值，或该模型观测到的分位数延迟"""
+        if policy.delay_ms is not None:
+            return policy.delay_ms / 1000
+        observed = self._latency.percentile(route.provider.value, route.model, kind, policy.percentile)
+        delay = observed if observed is not None else policy.fallback_delay_ms / 1000
+        return max(delay, policy.min_delay_ms / 1000)
+
+    @staticmethod
+    def _remaining(deadline: float | None) -> float | None:
+        if deadline is None:
+            return None
+        return deadline - asyncio.get_running_loop().time()
+
+    def _deadline(self, routes: list[ChatRoute]) -> float | None:
+        """只有存在故障转移链时才施加整体截止时间"""
+        if len(routes) == 1:
+            return None
+        return asyncio.get_running_loop().time() + settings.FAILOVER_TOTAL_TIMEOUT
+
+    async def chat_with_failover(self, provider: ModelProvider, request: ChatRequest) -> tuple[ChatRoute, ChatResponse]:
+        """非流式调用，遇到可重试错误时沿故障转移链切换"""
+        return await self._failover(provider, request, self._chat_once, 'total')
+
+    async def open_stream(
+        self, provider: ModelProvider, request: ChatRequest
+    ) -> tuple[ChatRoute, AsyncIterator[StreamChunk]]:
+        """
+        打开流式调用：在拿到第一个块之前允许故障转移，
+        一旦第一个块已取得（即将发送给客户端），后续错误不再切换
+        """
+        # 流式按首字耗时（TTFT）统计延迟与对冲
+        return await self._failover(provider, request, self._open_once, 'ttft')
+
+    async def chat_raw_with_failover(
+        self, provider: ModelProvider, request: RawChatRequest
+    ) -> tuple[ChatRoute, httpx.Response]:
+        """透传的非流式调用（OpenAI 协议原始请求体），故障转移与重试同 chat_with_failover"""
+        return await self._failover(provider, request, self._chat_once, 'total')
+
+    async def open_raw_stream(
+        self, provider: ModelProvider, request: RawChatRequest
+    ) -> tuple[ChatRoute, AsyncIterator[bytes]]:
+        """透传的流式调用，产出上游原始 SSE 字节；首块之前可故障转移，同 open_stream"""
+        return await self._failover(provider, request, self._open_once, 'ttft')
+
+    async def _failover(self, provider: ModelProvider, request: ChatRequest, call, kind: str):
+        """
+        沿路由链依次尝试：同一路由遇到瞬时错误先退避重试，重试用尽或不宜重试时切换下一跳；
+        熔断中的路由直接跳过
+        """
+        routes = self.resolve_routes(provider, request.model)
+        deadline = self._deadline(routes)
+        retry_deadline = asyncio.get_running_loop().time() + settings.FAILOVER_TOTAL_TIMEOUT
+        last_error: Exception | None = None
+        attempts = 0
+        retries = 0
+
+        for route in routes:
+            while True:
+                remaining = self._remaining(deadline)
+                if remaining is not None and remaining <= 0:
+                    raise ModelRequestError(f'Failover deadline exceeded for model {request.model}', status_code=504)
+                if not self._breaker(route).allow():
+                    log.warning(f'Circuit open, skipping {route.provider.value}:{route.model} (hop {route.hop})')
+                    break
+                attempts += 1
+                try:
+                    async with asyncio.timeout(remaining):
+                        served, result = await self._dispatch(route, request, call, kind)
+                    served.attempts = attempts
+                    return served, result
+                except Exception as e:
+                    if not is_retryable_error(e):
+                        raise
+                    last_error = e
+                    delay = retry_delay(e, retries, self._remaining(retry_deadline))
+                    if delay is None:
+                        break
+                    retries += 1
+                    log.warning(f'Retrying {route.provider.value}:{route.model} in {delay:.2f}s (attempt {attempts}): {e}')
+                    await asyncio.sleep(delay)
+
+            if route is not routes[-1] and last_error is not None:
+                log.warning(f'Failover from {route.provider.value}:{route.model} (hop {route.hop}): {last_error}')
+
+        if last_error is not None:
+            raise last_error
+        raise ModelRequestError(f'Circuit open for model {request.model}', status_code=503)
+
+    async def _dispatch(self, route: ChatRoute, request: ChatRequest, call, kind: str):
+        """在单个路由上执行一次调用；配置了对冲策略时与对冲目标竞速"""
+        hedge = self._hedge_target(route)
+        if hedge:
+            policy, secondary = hedge
+            return await self._race(route, secondary, policy, request, call, kind)
+        return route, await call(route, request)
+
+    async def _acquire(self, route: ChatRoute) -> None:
+        """获取适配器并发名额；排队失败时归还熔断器的探测名额"""
+        try:
+            await route.adapter.limiter.acquire()
+        except BaseException:
+            self._breaker(route).release()
+            raise
+
+    @staticmethod
+    def _send(route: ChatRoute, request: ChatRequest | RawChatRequest):
+        """按请求类型调用适配器：原始请求体走透传接口，其余走转换后的接口"""
+        if isinstance(request, RawChatRequest):
+            return route.adapter.chat_raw(request.for_model(route.model))
+        return route.adapter.chat(request.model_copy(update={'model': route.model}))
+
+    @staticmethod
+    def _stream(route: ChatRoute, request: ChatRequest | RawChatRequest) -> AsyncIterator:
+        """按请求类型打开适配器的流，规则同 _send"""
+        if isinstance(request, RawChatRequest):
+            return route.adapter.chat_stream_raw(request.for_model(route.model))
+        return route.adapter.chat_stream(request.model_copy(update={'model': route.model}))
+
+    async def _chat_once(self, route: ChatRoute, request: ChatRequest) -> ChatResponse:
+        """在单个路由上执行一次非流式调用，并记录耗时与熔断统计"""
+        breaker = self._breaker(route)
+        limiter = route.adapter.limiter
+        await self._acquire(route)
+        start = time.monotonic()
+        try:
+            response = await self._send(route, request)
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception as e:
+            breaker.record(failed=is_retryable_error(e))
+            raise
+        finally:
+            limiter.release()
+        elapsed = time.monotonic() - start
+        breaker.record(failed=False, latency=elapsed)
+        limiter.observe_latency(elapsed)
+        self._latency.record(route.provider.value, route.model, 'total', elapsed)
+        return response
+
+    async def _open_once(self, route: ChatRoute, request: ChatRequest) -> AsyncIterator[StreamChunk]:
+        """
+        在单个路由上打开流并预取第一个块，记录首字耗时与熔断统计
+        并发名额在整个流结束（或被关闭）时才归还
+        """
+        breaker = self._breaker(route)
+        limiter = route.adapter.limiter
+        await self._acquire(route)
+        start = time.monotonic()
+        stream = self._stream(route, request)
+        try:
+            first = await anext(stream)
+        except StopAsyncIteration:
+            limiter.release()
+            breaker.record(failed=False)
+            return stream
+        except BaseException as e:
+            limiter.release()
+            await stream.aclose()
+            if isinstance(e, asyncio.CancelledError):
+                breaker.release()
+            else:
+                breaker.record(failed=is_retryable_error(e))
+            raise
+        elapsed = time.monotonic() - start
+        breaker.record(failed=False, latency=elapsed)
+        limiter.observe_latency(elapsed)
+        self._latency.record(route.provider.value, route.model, 'ttft', elapsed)
+        return PrefetchedStream(first, stream, on_close=limiter.release)
+
+    async def _race(
+        self, primary: ChatRoute, secondary: ChatRoute, policy: HedgePolicy, request: ChatRequest, call, kind: str
+    ):
+        """
+        对冲竞速：主请求超过对冲延迟仍未返回时，向对冲目标发出同样的请求，
+        先成功者胜出，另一方被取消（取消 task 即取消其 httpx 请求）
+        """
+        self._hedge_budget.record_request()
+        primary_task = asyncio.create_task(call(primary, request))
+        tasks = {primary_task: primary}
+        winner_task = None
+        try:
+            done, _ = await asyncio.wait({primary_task}, timeout=self._hedge_delay(primary, policy, kind))
+            if done or not self._acquire_hedge(secondary, policy):
+                winner_task = primary_task
+                return primary, await primary_task
+
+            self.hedge_stats.fired += 1
+            log.info(f'Hedging {primary.provider.value}:{primary.model} -> {secondary.provider.value}:{secondary.model}')
+            tasks[asyncio.create_task(call(secondary, request))] = secondary
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner_task = task
+                        if tasks[task] is secondary:
+                            self.hedge_stats.wins += 1
+                        else:
+                            self.hedge_stats.losses += 1
+                        return tasks[task], task.result()
+            # 两边都失败：抛出主请求的错误
+            raise primary_task.exception()
+        finally:
+            for task in tasks:
+                if task is not winner_task:
+                    if not task.done():
+                        task.cancel()
+                    task.add_done_callback(self._discard_loser)
+
+    def _acquire_hedge(self, secondary: ChatRoute, policy: HedgePolicy) -> bool:
+        """对冲目标未熔断且预算充足时才发出对冲"""
+        breaker = self._breaker(secondary)
+        if not breaker.allow():
+            return False
+        if not self._hedge_budget.try_acquire(policy.max_extra_ratio):
+            breaker.release()
+            self.hedge_stats.budget_denied += 1
+            return False
+        return True
+
+    @staticmethod
+    def _discard_loser(task: asyncio.Task) -> None:
+        """落败请求结束后的清理：已拿到首块的流需要关闭以释放连接"""
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        if hasattr(result, 'aclose'):
+            asyncio.create_task(result.aclose())
+
     def get_available_providers(self) -> list[ModelProvider]:
         """获取所有可用的供应商"""
         return list(self._adapters.keys())
 
+    async def open_all(self):
+        """
+        为所有已配置密钥的供应商创建适配器并建立连接池
+        在应用启动时调用，之后的请求复用同一个长连接客户端
+        """
+        for provider in self.get_available_providers():
+            try:
+                adapter = self.get_adapter(provider)
+            except ValueError:
+                # 未配置 API Key 的供应商跳过
+                continue
+            await adapter.open()
+            log.info(f'HTTP client pool opened: {provider}')
+
     async def close_all(self):
         """关闭所有适配器实例"""
         for instance in self._instances.values():
             if hasattr(instance, 'close'):
                 await instance.close()
         self._instances.clear()
+        self._breakers.clear()
 
 
 # 全局注册中心实例
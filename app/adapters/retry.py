@@ -0,0 +1,50 @@
+"""
+@File    : retry.py
+@Author  : Martin
+@Desc    : 上游调用的重试策略：指数退避 + 抖动，遵循 Retry-After
+"""
+
+import random
+import httpx
+from app.adapters.base import is_retryable_error
+from app.adapters.concurrency import ConcurrencyLimitError, parse_retry_after
+from app.core.config import settings
+
+
+def retry_after_of(exc: BaseException) -> float | None:
+    """沿异常链查找上游给出的 Retry-After（秒）"""
+    seen = 0
+    while exc is not None and seen < 5:
+        if isinstance(exc, ConcurrencyLimitError):
+            return exc.retry_after
+        if isinstance(exc, httpx.HTTPStatusError):
+            return parse_retry_after(exc.response.headers.get('retry-after'))
+        exc = exc.__cause__
+        seen += 1
+    return None
+
+
+def retry_delay(exc: BaseException, retries: int, time_left: float) -> float | None:
+    """
+    计算同一路由再次尝试前的等待时间，不应重试时返回 None（交给故障转移）
+    :param exc: 本次尝试的错误
+    :param retries: 本次请求已经用掉的重试次数
+    :param time_left: 距离整体截止时间的剩余秒数
+    """
+    if retries >= settings.RETRY_MAX_RETRIES or not is_retryable_error(exc):
+        return None
+    if isinstance(exc, ConcurrencyLimitError):
+        # 已在本地排过队，直接换下一跳
+        return None
+
+    retry_after = retry_after_of(exc)
+    if retry_after is not None and retry_after > settings.RETRY_MAX_DELAY:
+        return None
+
+    # full jitter：在 [0, min(上限, 基数 * 2^n)] 内均匀取值，避免重试同步
+    delay = random.uniform(0, min(settings.RETRY_MAX_DELAY, settings.RETRY_BASE_DELAY * 2**retries))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    if delay >= time_left:
+        return None
+    return delay
@@ -5,10 +5,9 @@
 """
 
 import httpx
-import json
-from app.adapters.base import BaseLLMAdapter, ChatRequest, ChatResponse, StreamChunk, ModelRequestError
-from app.core.config import settings
+from app.adapters.base import BaseLLMAdapter, ChatRequest, ChatResponse, StreamChunk, ModelRequestError, normalize_usage
 from app.core.enums import ModelProvider
+from app.adapters.sse import iter_stream_chunks
 import logging
 from collections.abc import AsyncIterator
 
@@ -18,57 +17,33 @@ log = logging.getLogger("app")
 class SiliconFlowAdapter(BaseLLMAdapter):
     """SiliconFlow API 适配器"""
 
-    # 模型定价（如果有的话，根据实际情况调整）
-    MODEL_PRICING = {
-        'deepseek-ai/deepseek-v3': {'prompt': 0.0001, 'completion': 0.0002},
-        'qwen/qwen-turbo': {'prompt': 0.0001, 'completion': 0.0002},
-    }
+    # 硅基流动在流式块中自带 usage，不需要 stream_options
+    STREAM_INCLUDE_USAGE = False
 
     def __init__(self, api_key: str, base_url: str | None = None):
         super().__init__(api_key, base_url)
         self.base_url = base_url or 'https://api.siliconflow.cn/v1'
         self.provider = ModelProvider.SILICONFLOW
 
-    async def _get_client(self) -> httpx.AsyncClient:
-        """获取 HTTP 客户端"""
-        return httpx.AsyncClient(
-            base_url=self.base_url,
-            headers={'Authorization': f'Bearer {self.api_key}', 'Content-Type': 'application/json'},
-            timeout=settings.CONNECT_TIMEOUT,
-        )
-
     async def get_available_models(self) -> list[str]:
         """获取可用模型（异步方法）"""
 
         try:
-            async with await self._get_client() as client:
-                # 使用 client 异步发送 GET 请求
-                response = await client.get('/models')
-                response.raise_for_status()
-                data = response.json()
+            client = self._get_client()
+            # 使用 client 异步发送 GET 请求
+            response = await client.get('/models')
+            response.raise_for_status()
+            data = response.json()
 
-                # 提取 id 列表
-                model_ids = [item['id'] for item in data.get('data', [])]
-                return model_ids
+            # 提取 id 列表
+            model_ids = [item['id'] for item in data.get('data', [])]
+            return model_ids
 
         except httpx.HTTPStatusError as e:
             raise Exception(f'API 请求失败: {e.response.status_code} - {e.response.text}') from e
         except Exception as e:
             raise Exception(f'未知错误: {str(e)}') from e
 
-    def calculate_cost(self, usage: dict[str, int], model: str) -> float:
-        """计算成本"""
-        if model not in self.MODEL_PRICING:
-            # 如果没有定价信息，返回0或使用默认定价
-            log.warning(f'No pricing info for model: {model}')
-            return 0.0
-
-        pricing = self.MODEL_PRICING[model]
-        prompt_cost = (usage.get('prompt_tokens', 0) / 1000) * pricing['prompt']
-        completion_cost = (usage.get('completion_tokens', 0) / 1000) * pricing['completion']
-
-        return prompt_cost + completion_cost
-
     def _build_payload(self, request: ChatRequest, is_stream: bool = False) -> dict:
         return {
             'model': request.model,
@@ -93,82 +68,51 @@ class SiliconFlowAdapter(BaseLLMAdapter):
         try:
             log.debug(f'Sending request to SiliconFlow: {payload}')
 
-            async with await self._get_client() as client:
-                response = await client.post('/chat/completions', json=payload)
-                response.raise_for_status()
-                data = response.json()
+            client = self._get_client()
+            response = await client.post('/chat/completions', json=payload)
+            response.raise_for_status()
+            data = response.json()
 
             # 解析响应
             choice = data['choices'][0]
             message = choice['message']
             # print(data)
-            raw_usage = data.get('usage', {})
-            filtered_usage = {
-                'prompt_tokens': raw_usage.get('prompt_tokens', 0),
-                'completion_tokens': raw_usage.get('completion_tokens', 0),
-                'total_tokens': raw_usage.get('total_tokens', 0),
-            }
             return ChatResponse(
                 id=data.get('id', ''),
                 model=data.get('model', request.model),
                 content=message.get('content', ''),
                 finish_reason=choice.get('finish_reason', ''),
-                usage=filtered_usage,
+                usage=normalize_usage(data.get('usage')),
                 provider=self.provider,
             )
         except httpx.HTTPStatusError as e:
             log.error(f'SiliconFlow API error: {e.response.status_code} - {e.response.text}')
-            raise ModelRequestError(f'SiliconFlow API error: {e.response.text}')
+            raise ModelRequestError(f'SiliconFlow API error: {e.response.text}', status_code=e.response.status_code)
         except Exception as e:
             log.error(f'Unexpected error: {str(e)}')
-            raise ModelRequestError(str(e))
+            raise ModelRequestError(str(e)) from e
 
     async def chat_stream(self, request: ChatRequest) -> AsyncIterator[StreamChunk]:
         """流式聊天"""
         await self.validate_request(request)
 
         # 构建请求体
-        payload = self._build_payload(request, is_stream=True)
+        payload = self._stream_options(self._build_payload(request, is_stream=True))
 
         if request.max_tokens:
             payload['max_tokens'] = request.max_tokens
 
         try:
-            async with await self._get_client() as client:
-                async with client.stream('POST', '/chat/completions', json=payload) as response:
-                    response.raise_for_status()
-
-                    async for line in response.aiter_lines():
-                        if not line.strip():
-                            continue
-
-                        if line.startswith('data: '):
-                            data_str = line[6:]
+            client = self._get_client()
+            async with client.stream('POST', '/chat/completions', json=payload) as response:
+                await self._raise_for_status(response)
 
-                            if data_str == '[DONE]':
-                                break
-
-                            try:
-                                data = json.loads(data_str)
-                                choice = data['choices'][0]
-                                delta = choice.get('delta', {})
-
-                                if 'content' in delta:
-                                    yield StreamChunk(content=delta['content'], finish_reason=None)
-
-                                if choice.get('finish_reason'):
-                                    yield StreamChunk(content='', finish_reason=choice['finish_reason'])
-
-                            except json.JSONDecodeError:
-                                continue
+                async for chunk in iter_stream_chunks(response.aiter_bytes()):
+                    yield chunk
 
         except httpx.HTTPStatusError as e:
             log.error(f'SiliconFlow streaming error: {e.response.status_code}')
-            raise Exception(f'SiliconFlow streaming error: {e.response.text}')
+            raise ModelRequestError(f'SiliconFlow streaming error: {e.response.text}', status_code=e.response.status_code)
         except Exception as e:
             log.error(f'Unexpected streaming error: {str(e)}')
             raise
-
-    async def close(self):
-        """关闭客户端"""
-        pass
@@ -0,0 +1,144 @@
+"""
+@File    : sse.py
+@Author  : Martin
+@Desc    : OpenAI 兼容协议的增量 SSE 解码器（所有适配器共用）
+"""
+
+import json
+from app.adapters.base import StreamChunk, normalize_usage
+from collections.abc import AsyncIterator
+
+try:
+    # 安装了 orjson 时使用更快的 JSON 解析（可直接解析 bytes）与编码（直接输出 UTF-8 bytes）
+    import orjson
+
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:  # pragma: no cover - 可选依赖
+
+    def json_loads(data: bytes):
+        # 显式按 UTF-8 解码，比让 json.loads 自行探测 bytes 编码更快
+        return json.loads(data.decode())
+
+    def json_dumps(obj) -> bytes:
+        # 与 orjson 一致：紧凑格式、非 ASCII 字符直接输出 UTF-8（不转义为 \uXXXX）
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+DONE = b'[DONE]'
+
+
+class SSEDecoder:
+    """
+    增量 SSE 解码器
+    直接在原始字节上按行切分（bytes.split 在 C 层完成），不做整体文本解码；
+    每次 feed 返回其中已完整的事件 data（bytes）
+    """
+
+    __slots__ = ('_buffer', '_data')
+
+    def __init__(self):
+        self._buffer = b''
+        self._data: list[bytes] = []
+
+    def feed(self, raw: bytes) -> list[bytes]:
+        """喂入一段网络数据，返回其中已完整的事件"""
+        buffer = self._buffer + raw if self._buffer else raw
+        if b'\r' in buffer:
+            buffer = buffer.replace(b'\r\n', b'\n')
+
+        *lines, self._buffer = buffer.split(b'\n')
+        events: list[bytes] = []
+        data = self._data
+
+        for line in lines:
+            if not line:
+                # 空行：事件结束
+                if data:
+                    events.append(data[0] if len(data) == 1 else b'\n'.join(data))
+                    data = []
+            elif line.startswith(b'data:'):
+                data.append(line[6:] if line.startswith(b'data: ') else line[5:])
+            # 注释行（:）和 event/id/retry 字段忽略
+
+        self._data = data
+        return events
+
+    def flush(self) -> list[bytes]:
+        """流结束时输出最后一个未以空行结尾的事件"""
+        return self.feed(b'\n\n') if self._buffer or self._data else []
+
+
+def parse_delta(data: bytes) -> tuple[str | None, str | None, str | None, dict | None]:
+    """
+    从一个 chat.completion.chunk 中只取出需要的字段
+    返回 (content, reasoning_content, finish_reason, usage)
+    """
+    chunk = json_loads(data)
+    content = reasoning_content = finish_reason = None
+
+    choices = chunk.get('choices')
+    if choices:
+        choice = choices[0]
+        delta = choice.get('delta')
+        if delta:
+            content = delta.get('content')
+            reasoning_content = delta.get('reasoning_content')
+        finish_reason = choice.get('finish_reason')
+
+    return content, reasoning_content, finish_reason, chunk.get('usage')
+
+
+async def iter_events(byte_stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """逐个产出 SSE 事件的 data，遇到 [DONE] 结束"""
+    decoder = SSEDecoder()
+
+    async for raw in byte_stream:
+        for data in decoder.feed(raw):
+            if data == DONE:
+                return
+            yield data
+
+    for data in decoder.flush():
+        if data == DONE:
+            return
+        yield data
+
+
+def _to_chunk(data: bytes) -> StreamChunk | None:
+    try:
+        content, reasoning_content, finish_reason, usage = parse_delta(data)
+    except ValueError:
+        return None
+    if usage:
+        return StreamChunk(
+            content=content or '',
+            reasoning_content=reasoning_content or None,
+            finish_reason=finish_reason,
+            usage=normalize_usage(usage),
+        )
+    if reasoning_content:
+        return StreamChunk(content=content or '', reasoning_content=reasoning_content, finish_reason=finish_reason)
+    if content or finish_reason:
+        return StreamChunk(content=content or '', finish_reason=finish_reason)
+    return None
+
+
+async def iter_stream_chunks(byte_stream: AsyncIterator[bytes]) -> AsyncIterator[StreamChunk]:
+    """将上游 SSE 字节流（response.aiter_bytes()）转换为 StreamChunk"""
+    decoder = SSEDecoder()
+
+    async for raw in byte_stream:
+        for data in decoder.feed(raw):
+            if data == DONE:
+                return
+            chunk = _to_chunk(data)
+            if chunk is not None:
+                yield chunk
+
+    for data in decoder.flush():
+        if data == DONE:
+            return
+        chunk = _to_chunk(data)
+        if chunk is not None:
+            yield chunk
@@ -12,9 +12,11 @@ from app.crud.user import user_crud
 import logging
 from app.models.api_key import APIKey
 from app.models.user import User
+from app.services.rate_limiter import rate_limiter
 
 log = logging.getLogger("app")
-from fastapi import Depends, Header, HTTPException, status
+import math
+from fastapi import Depends, Header, HTTPException, Request, Response, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -138,6 +140,28 @@ async def verify_api_key(
     return api_key_obj
 
 
+async def rate_limited_api_key(
+    request: Request, response: Response, api_key: APIKey = Depends(verify_api_key)
+) -> APIKey:
+    """
+    验证API密钥并按密钥限流
+    限流信息通过 X-RateLimit-* 响应头返回，超限时返回 429 并附带 Retry-After
+    """
+    result = await rate_limiter.check(api_key)
+    if not result.allowed:
+        log.warning(f'Rate limit exceeded for API key {api_key.id}')
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail='Rate limit exceeded',
+            headers={**result.headers, 'Retry-After': str(max(1, math.ceil(result.retry_after)))},
+        )
+
+    # 直接返回 Response 对象（如流式接口）时需要从 request.state 取出自行附加
+    response.headers.update(result.headers)
+    request.state.rate_limit_headers = result.headers
+    return api_key
+
+
 async def get_user_from_api_key(api_key: APIKey, db: AsyncSession) -> User:
     """从API Key获取用户"""
     user = await user_crud.get(db, api_key.user_id)
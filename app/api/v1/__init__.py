@@ -7,7 +7,9 @@
 
 from app.api.v1.api_keys import router as api_keys_router
 from app.api.v1.auth import router as auth_router
+from app.api.v1.batches import router as batches_router
 from app.api.v1.chat import router as chat_router
+from app.api.v1.openai_compat import router as openai_router
 from app.api.v1.users import router as users_router
 from app.api.v1.statistics import router as statistics_router
 from app.plugins.day_news.router import router as news_router
@@ -27,6 +29,9 @@ api_router.include_router(api_keys_router, prefix='/api-keys', tags=['api-keys']
 # 聊天路由
 api_router.include_router(chat_router, prefix='/chat', tags=['chat'])
 
+# 批量任务路由
+api_router.include_router(batches_router, prefix='/batches', tags=['batches'])
+
 # 统计路由
 api_router.include_router(statistics_router, prefix='/statistics', tags=['statistics'])
 
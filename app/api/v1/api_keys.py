@@ -72,6 +72,10 @@ async def list_api_keys(
             is_active=key.is_active,
             expires_at=key.expires_at,
             last_used_at=key.last_used_at,
+            rate_limit_rpm=key.rate_limit_rpm,
+            rate_limit_tpm=key.rate_limit_tpm,
+            response_cache=key.response_cache,
+            similarity_threshold=key.similarity_threshold,
             created_at=key.created_at,
         )
         for key in api_keys
@@ -114,7 +118,8 @@ async def update_api_key(
     更新API密钥信息
 
     - 只能更新自己的API密钥
-    - 可以更新名称、描述、是否启用、过期时间
+    - 可以更新名称、描述、是否启用、过期时间、是否默认使用响应缓存、近似缓存阈值
+    - 管理员可以调整限流额度（rate_limit_rpm / rate_limit_tpm）
     """
     api_key = await api_key_crud.get(db, api_key_id)
 
@@ -126,6 +131,12 @@ async def update_api_key(
         log.warning(f'Unauthorized API key update: {current_user.id} -> {api_key_id}')
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Not enough privileges')
 
+    # 限流额度只能由管理员调整
+    if api_key_in.model_fields_set & {'rate_limit_rpm', 'rate_limit_tpm'} and not (
+        current_user.is_superuser or current_user.is_admin
+    ):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Only admins can change rate limits')
+
     api_key = await api_key_crud.update(db, api_key, api_key_in)
     await db.commit()
 
@@ -138,6 +149,10 @@ async def update_api_key(
         is_active=api_key.is_active,
         expires_at=api_key.expires_at,
         last_used_at=api_key.last_used_at,
+        rate_limit_rpm=api_key.rate_limit_rpm,
+        rate_limit_tpm=api_key.rate_limit_tpm,
+        response_cache=api_key.response_cache,
+        similarity_threshold=api_key.similarity_threshold,
         created_at=api_key.created_at,
     ))
 
@@ -200,5 +215,9 @@ async def deactivate_api_key(
         is_active=api_key.is_active,
         expires_at=api_key.expires_at,
         last_used_at=api_key.last_used_at,
+        rate_limit_rpm=api_key.rate_limit_rpm,
+        rate_limit_tpm=api_key.rate_limit_tpm,
+        response_cache=api_key.response_cache,
+        similarity_threshold=api_key.similarity_threshold,
         created_at=api_key.created_at,
     ))
@@ -0,0 +1,173 @@
+"""
+@File    : batches.py
+@Author  : Martin
+@Desc    : 批量任务接口：上传 JSONL 创建任务、查询进度、取消、以 NDJSON 流式下载结果
+"""
+
+import json
+import logging
+from app.api.deps import rate_limited_api_key, verify_api_key
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, get_db
+from app.crud.batch_job import batch_job_crud
+from app.models.api_key import APIKey
+from app.schemas.batch import BatchJobListResponse, BatchJobResponse
+from app.schemas.chat import ChatCompletionRequest
+from app.schemas.response import ResponseModel
+from app.services.batch_executor import batch_executor
+from collections.abc import AsyncIterator
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+log = logging.getLogger('app')
+
+router = APIRouter()
+
+# 下载结果时每次从数据库读取的条数
+_RESULT_PAGE = 500
+
+
+async def _iter_lines(request: Request) -> AsyncIterator[bytes]:
+    """逐行读取请求体，不把整个文件读进内存"""
+    buffer = b''
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+
+def _parse_item(line_no: int, raw: bytes) -> dict:
+    """解析一行请求：ChatCompletionRequest 的 JSON，可带 custom_id"""
+    try:
+        data = json.loads(raw)
+        if not isinstance(data, dict):
+            raise ValueError('each line must be a JSON object')
+        custom_id = data.pop('custom_id', None)
+        request = ChatCompletionRequest.model_validate(data)
+    except (ValueError, ValidationError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'Line {line_no}: {e}')
+    return {
+        'line': line_no,
+        'custom_id': str(custom_id) if custom_id is not None else None,
+        'provider': request.provider.value,
+        'request': request.model_dump(mode='json', exclude={'stream'}),
+    }
+
+
+@router.post('', response_model=ResponseModel[BatchJobResponse], summary='创建批量任务')
+async def create_batch(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    api_key: APIKey = Depends(rate_limited_api_key),
+):
+    """
+    上传 JSONL 创建批量任务（请求体即文件内容，Content-Type: application/x-ndjson）
+
+    每行一个聊天请求（与 /chat/completions 的请求体相同，可额外带 `custom_id`），空行忽略；
+    stream 字段会被忽略。任务在后台按供应商限并发执行，优先级低于交互请求。
+    """
+    items = []
+    line_no = 0
+    async for raw in _iter_lines(request):
+        line_no += 1
+        if not raw.strip():
+            continue
+        if len(items) >= settings.BATCH_MAX_ITEMS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=f'Too many requests (max {settings.BATCH_MAX_ITEMS})'
+            )
+        items.append(_parse_item(line_no, raw))
+
+    if not items:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Empty batch')
+
+    job = await batch_job_crud.create_with_items(db, api_key.id, items)
+    await db.commit()
+    batch_executor.notify()
+
+    log.info(f'Batch job created: {job.id} ({job.total} requests) by API key {api_key.id}')
+    return ResponseModel.success(data=BatchJobResponse.model_validate(job))
+
+
+@router.get('', response_model=ResponseModel[BatchJobListResponse], summary='获取批量任务列表')
+async def list_batches(
+    skip: int = Query(0, ge=0, description='跳过的记录数'),
+    limit: int = Query(20, ge=1, le=100, description='返回的记录数'),
+    db: AsyncSession = Depends(get_db),
+    api_key: APIKey = Depends(verify_api_key),
+):
+    """获取当前 API Key 的批量任务（新的在前）"""
+    jobs = await batch_job_crud.get_by_api_key(db, api_key.id, skip=skip, limit=limit)
+    return ResponseModel.success(data=BatchJobListResponse(items=[BatchJobResponse.model_validate(job) for job in jobs]))
+
+
+@router.get('/{job_id}', response_model=ResponseModel[BatchJobResponse], summary='获取批量任务进度')
+async def get_batch(job_id: int, db: AsyncSession = Depends(get_db), api_key: APIKey = Depends(verify_api_key)):
+    """任务状态、进度与 Token / 成本汇总"""
+    job = await batch_job_crud.get_for_api_key(db, job_id, api_key.id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Batch job not found')
+    return ResponseModel.success(data=BatchJobResponse.model_validate(job))
+
+
+@router.post('/{job_id}/cancel', response_model=ResponseModel[BatchJobResponse], summary='取消批量任务')
+async def cancel_batch(job_id: int, db: AsyncSession = Depends(get_db), api_key: APIKey = Depends(verify_api_key)):
+    """取消任务：尚未执行的请求不再执行，已完成的结果仍可下载"""
+    job = await batch_job_crud.get_for_api_key(db, job_id, api_key.id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Batch job not found')
+    job = await batch_job_crud.cancel(db, job)
+    await db.commit()
+    return ResponseModel.success(data=BatchJobResponse.model_validate(job))
+
+
+async def _stream_results(job_id: int) -> AsyncIterator[bytes]:
+    """按 ID 游标分页读取结果，逐行输出 NDJSON"""
+    after_id = 0
+    async with AsyncSessionLocal() as db:
+        while True:
+            items = await batch_job_crud.get_results(db, job_id, after_id, _RESULT_PAGE)
+            if not items:
+                return
+            lines = [
+                json.dumps(
+                    {
+                        'line': item.line,
+                        'custom_id': item.custom_id,
+                        'status': item.status,
+                        'response': item.response,
+                        'error': item.error,
+                    },
+                    ensure_ascii=False,
+                )
+                for item in items
+            ]
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            after_id = items[-1].id
+            db.expunge_all()
+
+
+@router.get('/{job_id}/results', summary='下载批量任务结果')
+async def download_batch_results(
+    job_id: int, db: AsyncSession = Depends(get_db), api_key: APIKey = Depends(verify_api_key)
+):
+    """
+    以 NDJSON 流式返回每条请求的结果（按上传顺序），未完成的请求 status 为 pending / running
+
+    ```
+    {"line": 1, "custom_id": "a", "status": "completed", "response": {...}, "error": null}
+    ```
+    """
+    job = await batch_job_crud.get_for_api_key(db, job_id, api_key.id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Batch job not found')
+    return StreamingResponse(
+        _stream_results(job.id),
+        media_type='application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename="batch-{job.id}.jsonl"'},
+    )
@@ -5,10 +5,9 @@
 @Desc    :
 """
 
-import json
-from app.adapters.model_registry import model_registry
-from app.api.deps import verify_api_key
+from app.api.deps import rate_limited_api_key, verify_api_key
 from app.core.database import get_db
+from app.core.model_catalog import model_catalog
 from app.crud.conversation import conversation_crud
 import logging
 from app.models.api_key import APIKey
@@ -19,13 +18,17 @@ from app.schemas.chat import (
     ConversationDetailResponse,
     ConversationListResponse,
     ConversationResponse,
+    ModelInfo,
     UsageInfo,
 )
 from app.schemas.response import ResponseModel
 from app.services.chat_service import chat_service
+from app.services.history_cache import history_cache
+from app.services.model_list_cache import model_list_cache
+from app.services.sse_writer import SSEResponse, SSEWriter
+from contextlib import aclosing
 from datetime import datetime, timezone
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 log = logging.getLogger("app")
@@ -37,7 +40,7 @@ router = APIRouter()
 async def create_chat_completion(
     request: ChatCompletionRequest,
     db: AsyncSession = Depends(get_db),
-    api_key: APIKey = Depends(verify_api_key),
+    api_key: APIKey = Depends(rate_limited_api_key),
 ):
     """
     创建聊天完成
@@ -66,6 +69,8 @@ async def create_chat_completion(
             top_p=request.top_p,
             frequency_penalty=request.frequency_penalty,
             presence_penalty=request.presence_penalty,
+            cache=request.cache if request.cache is not None else api_key.response_cache,
+            similarity_threshold=api_key.similarity_threshold,
         )
 
         # 构建响应
@@ -79,6 +84,8 @@ async def create_chat_completion(
             usage=UsageInfo(**result['usage']),
             cost=result['cost'],
             response_time=result['response_time'],
+            fallback_hop=result['fallback_hop'],
+            cached=result.get('cached', False),
             created_at=datetime.now(timezone.utc),
         ))
 
@@ -93,8 +100,9 @@ async def create_chat_completion(
 
 async def stream_chat_generator(request: ChatCompletionRequest, db: AsyncSession, api_key: APIKey):
     """
-    流式生成器，逐个返回流式数据块
+    流式生成器，逐个返回流式数据块（SSE 事件由 SSEWriter 编码，可按配置合并增量）
     """
+    writer = SSEWriter()
     try:
         # 调用 chat 方法，stream=True 会返回异步生成器
         generator = await chat_service.chat(
@@ -110,29 +118,31 @@ async def stream_chat_generator(request: ChatCompletionRequest, db: AsyncSession
             top_p=request.top_p,
             frequency_penalty=request.frequency_penalty,
             presence_penalty=request.presence_penalty,
+            cache=request.cache if request.cache is not None else api_key.response_cache,
+            similarity_threshold=api_key.similarity_threshold,
+            enable_thinking=request.enable_thinking,
             stream=True,  # 启用流式模式
         )
 
-        # 遍历异步生成器
-        async for chunk in generator:
-            # 每个 chunk 转换为 JSON 并以 SSE 格式发送
-            yield f'data: {json.dumps(chunk)}\n\n'
+        # 遍历异步生成器，每个（或合并后的）chunk 以 SSE 格式发送；客户端断开时逐层关闭直到上游流
+        async with aclosing(writer.frames(generator)) as frames:
+            async for frame in frames:
+                yield frame
 
     except ValueError as e:
-        error_msg = {'error': str(e), 'type': 'validation_error'}
-        yield f'data: {json.dumps(error_msg)}\n\n'
+        yield writer.event({'error': str(e), 'type': 'validation_error'})
         log.error(f'Validation error in stream: {str(e)}')
     except Exception as e:
-        error_msg = {'error': str(e), 'type': 'server_error'}
-        yield f'data: {json.dumps(error_msg)}\n\n'
+        yield writer.event({'error': str(e), 'type': 'server_error'})
         log.error(f'Stream chat error: {str(e)}')
 
 
 @router.post('/completions/stream', summary='流式聊天完成')
 async def create_chat_stream_completion(
     request: ChatCompletionRequest,
+    http_request: Request,
     db: AsyncSession = Depends(get_db),
-    api_key: APIKey = Depends(verify_api_key),
+    api_key: APIKey = Depends(rate_limited_api_key),
 ):
     """
     流式聊天完成 - 返回 Server-Sent Events (SSE) 格式的数据流
@@ -145,12 +155,20 @@ async def create_chat_stream_completion(
 
     data: {"content": "", "finish_reason": "stop", ...}
     ```
+
+    开启 enable_thinking 时，思考过程通过 `reasoning_content` 字段单独推送，`content` 只包含回答内容
+
+    客户端中途断开时立即取消上游请求，已生成的部分回复照常保存，使用记录标记 finish_reason=client_disconnected
     """
     try:
-        return StreamingResponse(
+        return SSEResponse(
             stream_chat_generator(request, db, api_key),
-            media_type='text/event-stream',
-            headers={'Cache-Control': 'no-cache', 'Connection': 'keep-alive', 'X-Accel-Buffering': 'no'},
+            headers={
+                'Cache-Control': 'no-cache',
+                'Connection': 'keep-alive',
+                'X-Accel-Buffering': 'no',
+                **http_request.state.rate_limit_headers,
+            },
         )
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
@@ -225,6 +243,7 @@ async def delete_conversation(
 
     await conversation_crud.delete(db, conversation_id)
     await db.commit()
+    history_cache.invalidate(api_key.id, conversation_id)
 
     log.info(f'Conversation deleted: {conversation_id}')
     return None
@@ -232,18 +251,13 @@ async def delete_conversation(
 
 @router.get('/models', response_model=ResponseModel[list[AvailableModelsResponse]], summary='获取可用模型列表')
 async def list_available_models(api_key: APIKey = Depends(verify_api_key)):
-    """获取所有可用的AI模型"""
-    providers = model_registry.get_available_providers()
-
-    result = []
-    for provider in providers:
-        try:
-            adapter = model_registry.get_adapter(provider)
-            models = await adapter.get_available_models()
-
-            result.append(AvailableModelsResponse(provider=provider.value, models=models))
-        except Exception as e:
-            log.warning(f'Failed to get models for {provider}: {str(e)}')
-            continue
-
+    """获取所有可用的AI模型（缓存，各供应商并发拉取），并附带模型目录中的上下文长度、模态与价格"""
+    result = [
+        AvailableModelsResponse(
+            provider=provider.value,
+            models=models,
+            details=[ModelInfo(**spec.model_dump(include=set(ModelInfo.model_fields))) for spec in model_catalog.models_for(provider)],
+        )
+        for provider, models in await model_list_cache.get_all()
+    ]
     return ResponseModel.success(data=result)
@@ -0,0 +1,91 @@
+"""
+@File    : openai_compat.py
+@Author  : Martin
+@Desc    : OpenAI 兼容接口（挂载在 /v1，可直接使用 OpenAI SDK）：请求体与上游响应原样透传
+"""
+
+import httpx
+import logging
+from app.adapters.base import ModelRequestError
+from app.api.deps import rate_limited_api_key, verify_api_key
+from app.models.api_key import APIKey
+from app.schemas.openai_compat import MODEL_SEPARATOR, OpenAIChatCompletionRequest, OpenAIModel, OpenAIModelList
+from app.services.model_list_cache import model_list_cache
+from app.services.passthrough import passthrough_service
+from app.services.sse_writer import SSEResponse
+from fastapi import APIRouter, Depends, Request, status
+from fastapi.responses import JSONResponse, Response
+
+log = logging.getLogger('app')
+
+router = APIRouter()
+
+
+def openai_error(status_code: int, message: str, error_type: str = 'invalid_request_error', headers=None) -> JSONResponse:
+    """OpenAI 协议的错误响应体"""
+    return JSONResponse(
+        status_code=status_code,
+        content={'error': {'message': message, 'type': error_type, 'param': None, 'code': None}},
+        headers=headers,
+    )
+
+
+def _upstream_error(e: Exception) -> Response:
+    """上游错误：HTTP 错误原样返回上游的状态码与响应体，其余按 OpenAI 错误格式返回"""
+    if isinstance(e, httpx.HTTPStatusError):
+        return Response(
+            content=e.response.content,
+            status_code=e.response.status_code,
+            media_type=e.response.headers.get('content-type', 'application/json'),
+        )
+    if isinstance(e, ModelRequestError):
+        return openai_error(e.status_code or status.HTTP_502_BAD_GATEWAY, str(e), 'upstream_error')
+    log.error(f'Passthrough error: {e}')
+    return openai_error(status.HTTP_502_BAD_GATEWAY, 'Upstream request failed', 'upstream_error')
+
+
+@router.post('/chat/completions', summary='聊天完成（OpenAI 兼容）')
+async def create_chat_completion(
+    request: OpenAIChatCompletionRequest,
+    http_request: Request,
+    api_key: APIKey = Depends(rate_limited_api_key),
+):
+    """
+    OpenAI 协议的聊天接口，`model` 为 `供应商/模型名`（如 `deepseek/deepseek-chat`）
+
+    请求体（含 tools 等未声明字段）原样发给上游；流式响应直接转发上游的 SSE 字节，
+    不逐块解析与重新编码。流式请求总是向上游开启 `stream_options.include_usage`，按上游返回的实际用量计费；
+    客户端未传 `stream_options.include_usage` 时不转发末尾只带 usage 的块。
+    """
+    try:
+        provider, model = request.target()
+    except ValueError as e:
+        return openai_error(status.HTTP_400_BAD_REQUEST, str(e))
+
+    body = request.model_dump(exclude_unset=True)
+    headers = http_request.state.rate_limit_headers
+    try:
+        if request.stream:
+            stream = await passthrough_service.open_stream(api_key.id, provider, model, body, request.max_output_tokens())
+            return SSEResponse(
+                stream,
+                headers={'Cache-Control': 'no-cache', 'Connection': 'keep-alive', 'X-Accel-Buffering': 'no', **headers},
+            )
+        content = await passthrough_service.complete(api_key.id, provider, model, body, request.max_output_tokens())
+        return Response(content=content, media_type='application/json', headers=headers)
+    except ValueError as e:
+        return openai_error(status.HTTP_400_BAD_REQUEST, str(e))
+    except Exception as e:
+        return _upstream_error(e)
+
+
+@router.get('/models', response_model=OpenAIModelList, summary='模型列表（OpenAI 兼容）')
+async def list_models(api_key: APIKey = Depends(verify_api_key)):
+    """所有已配置供应商的模型，id 即 /v1/chat/completions 的 model 参数"""
+    return OpenAIModelList(
+        data=[
+            OpenAIModel(id=f'{provider.value}{MODEL_SEPARATOR}{model}', owned_by=provider.value)
+            for provider, models in await model_list_cache.get_all()
+            for model in models
+        ]
+    )
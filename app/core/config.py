@@ -9,6 +9,116 @@ class Settings(BaseSettings):
     # 连接超时设置
     CONNECT_TIMEOUT: int = Field(default=120, description='AI连接超时时间，单位秒')
 
+    # 上游 HTTP 连接池设置（每个适配器实例一个连接池）
+    HTTP_MAX_CONNECTIONS: int = Field(default=100, description='单个适配器最大连接数')
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = Field(default=20, description='单个适配器最大空闲长连接数')
+    HTTP_KEEPALIVE_EXPIRY: float = Field(default=30.0, description='空闲长连接过期时间，单位秒')
+    HTTP2_ENABLED: bool = Field(default=True, description='上游支持时启用 HTTP/2（需安装 h2）')
+
+    # 跨供应商故障转移链，按模型名配置，例如：
+    # MODEL_FALLBACK_CHAINS='{"deepseek-chat": ["siliconflow:deepseek-ai/DeepSeek-V3", "aliyuncs:qwen-plus"]}'
+    MODEL_FALLBACK_CHAINS: dict[str, list[str]] = Field(default_factory=dict, description='模型故障转移链')
+    FAILOVER_TOTAL_TIMEOUT: float = Field(default=60.0, description='故障转移整体截止时间，单位秒（超时后不再重试）')
+
+    # 上游重试设置（指数退避 + 抖动，遵循 Retry-After）
+    RETRY_MAX_RETRIES: int = Field(default=2, description='单个请求最多重试次数')
+    RETRY_BASE_DELAY: float = Field(default=0.5, description='重试退避基数，单位秒')
+    RETRY_MAX_DELAY: float = Field(default=10.0, description='单次重试最长等待，Retry-After 超过该值时直接故障转移')
+
+    # 对冲请求策略，按模型名配置，例如：
+    # HEDGE_POLICIES='{"deepseek-chat": {"secondary": "siliconflow:deepseek-ai/DeepSeek-V3", "max_extra_ratio": 0.1}}'
+    HEDGE_POLICIES: dict[str, dict] = Field(default_factory=dict, description='模型对冲策略')
+
+    # 熔断器设置（每个适配器实例一个熔断器）
+    CIRCUIT_BREAKER_ENABLED: bool = Field(default=True, description='是否启用熔断器')
+    CIRCUIT_WINDOW_SECONDS: float = Field(default=60.0, description='熔断统计滑动窗口，单位秒')
+    CIRCUIT_MIN_REQUESTS: int = Field(default=10, description='窗口内触发熔断的最少请求数')
+    CIRCUIT_FAILURE_RATE: float = Field(default=0.5, description='触发熔断的错误率')
+    CIRCUIT_SLOW_CALL_SECONDS: float = Field(default=30.0, description='慢调用阈值，单位秒（流式按首字耗时）')
+    CIRCUIT_SLOW_CALL_RATE: float = Field(default=0.8, description='触发熔断的慢调用比例')
+    CIRCUIT_OPEN_SECONDS: float = Field(default=30.0, description='熔断持续时间，之后进入半开状态')
+    CIRCUIT_HALF_OPEN_PROBES: int = Field(default=1, description='半开状态下放行的探测请求数')
+
+    # 自适应并发限制（每个供应商凭据一个，AIMD 调整）
+    PROVIDER_CONCURRENCY_INITIAL: int = Field(default=20, description='初始并发上限')
+    PROVIDER_CONCURRENCY_MIN: int = Field(default=1, description='最小并发上限')
+    PROVIDER_CONCURRENCY_MAX: int = Field(default=200, description='最大并发上限')
+    PROVIDER_QUEUE_SIZE: int = Field(default=200, description='超出并发上限时的最大排队数')
+    PROVIDER_QUEUE_TIMEOUT: float = Field(default=30.0, description='排队最长等待时间，单位秒')
+    PROVIDER_THROTTLE_BACKOFF: float = Field(default=0.5, description='遇到 429 时并发上限的缩减系数')
+    PROVIDER_LATENCY_TOLERANCE: float = Field(default=2.0, description='延迟超过基线的倍数时视为拥塞')
+    PROVIDER_LATENCY_BACKOFF: float = Field(default=0.9, description='拥塞时并发上限的缩减系数')
+
+    # 模型目录（价格、上下文长度、模态），为空时使用内置的 app/data/model_catalog.json
+    MODEL_CATALOG_PATH: str | None = Field(default=None, description='模型目录数据文件路径')
+
+    # 模型列表缓存设置
+    MODEL_LIST_TTL: float = Field(default=300.0, description='模型列表缓存有效期，单位秒')
+    MODEL_LIST_STALE_TTL: float = Field(default=3600.0, description='过期后仍可先返回旧列表并后台刷新的时长，单位秒')
+    MODEL_LIST_FETCH_TIMEOUT: float = Field(default=5.0, description='单个供应商拉取模型列表的超时，单位秒')
+    MODEL_LIST_REFRESH_INTERVAL: float = Field(default=300.0, description='后台刷新间隔，单位秒，0 表示关闭')
+
+    # API Key 限流设置（令牌桶，单个密钥可单独配置）
+    RATE_LIMIT_DEFAULT_RPM: int = Field(default=0, description='默认每分钟请求数限额，0 表示不限')
+    RATE_LIMIT_DEFAULT_TPM: int = Field(default=0, description='默认每分钟 Token 数限额，0 表示不限')
+    RATE_LIMIT_BACKEND: Literal['memory', 'postgres'] = Field(
+        default='memory', description='限流存储：memory 为进程内，postgres 在多个 worker 间共享'
+    )
+
+    # 响应缓存（完全相同的请求直接返回缓存结果，按 API Key 或单次请求开启）
+    RESPONSE_CACHE_MAX_ENTRIES: int = Field(default=1024, description='内存缓存最大条目数，0 表示关闭缓存')
+    RESPONSE_CACHE_TTL: int = Field(default=3600, description='缓存有效期（秒）')
+    RESPONSE_CACHE_DISK_PATH: str | None = Field(default=None, description='磁盘缓存 SQLite 文件路径，为空时只用内存缓存')
+    RESPONSE_CACHE_DISK_MAX_ENTRIES: int = Field(default=100000, description='磁盘缓存最大条目数')
+
+    # 请求合并：同一 API Key 完全相同的进行中请求只调用一次上游，其余请求共享结果（只对开启响应缓存的请求生效）
+    SINGLEFLIGHT_ENABLED: bool = Field(default=True, description='是否合并开启响应缓存的相同进行中请求')
+
+    # 批量任务（离线请求，优先级低于交互请求）
+    BATCH_ENABLED: bool = Field(default=True, description='是否在本进程运行批量任务执行器')
+    BATCH_MAX_ITEMS: int = Field(default=50000, description='单个批量任务最多的请求数')
+    BATCH_PROVIDER_CONCURRENCY: int = Field(default=4, description='每个供应商同时执行的批量请求上限')
+    BATCH_LIMITER_SHARE: float = Field(
+        default=0.5, description='批量请求最多占用供应商并发限额的比例，有交互请求排队时暂停派发'
+    )
+    BATCH_POLL_INTERVAL: float = Field(default=5.0, description='没有可执行请求时的轮询间隔（秒）')
+    BATCH_ITEM_LEASE: int = Field(default=900, description='请求领取租约（秒），超时未完成的请求会被重新领取')
+
+    # 近似缓存（SimHash + 分段 LSH，按 API Key 的相似度阈值开启，有效期与响应缓存相同）
+    SIMILARITY_CACHE_MAX_ENTRIES: int = Field(default=100000, description='近似缓存最大条目数，0 表示关闭')
+    SIMILARITY_CACHE_BANDS: int = Field(
+        default=4, description='LSH 分段数（需整除 64），汉明距离小于分段数的相似请求保证能被找到'
+    )
+
+    # SSE 输出合并（窗口内的连续增量合并为一个事件，减少编码与写入次数）
+    SSE_COALESCE_MS: float = Field(default=0, description='SSE 合并窗口（毫秒），0 表示每个增量立即发送')
+    SSE_COALESCE_BYTES: int = Field(default=512, description='合并窗口内累计超过该字节数时立即发送')
+
+    # 历史消息窗口（从最新消息往前，按模型上下文长度减去 max_tokens 的 Token 预算装入）
+    HISTORY_MAX_MESSAGES: int = Field(default=200, description='每轮最多读取的历史消息条数')
+    HISTORY_MAX_TOKENS: int = Field(default=8192, description='历史消息的 Token 上限（与模型上下文预算取较小值），0 表示不额外限制')
+    HISTORY_DEFAULT_CONTEXT: int = Field(default=8192, description='模型目录未收录的模型按此上下文长度计算预算')
+    HISTORY_RESERVED_OUTPUT_TOKENS: int = Field(default=1024, description='请求未指定 max_tokens 时为输出预留的 Token 数')
+    HISTORY_CACHE_MAX_BYTES: int = Field(default=64 * 1024 * 1024, description='对话历史缓存的内存上限（字节），0 表示关闭缓存')
+    HISTORY_CACHE_TTL: int = Field(default=600, description='对话历史缓存有效期（秒），多进程部署时其他进程写入的消息最迟在此时间后可见')
+
+    # 对话压缩（未摘要的历史超过阈值时，后台用低成本模型把较早的轮次滚动摘要，之后发送 摘要 + 最近消息）
+    COMPACTION_ENABLED: bool = Field(default=False, description='是否启用对话压缩')
+    COMPACTION_TRIGGER_TOKENS: int = Field(default=6000, description='未摘要历史消息的估算 Token 数超过该值时触发压缩')
+    COMPACTION_KEEP_MESSAGES: int = Field(default=8, description='压缩时保留原文的最近消息条数')
+    # COMPACTION_MODEL='deepseek:deepseek-chat'
+    COMPACTION_MODEL: str | None = Field(default=None, description='生成摘要的模型（供应商:模型），为空时使用对话本轮的模型')
+    COMPACTION_SUMMARY_MAX_TOKENS: int = Field(default=1024, description='摘要的最大输出 Token 数')
+
+    # 使用记录异步写入（事务提交后进入进程内队列，按条数或间隔批量 COPY 写入）
+    USAGE_WRITER_ENABLED: bool = Field(default=True, description='是否异步批量写入使用记录，关闭时在请求事务中逐条写入')
+    USAGE_WRITER_QUEUE_SIZE: int = Field(default=10000, description='待写入队列的容量（条）')
+    USAGE_WRITER_BATCH_SIZE: int = Field(default=500, description='每批写入的最大条数')
+    USAGE_WRITER_FLUSH_INTERVAL: float = Field(default=1.0, description='凑批的最长等待时间（秒）')
+    USAGE_WRITER_PUT_TIMEOUT: float = Field(default=0.5, description='队列满时请求等待的秒数，超时后在请求事务中直接写入')
+    USAGE_WRITER_RETRY_INTERVAL: float = Field(default=30.0, description='数据库不可用时重试的间隔（秒），期间的记录写入本地文件')
+    USAGE_WRITER_SPILL_DIR: str = Field(default='./logs/usage_spill', description='数据库不可用时暂存使用记录的目录')
+
     # 系统提示词设置
     SYSTEM_PROMPT: str = Field(
         default='You are an AI assistant of the AI aggregation platform developed by Martin. Your name is Xiaomei',
@@ -0,0 +1,124 @@
+"""
+@File    : model_catalog.py
+@Author  : Martin
+@Desc    : 模型目录：价格、上下文长度、最大输出与模态，启动时从数据文件加载一次
+"""
+
+import json
+import logging
+import pathlib
+from app.core.config import settings
+from app.core.enums import ModelProvider
+from app.core.tokens import estimate_messages_tokens
+from pydantic import BaseModel, Field
+
+log = logging.getLogger('app')
+
+DEFAULT_CATALOG_PATH = pathlib.Path(__file__).resolve().parent.parent / 'data' / 'model_catalog.json'
+
+# 前缀匹配时，前缀之后必须是这些分隔符之一（qwen-plus-2025-04-28 命中 qwen-plus，gpt-4o 不会命中 gpt-4）
+_VERSION_SEPARATORS = ('-', ':', '@', '.', '/')
+
+
+class ModelSpec(BaseModel):
+    """单个模型的目录信息，价格单位见数据文件的 unit（每 1K Token）"""
+
+    provider: ModelProvider
+    id: str
+    aliases: list[str] = Field(default_factory=list)
+    prompt_price: float = 0.0
+    completion_price: float = 0.0
+    cached_prompt_price: float | None = None  # 命中缓存的输入价格，为空时按普通输入计价
+    context_length: int | None = None
+    max_output_tokens: int | None = None
+    modalities: list[str] = Field(default_factory=lambda: ['text'])
+
+    def cost(self, usage: dict[str, int]) -> float:
+        """按用量计算成本"""
+        prompt_tokens = usage.get('prompt_tokens', 0)
+        cached_tokens = min(usage.get('cached_tokens', 0), prompt_tokens)
+        cached_price = self.cached_prompt_price if self.cached_prompt_price is not None else self.prompt_price
+        return (
+            (prompt_tokens - cached_tokens) * self.prompt_price
+            + cached_tokens * cached_price
+            + usage.get('completion_tokens', 0) * self.completion_price
+        ) / 1000
+
+
+class ModelCatalog:
+    """
+    模型目录索引
+    查找顺序：精确 ID → 别名 → 最长前缀（ID 或别名加版本号，如 gpt-4-turbo-2024-04-09 命中别名 gpt-4-turbo），
+    均不区分大小写
+    """
+
+    def __init__(self, specs: list[ModelSpec]):
+        self._specs = specs
+        self._exact: dict[tuple[ModelProvider, str], ModelSpec] = {}
+        self._prefixes: dict[ModelProvider, list[tuple[str, ModelSpec]]] = {}
+
+        for spec in specs:
+            self._exact[(spec.provider, spec.id.lower())] = spec
+        for spec in specs:
+            prefixes = self._prefixes.setdefault(spec.provider, [])
+            prefixes.append((spec.id.lower(), spec))
+            for alias in spec.aliases:
+                self._exact.setdefault((spec.provider, alias.lower()), spec)
+                prefixes.append((alias.lower(), spec))
+        for prefixes in self._prefixes.values():
+            prefixes.sort(key=lambda item: len(item[0]), reverse=True)
+
+    @classmethod
+    def load(cls, path: str | pathlib.Path) -> 'ModelCatalog':
+        """从 JSON 数据文件加载"""
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        specs = [ModelSpec.model_validate(item) for item in data.get('models', [])]
+        log.info(f'Model catalog loaded: {len(specs)} models from {path}')
+        return cls(specs)
+
+    def lookup(self, provider: ModelProvider, model: str) -> ModelSpec | None:
+        """查找模型信息，未收录时返回 None"""
+        key = model.lower()
+        spec = self._exact.get((provider, key))
+        if spec is not None:
+            return spec
+        for prefix, spec in self._prefixes.get(provider, []):
+            if len(key) > len(prefix) and key.startswith(prefix) and key[len(prefix)] in _VERSION_SEPARATORS:
+                return spec
+        return None
+
+    def models_for(self, provider: ModelProvider) -> list[ModelSpec]:
+        """某个供应商收录的所有模型"""
+        return [spec for spec in self._specs if spec.provider == provider]
+
+    def preflight(self, provider: ModelProvider, model: str, messages: list, max_tokens: int | None) -> None:
+        """
+        本地预检：超出上下文、超出最大输出或包含模型不支持的模态时直接拒绝，避免一次无效的上游请求
+        未收录的模型不做检查
+        """
+        spec = self.lookup(provider, model)
+        if spec is None:
+            return
+
+        if max_tokens and spec.max_output_tokens and max_tokens > spec.max_output_tokens:
+            raise ValueError(f'max_tokens {max_tokens} exceeds the limit of {model} ({spec.max_output_tokens})')
+
+        if 'image' not in spec.modalities:
+            for msg in messages:
+                if isinstance(msg.content, list) and any(
+                    isinstance(part, dict) and part.get('type') != 'text' for part in msg.content
+                ):
+                    raise ValueError(f'Model {model} does not support image input')
+
+        if spec.context_length:
+            prompt_tokens = estimate_messages_tokens(messages)
+            if prompt_tokens + (max_tokens or 0) > spec.context_length:
+                raise ValueError(
+                    f'Request needs about {prompt_tokens + (max_tokens or 0)} tokens, '
+                    f'exceeding the context length of {model} ({spec.context_length})'
+                )
+
+
+# 全局模型目录（导入时加载一次）
+model_catalog = ModelCatalog.load(settings.MODEL_CATALOG_PATH or DEFAULT_CATALOG_PATH)
@@ -0,0 +1,48 @@
+"""
+@File    : tokens.py
+@Author  : Martin
+@Desc    : 本地 Token 估算（上游未返回 usage 时的兜底）
+"""
+
+from typing import Any
+
+# 每条消息的格式开销（role、分隔符等），与 OpenAI 的计数方式接近
+MESSAGE_OVERHEAD_TOKENS = 4
+# 图片按低清晰度的固定开销计
+IMAGE_TOKENS = 85
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本 Token 数
+    CJK 字符约 1 token/字，其余字符约 4 字符/token；
+    用 UTF-8 字节数与字符数之差推算多字节字符数量，全部在 C 层完成
+    """
+    if not text:
+        return 0
+    chars = len(text)
+    wide = (len(text.encode('utf-8', 'surrogatepass')) - chars) // 2
+    return wide + (chars - wide + 3) // 4
+
+
+def estimate_content_tokens(content: str | list[dict[str, Any]] | None) -> int:
+    """估算消息内容（文本或多模态列表）的 Token 数"""
+    if isinstance(content, str):
+        return estimate_tokens(content)
+    if not isinstance(content, list):
+        return 0
+
+    tokens = 0
+    for part in content:
+        if not isinstance(part, dict):
+            continue
+        if part.get('type') == 'text':
+            tokens += estimate_tokens(part.get('text') or '')
+        else:
+            tokens += IMAGE_TOKENS
+    return tokens
+
+
+def estimate_messages_tokens(messages: list) -> int:
+    """估算消息列表的 prompt Token 数（消息需有 content 属性）"""
+    return sum(MESSAGE_OVERHEAD_TOKENS + estimate_content_tokens(msg.content) for msg in messages)
@@ -43,6 +43,15 @@ class CRUDAPIKey(CRUDBase[APIKey, APIKeyCreate, APIKeyUpdate]):
 
         return api_key
 
+    async def get_active_by_id(self, db: AsyncSession, api_key_id: int) -> APIKey | None:
+        """按ID获取有效的API密钥（后台执行前重新检查是否激活和过期）"""
+        api_key = await db.get(APIKey, api_key_id, populate_existing=True)
+        if api_key is None or not api_key.is_active:
+            return None
+        if api_key.expires_at and api_key.expires_at < datetime.now(api_key.expires_at.tzinfo):
+            return None
+        return api_key
+
     async def create_for_user(self, db: AsyncSession, user_id: int, obj_in: APIKeyCreate) -> APIKey:
         """为用户创建API密钥"""
         api_key = self.generate_key()
@@ -0,0 +1,179 @@
+"""
+@File    : batch_job.py
+@Author  : Martin
+@Desc    : 批量任务 CRUD：创建、领取待执行请求（SKIP LOCKED + 租约）、回写结果与汇总
+"""
+
+from app.crud.base import CRUDBase
+from app.models.batch_job import BatchItem, BatchJob
+from datetime import datetime, timedelta, timezone
+from pydantic import BaseModel
+from sqlalchemy import case, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# 批量插入请求时每条 INSERT 的行数
+_INSERT_CHUNK = 1000
+
+ACTIVE_STATUSES = ('pending', 'running')
+
+
+class BatchJobCRUD(CRUDBase[BatchJob, BaseModel, BaseModel]):
+    """批量任务CRUD操作"""
+
+    async def create_with_items(self, db: AsyncSession, api_key_id: int, items: list[dict]) -> BatchJob:
+        """创建任务及其全部请求，items 为 {line, custom_id, provider, request}"""
+        job = BatchJob(api_key_id=api_key_id, total=len(items))
+        db.add(job)
+        await db.flush()
+
+        for start in range(0, len(items), _INSERT_CHUNK):
+            await db.execute(insert(BatchItem), [{**item, 'job_id': job.id} for item in items[start : start + _INSERT_CHUNK]])
+
+        await db.refresh(job)
+        return job
+
+    async def get_for_api_key(self, db: AsyncSession, job_id: int, api_key_id: int) -> BatchJob | None:
+        """获取属于该 API Key 的任务"""
+        result = await db.execute(select(BatchJob).where(BatchJob.id == job_id, BatchJob.api_key_id == api_key_id))
+        return result.scalar_one_or_none()
+
+    async def get_by_api_key(self, db: AsyncSession, api_key_id: int, skip: int = 0, limit: int = 100) -> list[BatchJob]:
+        """获取 API Key 的任务列表（新的在前）"""
+        result = await db.execute(
+            select(BatchJob)
+            .where(BatchJob.api_key_id == api_key_id)
+            .order_by(BatchJob.id.desc())
+            .offset(skip)
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+
+    async def owners(self, db: AsyncSession, job_ids: set[int]) -> dict[int, int]:
+        """任务ID -> 所属 API Key ID（执行前重新读取该密钥）"""
+        result = await db.execute(select(BatchJob.id, BatchJob.api_key_id).where(BatchJob.id.in_(job_ids)))
+        return dict(result.tuples().all())
+
+    async def cancel(self, db: AsyncSession, job: BatchJob) -> BatchJob:
+        """取消任务：尚未执行的请求不再领取，正在执行的请求照常完成"""
+        if job.status in ACTIVE_STATUSES:
+            job.status = 'cancelled'
+            job.finished_at = datetime.now(timezone.utc)
+            await db.flush()
+            await db.refresh(job)
+        return job
+
+    async def claim_items(self, db: AsyncSession, provider: str, limit: int, lease_seconds: float) -> list[BatchItem]:
+        """
+        领取某个供应商的待执行请求：pending 或租约已过期的 running（进程重启后恢复）
+        FOR UPDATE SKIP LOCKED 保证多个实例不会领取同一条
+        """
+        lease_expired = datetime.now(timezone.utc) - timedelta(seconds=lease_seconds)
+        claimable = (
+            select(BatchItem.id)
+            .join(BatchJob, BatchJob.id == BatchItem.job_id)
+            .where(
+                BatchJob.status.in_(ACTIVE_STATUSES),
+                BatchItem.provider == provider,
+                (BatchItem.status == 'pending') | ((BatchItem.status == 'running') & (BatchItem.started_at < lease_expired)),
+            )
+            .order_by(BatchItem.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True, of=BatchItem)
+        )
+        result = await db.execute(
+            update(BatchItem)
+            .where(BatchItem.id.in_(claimable.scalar_subquery()))
+            .values(status='running', started_at=func.now(), attempts=BatchItem.attempts + 1)
+            .returning(BatchItem)
+            .execution_options(synchronize_session=False)
+        )
+        items = list(result.scalars().all())
+
+        if items:
+            await db.execute(
+                update(BatchJob)
+                .where(BatchJob.id.in_({item.job_id for item in items}), BatchJob.status == 'pending')
+                .values(status='running')
+                .execution_options(synchronize_session=False)
+            )
+        return items
+
+    async def finish_item(
+        self,
+        db: AsyncSession,
+        item: BatchItem,
+        response: dict | None,
+        error: str | None,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        cost: float = 0.0,
+    ) -> bool:
+        """
+        回写一条请求的结果并累加到任务汇总，全部完成时把任务置为 completed
+        只有仍处于 running 的请求会被回写，重复执行（租约过期后被重新领取）不会重复计数
+        """
+        result = await db.execute(
+            update(BatchItem)
+            .where(BatchItem.id == item.id, BatchItem.status == 'running')
+            .values(status='failed' if error else 'completed', response=response, error=error)
+            .returning(BatchItem.id)
+            .execution_options(synchronize_session=False)
+        )
+        if result.scalar_one_or_none() is None:
+            return False
+
+        ok, bad = (0, 1) if error else (1, 0)
+        all_done = BatchJob.completed + BatchJob.failed + 1 >= BatchJob.total
+        await db.execute(
+            update(BatchJob)
+            .where(BatchJob.id == item.job_id)
+            .values(
+                completed=BatchJob.completed + ok,
+                failed=BatchJob.failed + bad,
+                prompt_tokens=BatchJob.prompt_tokens + prompt_tokens,
+                completion_tokens=BatchJob.completion_tokens + completion_tokens,
+                cost=BatchJob.cost + cost,
+                status=case((all_done & (BatchJob.status == 'running'), 'completed'), else_=BatchJob.status),
+                finished_at=case((all_done, func.now()), else_=BatchJob.finished_at),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        return True
+
+    async def release_items(self, db: AsyncSession, item_ids: list[int]) -> None:
+        """把未执行完的请求放回待执行（停机时调用）"""
+        if item_ids:
+            await db.execute(
+                update(BatchItem)
+                .where(BatchItem.id.in_(item_ids), BatchItem.status == 'running')
+                .values(status='pending', started_at=None)
+                .execution_options(synchronize_session=False)
+            )
+
+    async def defer_item(self, db: AsyncSession, item_id: int, delay: float, lease_seconds: float) -> None:
+        """
+        推迟一条已领取的请求（所属密钥被限流）：保持 running，把租约调到 delay 秒后过期，
+        届时由 claim_items 重新领取；本次领取不计入执行次数
+        """
+        await db.execute(
+            update(BatchItem)
+            .where(BatchItem.id == item_id, BatchItem.status == 'running')
+            .values(
+                started_at=func.now() - timedelta(seconds=max(0.0, lease_seconds - delay)),
+                attempts=BatchItem.attempts - 1,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    async def get_results(self, db: AsyncSession, job_id: int, after_id: int, limit: int) -> list[BatchItem]:
+        """按 ID 游标分页读取任务的请求结果"""
+        result = await db.execute(
+            select(BatchItem)
+            .where(BatchItem.job_id == job_id, BatchItem.id > after_id)
+            .order_by(BatchItem.id)
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+
+
+batch_job_crud = BatchJobCRUD(BatchJob)
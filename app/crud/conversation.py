@@ -5,15 +5,61 @@
 @Desc    :
 """
 
+import json
 from app.crud.base import CRUDBase
+from app.crud.usage_log import UsageLogCreate
 from app.models.conversation import Conversation
 from app.models.message import Message
 from pydantic import BaseModel
-from sqlalchemy import func, select
+from sqlalchemy import func, select, text, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 
+# 一轮对话的写入：一条语句完成（新建对话或分配序号）+ 批量插入消息 +（可选）使用记录，只需一次数据库往返
+_NEW_CONVERSATION_CTE = """
+    INSERT INTO conversations (api_key_id, title, model_name, provider, last_seq)
+    VALUES (:api_key_id, :title, :model_name, :provider, :count)
+    RETURNING id, 0 AS base
+"""
+_EXISTING_CONVERSATION_CTE = """
+    UPDATE conversations SET last_seq = last_seq + :count, updated_at = now()
+    WHERE id = :conversation_id
+    RETURNING id, last_seq - :count AS base
+"""
+_USAGE_CTE = """,
+usage AS (
+    INSERT INTO usage_logs (
+        api_key_id, conversation_id, model_name, provider, prompt_tokens, completion_tokens, total_tokens,
+        cost, response_time, extra_data
+    )
+    VALUES (
+        :api_key_id, (SELECT id FROM conv), :usage_model_name, :usage_provider, :prompt_tokens, :completion_tokens,
+        :total_tokens, :cost, :response_time, CAST(:extra_data AS json)
+    )
+)"""
+_SAVE_TURN_SQL = """
+WITH conv AS ({conversation}),
+msgs AS (
+    INSERT INTO messages (conversation_id, seq, role, content, tokens)
+    SELECT conv.id, conv.base + m.ord, m.role, m.content, m.tokens
+    FROM conv, unnest(CAST(:roles AS text[]), CAST(:contents AS text[]), CAST(:tokens AS integer[]))
+        WITH ORDINALITY AS m(role, content, tokens, ord)
+){usage}
+SELECT id FROM conv
+"""
+_SAVE_TURN = {
+    (created, with_usage): text(
+        _SAVE_TURN_SQL.format(
+            conversation=_NEW_CONVERSATION_CTE if created else _EXISTING_CONVERSATION_CTE,
+            usage=_USAGE_CTE if with_usage else '',
+        )
+    )
+    for created in (True, False)
+    for with_usage in (True, False)
+}
+
+
 class ConversationCreate(BaseModel):
     """创建对话Schema"""
 
@@ -51,24 +97,86 @@ class ConversationCRUD(CRUDBase[Conversation, ConversationCreate, BaseModel]):
         result = await db.execute(query)
         return result.scalar_one_or_none()
 
+    async def get_owned(self, db: AsyncSession, conversation_id: int, api_key_id: int) -> Conversation | None:
+        """获取属于该 API Key 的对话（不加载消息，用于归属校验）"""
+        result = await db.execute(
+            select(Conversation).where(Conversation.id == conversation_id, Conversation.api_key_id == api_key_id)
+        )
+        return result.scalar_one_or_none()
+
     async def count_by_api_key(self, db: AsyncSession, api_key_id: int) -> int:
         """统计API Key对话数"""
         result = await db.execute(select(func.count()).select_from(Conversation).where(Conversation.api_key_id == api_key_id))
         return result.scalar_one()
 
+    async def reserve_seq(self, db: AsyncSession, conversation_id: int, count: int = 1) -> int:
+        """
+        为对话的 count 条新消息分配连续序号，返回第一个序号
+        原子递增 last_seq，并发写同一对话时由行锁串行化，序号不会重复
+        """
+        result = await db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(last_seq=Conversation.last_seq + count)
+            .returning(Conversation.last_seq)
+        )
+        return result.scalar_one() - count + 1
+
     async def add_message(
-        self, db: AsyncSession, conversation_id: int, role: str, content: str, tokens: int = 0
+        self, db: AsyncSession, conversation_id: int, role: str, content: str, tokens: int = 0, seq: int | None = None
     ) -> Message:
-        """添加消息到对话"""
-        message = Message(conversation_id=conversation_id, role=role, content=content, tokens=tokens)
+        """添加消息到对话（seq 为空时自动分配序号）"""
+        if seq is None:
+            seq = await self.reserve_seq(db, conversation_id)
+        message = Message(conversation_id=conversation_id, seq=seq, role=role, content=content, tokens=tokens)
         db.add(message)
         await db.flush()
         await db.refresh(message)
         return message
 
+    async def save_turn(
+        self,
+        db: AsyncSession,
+        api_key_id: int,
+        conversation_id: int | None,
+        messages: list[tuple[str, str, int]],
+        new_conversation: ConversationCreate | None = None,
+        usage: UsageLogCreate | None = None,
+    ) -> int | None:
+        """
+        一次往返保存一轮对话，messages 为 (role, content, tokens)
+        conversation_id 为空时按 new_conversation 新建对话；usage 不为空时同时写入使用记录（conversation_id 取本轮对话）
+        返回对话ID，对话已被删除时返回 None（使用记录照常写入，conversation_id 为空）
+        """
+        roles, contents, tokens = (list(column) for column in zip(*messages))
+        params = {
+            'api_key_id': api_key_id,
+            'conversation_id': conversation_id,
+            'count': len(messages),
+            'roles': roles,
+            'contents': contents,
+            'tokens': tokens,
+        }
+        if conversation_id is None:
+            params.update(title=new_conversation.title, model_name=new_conversation.model_name, provider=new_conversation.provider)
+        if usage is not None:
+            params.update(
+                usage_model_name=usage.model_name,
+                usage_provider=usage.provider,
+                prompt_tokens=usage.prompt_tokens,
+                completion_tokens=usage.completion_tokens,
+                total_tokens=usage.total_tokens,
+                cost=usage.cost,
+                response_time=usage.response_time,
+                extra_data=json.dumps(usage.extra_data, ensure_ascii=False) if usage.extra_data is not None else None,
+            )
+
+        result = await db.execute(_SAVE_TURN[(conversation_id is None, usage is not None)], params)
+        return result.scalar_one_or_none()
+
     async def get_messages(self, db: AsyncSession, conversation_id: int, limit: int | None = None) -> list[Message]:
         """获取对话消息"""
-        query = select(Message).where(Message.conversation_id == conversation_id).order_by(Message.created_at.asc())
+        query = select(Message).where(Message.conversation_id == conversation_id).order_by(Message.seq.asc())
 
         if limit:
             query = query.limit(limit)
@@ -76,6 +184,43 @@ class ConversationCRUD(CRUDBase[Conversation, ConversationCreate, BaseModel]):
         result = await db.execute(query)
         return list(result.scalars().all())
 
+    async def get_recent_messages(
+        self, db: AsyncSession, conversation_id: int, limit: int, after_seq: int = 0
+    ) -> list[Message]:
+        """
+        获取对话中序号大于 after_seq 的最新 limit 条消息（按序号正序返回），
+        走 (conversation_id, seq) 索引的倒序范围扫描
+        """
+        result = await db.execute(
+            select(Message)
+            .where(Message.conversation_id == conversation_id, Message.seq > after_seq)
+            .order_by(Message.seq.desc())
+            .limit(limit)
+        )
+        return list(reversed(result.scalars().all()))
+
+    async def get_message(self, db: AsyncSession, conversation_id: int, seq: int) -> Message | None:
+        """按序号获取消息"""
+        result = await db.execute(select(Message).where(Message.conversation_id == conversation_id, Message.seq == seq))
+        return result.scalar_one_or_none()
+
+    async def save_summary(
+        self, db: AsyncSession, conversation_id: int, content: str, tokens: int, summarized_seq: int, summarized_tokens: int
+    ) -> Message | None:
+        """
+        保存压缩摘要消息，并记录其覆盖到的消息序号
+        对话已有覆盖范围不小于 summarized_seq 的摘要时不保存，返回 None
+        """
+        seq = await self.reserve_seq(db, conversation_id)
+        result = await db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id, Conversation.summarized_seq < summarized_seq)
+            .values(summary_seq=seq, summarized_seq=summarized_seq, summarized_tokens=summarized_tokens)
+        )
+        if result.rowcount == 0:
+            return None
+        return await self.add_message(db, conversation_id, 'summary', content, tokens, seq=seq)
+
 
 # 全局实例 - 确保这行存在！
 conversation_crud = ConversationCRUD(Conversation)
@@ -5,13 +5,23 @@
 @Desc    :
 """
 
+import json
 from app.crud.base import CRUDBase
 from app.models.usage_log import UsageLog
 from datetime import datetime, timedelta, timezone
 from pydantic import BaseModel
-from sqlalchemy import func, select
+from sqlalchemy import func, insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+# 对话压缩（摘要替代原始历史）节省的 prompt Token 数
+COMPACTION_SAVED_TOKENS = UsageLog.extra_data['compaction_saved_tokens'].as_integer()
+
+# bulk_insert 使用 COPY 时的列顺序
+_COPY_COLUMNS = (
+    'api_key_id', 'conversation_id', 'model_name', 'provider', 'prompt_tokens', 'completion_tokens', 'total_tokens',
+    'cost', 'response_time', 'extra_data', 'created_at', 'updated_at',
+)
+
 
 class UsageLogCreate(BaseModel):
     """创建使用记录Schema"""
@@ -31,6 +41,38 @@ class UsageLogCreate(BaseModel):
 class UsageLogCRUD(CRUDBase[UsageLog, UsageLogCreate, BaseModel]):
     """使用记录CRUD操作"""
 
+    async def insert(self, db: AsyncSession, obj_in: UsageLogCreate) -> None:
+        """写入一条使用记录（单条 INSERT，不回读）"""
+        await db.execute(insert(UsageLog).values(**obj_in.model_dump()))
+
+    async def bulk_insert(self, db: AsyncSession, records: list[tuple[UsageLogCreate, datetime]]) -> None:
+        """
+        批量写入使用记录，records 为 (记录, 产生时间)，产生时间写入 created_at
+        asyncpg 驱动下用 COPY，其他驱动用一条多行 INSERT
+        """
+        if db.bind.dialect.driver == 'asyncpg':
+            conn = await db.connection()
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.copy_records_to_table(
+                UsageLog.__tablename__,
+                records=[
+                    (
+                        r.api_key_id, r.conversation_id, r.model_name, r.provider, r.prompt_tokens,
+                        r.completion_tokens, r.total_tokens, r.cost, r.response_time,
+                        json.dumps(r.extra_data, ensure_ascii=False) if r.extra_data is not None else None,
+                        created_at, created_at,
+                    )
+                    for r, created_at in records
+                ],
+                columns=_COPY_COLUMNS,
+            )
+            return
+        await db.execute(
+            insert(UsageLog).values(
+                [{**r.model_dump(), 'created_at': created_at, 'updated_at': created_at} for r, created_at in records]
+            )
+        )
+
     async def get_api_key_usage(self, db: AsyncSession, api_key_id: int, days: int = 30) -> list[UsageLog]:
         """获取API Key使用记录"""
         start_date = datetime.now(timezone.utc) - timedelta(days=days)
@@ -52,6 +94,7 @@ class UsageLogCRUD(CRUDBase[UsageLog, UsageLogCreate, BaseModel]):
                 func.sum(UsageLog.cost).label('total_cost'),
                 func.count(UsageLog.id).label('request_count'),
                 func.avg(UsageLog.response_time).label('avg_response_time'),
+                func.sum(COMPACTION_SAVED_TOKENS).label('compaction_saved_tokens'),
             ).where(UsageLog.api_key_id == api_key_id, UsageLog.created_at >= start_date)
         )
 
@@ -62,6 +105,7 @@ class UsageLogCRUD(CRUDBase[UsageLog, UsageLogCreate, BaseModel]):
             'total_cost': float(row.total_cost or 0),
             'request_count': int(row.request_count or 0),
             'avg_response_time': float(row.avg_response_time or 0),
+            'compaction_saved_tokens': int(row.compaction_saved_tokens or 0),
         }
 
     async def get_api_key_model_stats(self, db: AsyncSession, api_key_id: int, days: int = 30) -> list[dict]:
@@ -101,6 +145,7 @@ class UsageLogCRUD(CRUDBase[UsageLog, UsageLogCreate, BaseModel]):
                 func.sum(UsageLog.cost).label('total_cost'),
                 func.count(UsageLog.id).label('request_count'),
                 func.avg(UsageLog.response_time).label('avg_response_time'),
+                func.sum(COMPACTION_SAVED_TOKENS).label('compaction_saved_tokens'),
             ).where(UsageLog.created_at >= start_date)
         )
 
@@ -111,6 +156,7 @@ class UsageLogCRUD(CRUDBase[UsageLog, UsageLogCreate, BaseModel]):
             'total_cost': float(row.total_cost or 0),
             'request_count': int(row.request_count or 0),
             'avg_response_time': float(row.avg_response_time or 0),
+            'compaction_saved_tokens': int(row.compaction_saved_tokens or 0),
         }
 
     async def get_global_model_stats(self, db: AsyncSession, days: int = 30) -> list[dict]:
@@ -17,7 +17,9 @@ from sqlalchemy import text
 
 log = setup_logging()
 
-from app.api.v1 import api_router
+from app.adapters.model_registry import model_registry
+from app.api.v1 import api_router, openai_router
+from app.api.v1.openai_compat import openai_error
 from app.admin.router import router as admin_router
 from app.core.config import settings
 from app.core.database import close_db, get_engine
@@ -26,6 +28,16 @@ from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from app.schemas.response import ResponseModel
+from app.services.batch_executor import batch_executor
+from app.services.chat_service import chat_service
+from app.services.compaction import conversation_compactor
+from app.services.history_cache import history_cache
+from app.services.model_list_cache import model_list_cache
+from app.services.passthrough import passthrough_service
+from app.services.response_cache import response_cache
+from app.services.similarity_cache import similarity_cache
+from app.services.singleflight import singleflight
+from app.services.usage_writer import usage_writer
 
 # ==================== 数据库健康检查 ====================
 async def check_db_connection() -> bool:
@@ -52,10 +64,31 @@ async def lifespan(app: FastAPI):
         log.critical('❌ 启动失败：无法连接数据库')
         sys.exit(1)  # 直接退出进程
 
+    # 为各供应商建立长连接池
+    await model_registry.open_all()
+    # 后台定时刷新模型列表缓存
+    model_list_cache.start()
+    # 打开响应缓存的磁盘层
+    await response_cache.open()
+    # 启动使用记录异步写入（回放上次暂存在本地文件中的记录）
+    usage_writer.start()
+    # 启动批量任务执行器（继续执行上次未完成的任务）
+    batch_executor.start()
+
     yield  # === 应用运行期间 ===
 
     # 应用关闭时
     log.info('🛑 应用关闭中...')
+    await batch_executor.stop()
+    # 等待尚未写完的使用记录（透传接口、客户端断开的流）
+    await passthrough_service.drain()
+    await chat_service.drain()
+    await conversation_compactor.drain()
+    # 写完队列中的使用记录
+    await usage_writer.stop()
+    await model_list_cache.stop()
+    await model_registry.close_all()
+    await response_cache.close()
     await close_db()
 
 
@@ -71,17 +104,27 @@ app = FastAPI(
 )
 
 # ==================== 全局异常处理 ====================
+def _is_openai_path(request: Request) -> bool:
+    """OpenAI 兼容接口的错误按 OpenAI 协议返回，方便 SDK 解析"""
+    return request.url.path.startswith('/v1/')
+
+
 @app.exception_handler(StarletteHTTPException)
 async def http_exception_handler(request: Request, exc: StarletteHTTPException):
     """处理 HTTP 异常"""
+    if _is_openai_path(request):
+        return openai_error(exc.status_code, str(exc.detail), headers=getattr(exc, 'headers', None))
     return JSONResponse(
         status_code=exc.status_code,
         content=ResponseModel.fail(code=exc.status_code, message=str(exc.detail)).model_dump(),
+        headers=getattr(exc, 'headers', None),
     )
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     """处理请求验证异常"""
+    if _is_openai_path(request):
+        return openai_error(status.HTTP_422_UNPROCESSABLE_ENTITY, str(exc.errors()))
     return JSONResponse(
         status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
         content=ResponseModel.fail(
@@ -111,6 +154,7 @@ app.add_middleware(
 
 # ==================== 注册路由 ====================
 app.include_router(api_router, prefix='/api/v1')
+app.include_router(openai_router, prefix='/v1', tags=['openai'])
 app.include_router(admin_router, prefix='/admin', tags=['admin'])
 
 
@@ -135,6 +179,17 @@ async def health_check():
         'version': settings.APP_VERSION,
         'environment': settings.ENVIRONMENT,
         'database': db_status,
+        'hedging': model_registry.hedge_stats.model_dump(),
+        'circuit_breakers': model_registry.circuit_states(),
+        'concurrency': model_registry.concurrency_states(),
+        'response_cache': response_cache.snapshot(),
+        'history_cache': history_cache.snapshot(),
+        'compaction': conversation_compactor.snapshot(),
+        'usage_writer': usage_writer.snapshot(),
+        'similarity_cache': similarity_cache.snapshot(),
+        'singleflight': singleflight.snapshot(),
+        'batch': batch_executor.snapshot(),
+        'passthrough': passthrough_service.snapshot(),
     }
 
 
@@ -7,9 +7,11 @@
 
 from app.models.api_key import APIKey
 from app.models.base import Base, BaseModel, TimestampMixin
+from app.models.batch_job import BatchItem, BatchJob
 from app.models.conversation import Conversation
 from app.models.message import Message
+from app.models.rate_limit_bucket import RateLimitBucket
 from app.models.usage_log import UsageLog
 from app.models.user import User
 
-__all__ = ['Base', 'BaseModel', 'TimestampMixin', 'User', 'APIKey', 'Conversation', 'Message', 'UsageLog']
+__all__ = ['Base', 'BaseModel', 'TimestampMixin', 'User', 'APIKey', 'Conversation', 'Message', 'UsageLog', 'RateLimitBucket', 'BatchJob', 'BatchItem']
@@ -7,7 +7,7 @@
 
 from app.models.base import BaseModel
 from datetime import datetime
-from sqlalchemy import Boolean, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import Boolean, DateTime, Float, ForeignKey, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from typing import TYPE_CHECKING
 
@@ -43,6 +43,22 @@ class APIKey(BaseModel):
 
     description: Mapped[str | None] = mapped_column(Text, nullable=True, comment='描述')
 
+    rate_limit_rpm: Mapped[int | None] = mapped_column(
+        Integer, nullable=True, comment='每分钟请求数限额，为空使用全局默认，0 表示不限'
+    )
+
+    rate_limit_tpm: Mapped[int | None] = mapped_column(
+        Integer, nullable=True, comment='每分钟 Token 数限额，为空使用全局默认，0 表示不限'
+    )
+
+    response_cache: Mapped[bool] = mapped_column(
+        Boolean, default=False, server_default='false', nullable=False, comment='是否默认使用响应缓存'
+    )
+
+    similarity_threshold: Mapped[float | None] = mapped_column(
+        Float, nullable=True, comment='近似缓存的相似度阈值，为空表示不使用近似缓存'
+    )
+
     # 关系
     user: Mapped['User'] = relationship('User', back_populates='api_keys')
     conversations: Mapped[list['Conversation']] = relationship(
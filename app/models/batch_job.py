@@ -0,0 +1,87 @@
+"""
+@File    : batch_job.py
+@Author  : Martin
+@Desc    : 批量任务模型：任务（进度与成本汇总）与任务中的每一条请求
+"""
+
+from app.models.base import BaseModel
+from datetime import datetime
+from sqlalchemy import JSON, DateTime, Float, ForeignKey, Index, Integer, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class BatchJob(BaseModel):
+    """批量任务"""
+
+    __tablename__ = 'batch_jobs'
+    __table_args__ = {'comment': '批量任务表'}
+
+    id: Mapped[int] = mapped_column(primary_key=True, index=True, comment='任务ID')
+
+    api_key_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey('api_keys.id', ondelete='CASCADE'), nullable=False, index=True, comment='API Key ID'
+    )
+
+    status: Mapped[str] = mapped_column(
+        String(20), default='pending', nullable=False, index=True,
+        comment='状态: pending/running/completed/cancelled',
+    )
+
+    total: Mapped[int] = mapped_column(Integer, default=0, nullable=False, comment='请求总数')
+
+    completed: Mapped[int] = mapped_column(Integer, default=0, nullable=False, comment='成功数')
+
+    failed: Mapped[int] = mapped_column(Integer, default=0, nullable=False, comment='失败数')
+
+    prompt_tokens: Mapped[int] = mapped_column(Integer, default=0, nullable=False, comment='输入Token数')
+
+    completion_tokens: Mapped[int] = mapped_column(Integer, default=0, nullable=False, comment='输出Token数')
+
+    cost: Mapped[float] = mapped_column(Float, default=0.0, nullable=False, comment='成本(USD)')
+
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True, comment='完成时间')
+
+    def __repr__(self) -> str:
+        return f'<BatchJob(id={self.id}, status={self.status}, {self.completed + self.failed}/{self.total})>'
+
+
+class BatchItem(BaseModel):
+    """批量任务中的一条请求"""
+
+    __tablename__ = 'batch_items'
+    __table_args__ = (
+        Index('ix_batch_items_job_line', 'job_id', 'line', unique=True),
+        Index('ix_batch_items_claim', 'provider', 'status', 'id'),
+        {'comment': '批量任务请求表'},
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, comment='请求ID')
+
+    job_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey('batch_jobs.id', ondelete='CASCADE'), nullable=False, comment='任务ID'
+    )
+
+    line: Mapped[int] = mapped_column(Integer, nullable=False, comment='在上传文件中的行号（从 1 开始）')
+
+    custom_id: Mapped[str | None] = mapped_column(String(200), nullable=True, comment='调用方自定义ID')
+
+    provider: Mapped[str] = mapped_column(String(50), nullable=False, comment='供应商')
+
+    status: Mapped[str] = mapped_column(
+        String(20), default='pending', nullable=False, comment='状态: pending/running/completed/failed'
+    )
+
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False, comment='执行次数')
+
+    started_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True, comment='最近一次开始执行的时间（租约起点）'
+    )
+
+    request: Mapped[dict] = mapped_column(JSON, nullable=False, comment='请求体')
+
+    response: Mapped[dict | None] = mapped_column(JSON, nullable=True, comment='响应体')
+
+    error: Mapped[str | None] = mapped_column(Text, nullable=True, comment='错误信息')
+
+    def __repr__(self) -> str:
+        return f'<BatchItem(id={self.id}, job_id={self.job_id}, line={self.line}, status={self.status})>'
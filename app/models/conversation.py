@@ -33,10 +33,24 @@ class Conversation(BaseModel):
 
     provider: Mapped[str] = mapped_column(String(50), nullable=False, comment='模型供应商')
 
+    last_seq: Mapped[int] = mapped_column(
+        Integer, default=0, server_default='0', nullable=False, comment='最后一条消息的序号（分配消息序号用）'
+    )
+
+    summary_seq: Mapped[int | None] = mapped_column(Integer, nullable=True, comment='最新压缩摘要消息的序号')
+
+    summarized_seq: Mapped[int] = mapped_column(
+        Integer, default=0, server_default='0', nullable=False, comment='序号不超过该值的消息已包含在摘要中'
+    )
+
+    summarized_tokens: Mapped[int] = mapped_column(
+        Integer, default=0, server_default='0', nullable=False, comment='摘要所替代的原始消息估算 Token 数'
+    )
+
     # 关系
     api_key: Mapped['APIKey'] = relationship('APIKey', back_populates='conversations')
     messages: Mapped[list['Message']] = relationship(
-        'Message', back_populates='conversation', cascade='all, delete-orphan', order_by='Message.created_at'
+        'Message', back_populates='conversation', cascade='all, delete-orphan', order_by='Message.seq'
     )
 
     def __repr__(self) -> str:
@@ -6,7 +6,7 @@
 """
 
 from app.models.base import BaseModel
-from sqlalchemy import ForeignKey, Integer, String, Text
+from sqlalchemy import ForeignKey, Index, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from typing import TYPE_CHECKING
 
@@ -18,15 +18,21 @@ class Message(BaseModel):
     """消息模型"""
 
     __tablename__ = 'messages'
-    __table_args__ = {'comment': '消息表'}
+    __table_args__ = (
+        # 历史窗口按 (conversation_id, seq DESC) 范围扫描最后 N 条，代价与对话长度无关
+        Index('ix_messages_conversation_seq', 'conversation_id', 'seq', unique=True),
+        {'comment': '消息表'},
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True, comment='消息ID')
 
     conversation_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey('conversations.id', ondelete='CASCADE'), nullable=False, index=True, comment='对话ID'
+        Integer, ForeignKey('conversations.id', ondelete='CASCADE'), nullable=False, comment='对话ID'
     )
 
-    role: Mapped[str] = mapped_column(String(20), nullable=False, comment='角色: system/user/assistant')
+    seq: Mapped[int] = mapped_column(Integer, nullable=False, comment='对话内序号（从 1 开始单调递增）')
+
+    role: Mapped[str] = mapped_column(String(20), nullable=False, comment='角色: system/user/assistant/summary（对话压缩摘要）')
 
     content: Mapped[str] = mapped_column(Text, nullable=False, comment='消息内容')
 
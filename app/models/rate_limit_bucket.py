@@ -0,0 +1,28 @@
+"""
+@File    : rate_limit_bucket.py
+@Author  : Martin
+@Desc    : 共享限流令牌桶（RATE_LIMIT_BACKEND=postgres 时使用）
+"""
+
+from app.models.base import Base
+from datetime import datetime
+from sqlalchemy import DateTime, Float, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class RateLimitBucket(Base):
+    """令牌桶状态，多个 worker 通过行锁共享"""
+
+    __tablename__ = 'rate_limit_buckets'
+    __table_args__ = {'comment': '限流令牌桶表'}
+
+    bucket: Mapped[str] = mapped_column(String(64), primary_key=True, comment='桶标识，如 rpm:1 / tpm:1')
+
+    tokens: Mapped[float] = mapped_column(Float, nullable=False, comment='当前令牌数（可为负，表示透支）')
+
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False, comment='最后补充时间'
+    )
+
+    def __repr__(self) -> str:
+        return f'<RateLimitBucket(bucket={self.bucket}, tokens={self.tokens})>'
@@ -33,6 +33,12 @@ class APIKeyUpdate(BaseModel):
     description: str | None = Field(None, description='描述')
     is_active: bool | None = Field(None, description='是否启用')
     expires_at: datetime | None = Field(None, description='过期时间')
+    rate_limit_rpm: int | None = Field(None, ge=0, description='每分钟请求数限额（仅管理员可修改），0 表示不限')
+    rate_limit_tpm: int | None = Field(None, ge=0, description='每分钟 Token 数限额（仅管理员可修改），0 表示不限')
+    response_cache: bool | None = Field(None, description='是否默认使用响应缓存（完全相同的请求直接返回缓存结果）')
+    similarity_threshold: float | None = Field(
+        None, ge=0.5, le=1.0, description='近似缓存的相似度阈值（0.5~1），相似度达到阈值的请求直接返回缓存结果'
+    )
 
 
 # 响应Schema
@@ -44,6 +50,10 @@ class APIKeyResponse(APIKeyBase):
     user_id: int
     is_active: bool
     last_used_at: datetime | None
+    rate_limit_rpm: int | None = None
+    rate_limit_tpm: int | None = None
+    response_cache: bool = False
+    similarity_threshold: float | None = None
     created_at: datetime
     updated_at: datetime
 
@@ -60,6 +70,10 @@ class APIKeyListItem(BaseModel):
     is_active: bool
     expires_at: datetime | None
     last_used_at: datetime | None
+    rate_limit_rpm: int | None = None
+    rate_limit_tpm: int | None = None
+    response_cache: bool = False
+    similarity_threshold: float | None = None
     created_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,36 @@
+"""
+@File    : batch.py
+@Author  : Martin
+@Desc    : 批量任务相关 Schema
+"""
+
+from datetime import datetime
+from pydantic import BaseModel, ConfigDict, Field, computed_field
+
+
+class BatchJobResponse(BaseModel):
+    """批量任务（进度与成本汇总）"""
+
+    id: int
+    status: str = Field(..., description='状态: pending/running/completed/cancelled')
+    total: int = Field(..., description='请求总数')
+    completed: int = Field(..., description='成功数')
+    failed: int = Field(..., description='失败数')
+    prompt_tokens: int = Field(..., description='输入Token数')
+    completion_tokens: int = Field(..., description='输出Token数')
+    cost: float = Field(..., description='成本(USD)')
+    created_at: datetime
+    finished_at: datetime | None = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+    @computed_field(description='完成进度（0~1）')
+    @property
+    def progress(self) -> float:
+        return round((self.completed + self.failed) / self.total, 4) if self.total else 1.0
+
+
+class BatchJobListResponse(BaseModel):
+    """批量任务列表"""
+
+    items: list[BatchJobResponse]
@@ -33,10 +33,12 @@ class ChatCompletionRequest(BaseModel):
     top_p: float = Field(default=1.0, ge=0, le=1, description='Top P')
     frequency_penalty: float = Field(default=0.0, ge=-2, le=2, description='频率惩罚')
     presence_penalty: float = Field(default=0.0, ge=-2, le=2, description='存在惩罚')
+    enable_thinking: bool | None = Field(default=None, description='是否开启深度思考（仅流式，阿里云 Qwen3 等模型）')
 
     # 对话相关
     conversation_id: int | None = Field(default=None, description='对话ID')
     save_conversation: bool = Field(default=True, description='是否保存对话')
+    cache: bool | None = Field(default=None, description='是否使用响应缓存，为空时按 API Key 的设置')
 
     @field_validator('provider', mode='before')
     @classmethod
@@ -79,6 +81,7 @@ class UsageInfo(BaseModel):
     prompt_tokens: int
     completion_tokens: int
     total_tokens: int
+    cached_tokens: int | None = Field(default=None, description='命中上游缓存的输入Token数')
 
     # OpenAI 新增字段
     completion_tokens_details: CompletionTokensDetails | None = None
@@ -99,6 +102,8 @@ class ChatCompletionResponse(BaseModel):
     usage: UsageInfo = Field(..., description='Token使用情况')
     cost: float = Field(..., description='成本(USD)')
     response_time: float = Field(..., description='响应时间(秒)')
+    fallback_hop: int = Field(default=0, description='故障转移跳数，0 表示由主路由完成')
+    cached: bool = Field(default=False, description='是否命中响应缓存')
     created_at: datetime = Field(..., description='创建时间')
 
 
@@ -128,8 +133,20 @@ class ConversationListResponse(BaseModel):
     items: list[ConversationResponse]
 
 
+class ModelInfo(BaseModel):
+    """模型目录信息"""
+
+    id: str
+    context_length: int | None = Field(default=None, description='上下文长度')
+    max_output_tokens: int | None = Field(default=None, description='最大输出Token数')
+    modalities: list[str] = Field(default_factory=list, description='支持的输入模态')
+    prompt_price: float = Field(default=0.0, description='输入价格(USD/1K Token)')
+    completion_price: float = Field(default=0.0, description='输出价格(USD/1K Token)')
+
+
 class AvailableModelsResponse(BaseModel):
     """可用模型响应"""
 
     provider: str
     models: list[str]
+    details: list[ModelInfo] = Field(default_factory=list, description='模型目录中收录的模型详情')
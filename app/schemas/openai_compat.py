@@ -0,0 +1,51 @@
+"""
+@File    : openai_compat.py
+@Author  : Martin
+@Desc    : OpenAI 兼容接口（/v1）的 Schemas：请求体按 OpenAI 协议接收，未声明的字段原样透传给上游
+"""
+
+from app.core.enums import ModelProvider
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Any
+
+# 模型名中供应商与模型的分隔符：deepseek/deepseek-chat
+MODEL_SEPARATOR = '/'
+
+
+class OpenAIChatCompletionRequest(BaseModel):
+    """OpenAI 协议的聊天请求，model 形如 `<provider>/<model>`"""
+
+    model_config = ConfigDict(extra='allow')
+
+    model: str = Field(..., description='模型，格式为 供应商/模型名，如 deepseek/deepseek-chat')
+    messages: list[dict[str, Any]] = Field(..., min_length=1, description='消息列表（OpenAI 格式）')
+    stream: bool = Field(default=False, description='是否流式响应')
+
+    def target(self) -> tuple[ModelProvider, str]:
+        """拆分出 (供应商, 上游模型名)；模型名本身可以带 /（如 Qwen/Qwen2.5-7B-Instruct）"""
+        provider, _, model = self.model.partition(MODEL_SEPARATOR)
+        if model and provider.lower() in {p.value for p in ModelProvider}:
+            return ModelProvider(provider.lower()), model
+        available = [p.value for p in ModelProvider]
+        raise ValueError(f"Model must be '<provider>/<model>', provider one of {available}")
+
+    def max_output_tokens(self) -> int | None:
+        """请求的最大输出 Token 数（兼容新旧两个字段名）"""
+        extra = self.model_extra or {}
+        return extra.get('max_completion_tokens') or extra.get('max_tokens')
+
+
+class OpenAIModel(BaseModel):
+    """OpenAI 协议的模型条目"""
+
+    id: str
+    object: str = 'model'
+    created: int = 0
+    owned_by: str
+
+
+class OpenAIModelList(BaseModel):
+    """OpenAI 协议的模型列表"""
+
+    object: str = 'list'
+    data: list[OpenAIModel]
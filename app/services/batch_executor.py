@@ -0,0 +1,187 @@
+"""
+@File    : batch_executor.py
+@Author  : Martin
+@Desc    : 批量任务后台执行器：按供应商限并发、让路交互请求、租约领取（重启后可恢复）
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from app.adapters.model_registry import model_registry
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.enums import ModelProvider
+from app.crud.api_key import api_key_crud
+from app.crud.batch_job import batch_job_crud
+from app.models.batch_job import BatchItem
+from app.schemas.chat import ChatCompletionRequest
+from app.services.chat_service import chat_service
+from app.services.rate_limiter import rate_limiter
+
+log = logging.getLogger('app')
+
+
+class BatchExecutor:
+    """
+    后台批量任务执行器
+    - 按供应商领取待执行请求，每个供应商最多 BATCH_PROVIDER_CONCURRENCY 条同时执行
+    - 优先级低于交互请求：供应商限流器有排队时暂停派发，且最多占用其限额的 BATCH_LIMITER_SHARE
+    - 领取带租约，进程崩溃后过期的请求会被重新领取；正常停机时未完成的请求立即放回
+    """
+
+    def __init__(self):
+        self._runner: asyncio.Task | None = None
+        self._tasks: dict[int, asyncio.Task] = {}  # 请求ID -> 执行任务
+        self._running: dict[ModelProvider, int] = defaultdict(int)
+        self._wakeup = asyncio.Event()
+
+    def notify(self) -> None:
+        """有新任务或空出名额时唤醒派发循环"""
+        self._wakeup.set()
+
+    def _headroom(self, provider: ModelProvider) -> int:
+        """该供应商当前还能派发的批量请求数"""
+        running = self._running[provider]
+        room = settings.BATCH_PROVIDER_CONCURRENCY - running
+        try:
+            limiter = model_registry.get_adapter(provider).limiter
+        except ValueError:
+            # 未配置的供应商照常派发，请求会以错误结束而不是一直挂起
+            return room
+        if limiter.queue_depth:
+            return 0
+        share = max(1, int(limiter.limit * settings.BATCH_LIMITER_SHARE)) - running
+        free = int(limiter.limit) - limiter.inflight
+        return max(0, min(room, share, free))
+
+    async def _dispatch(self) -> int:
+        """按供应商领取并启动请求，返回本轮启动的数量"""
+        started = 0
+        for provider in ModelProvider:
+            limit = self._headroom(provider)
+            if limit <= 0:
+                continue
+            async with AsyncSessionLocal() as db:
+                items = await batch_job_crud.claim_items(db, provider.value, limit, settings.BATCH_ITEM_LEASE)
+                owners = await batch_job_crud.owners(db, {item.job_id for item in items}) if items else {}
+                await db.commit()
+            for item in items:
+                self._running[provider] += 1
+                self._tasks[item.id] = asyncio.create_task(self._execute(provider, item, owners[item.job_id]))
+            started += len(items)
+        return started
+
+    async def _execute(self, provider: ModelProvider, item: BatchItem, api_key_id: int) -> None:
+        """
+        执行一条请求并回写结果，按所属密钥与交互请求同样处理：
+        - 执行前重新读取密钥，已停用或过期时请求直接失败
+        - 与交互请求共用该密钥的 RPM/TPM 限额，超限时推迟到限额恢复后重新领取；
+          实际 Token 用量在 chat_service 记账时经 rate_limiter.charge_tokens 扣减
+        - 缓存默认值与交互请求一致（未指定时沿用密钥的设置）
+        """
+        try:
+            async with AsyncSessionLocal() as db:
+                api_key = await api_key_crud.get_active_by_id(db, api_key_id)
+                if api_key is not None:
+                    admission = await rate_limiter.check(api_key)
+                    if not admission.allowed:
+                        await batch_job_crud.defer_item(db, item.id, admission.retry_after, settings.BATCH_ITEM_LEASE)
+                        await db.commit()
+                        return
+
+                response, error = None, None
+                try:
+                    if api_key is None:
+                        raise ValueError('API key is inactive or expired')
+                    request = ChatCompletionRequest.model_validate(item.request)
+                    response = await chat_service.chat(
+                        db=db,
+                        api_key_id=api_key.id,
+                        provider=request.provider,
+                        model=request.model,
+                        messages=request.messages,
+                        conversation_id=request.conversation_id,
+                        save_conversation=request.save_conversation,
+                        temperature=request.temperature,
+                        max_tokens=request.max_tokens,
+                        top_p=request.top_p,
+                        frequency_penalty=request.frequency_penalty,
+                        presence_penalty=request.presence_penalty,
+                        cache=request.cache if request.cache is not None else api_key.response_cache,
+                        similarity_threshold=api_key.similarity_threshold,
+                    )
+                except Exception as e:
+                    await db.rollback()
+                    error = str(e) or type(e).__name__
+                    log.warning(f'Batch item {item.id} (job {item.job_id}, line {item.line}) failed: {error}')
+
+                usage = (response or {}).get('usage') or {}
+                await batch_job_crud.finish_item(
+                    db,
+                    item,
+                    response,
+                    error,
+                    prompt_tokens=usage.get('prompt_tokens', 0),
+                    completion_tokens=usage.get('completion_tokens', 0),
+                    cost=(response or {}).get('cost', 0.0),
+                )
+                await db.commit()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 回写失败时请求保持 running，租约过期后重新执行
+            log.error(f'Failed to record batch item {item.id}: {e}')
+        finally:
+            self._running[provider] -= 1
+            self._tasks.pop(item.id, None)
+            self.notify()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                started = await self._dispatch()
+            except Exception as e:
+                log.error(f'Batch dispatch failed: {e}')
+                started = 0
+            if started:
+                continue
+            try:
+                async with asyncio.timeout(settings.BATCH_POLL_INTERVAL):
+                    await self._wakeup.wait()
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self) -> None:
+        """启动派发循环（应用启动时调用）"""
+        if settings.BATCH_ENABLED and self._runner is None:
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止派发，取消正在执行的请求并放回待执行，下次启动时继续"""
+        if self._runner is None:
+            return
+        unfinished = list(self._tasks)
+        tasks = [self._runner, *self._tasks.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._runner = None
+
+        try:
+            async with AsyncSessionLocal() as db:
+                await batch_job_crud.release_items(db, unfinished)
+                await db.commit()
+        except Exception as e:
+            log.error(f'Failed to release batch items {unfinished}: {e}')
+
+    def snapshot(self) -> dict:
+        """执行器状态，用于健康检查"""
+        return {
+            'enabled': self._runner is not None,
+            'running': {provider.value: count for provider, count in self._running.items() if count},
+        }
+
+
+# 全局实例
+batch_executor = BatchExecutor()
@@ -5,25 +5,45 @@
 @Desc    : 支持流式和非流式聊天的服务
 """
 
+import asyncio
 import time
 import json
-from app.adapters.base import BaseLLMAdapter, ChatMessage, ChatRequest, inject_system_prompt
-from app.adapters.model_registry import model_registry
+import uuid
+from app.adapters.base import ChatMessage, ChatRequest, ChatResponse, inject_system_prompt
+from app.adapters.model_registry import ChatRoute, PrefetchedStream, model_registry
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
 from app.core.enums import ModelProvider
+from app.core.model_catalog import model_catalog
+from app.core.tokens import estimate_messages_tokens, estimate_tokens
 from app.crud.conversation import ConversationCreate, conversation_crud
-from app.crud.usage_log import UsageLogCreate, usage_log_crud
+from app.crud.usage_log import UsageLogCreate
 import logging
-from app.models.conversation import Conversation
 from app.schemas.chat import ChatMessageRequest
-from collections.abc import AsyncGenerator
+from app.services.compaction import SUMMARY_ROLE, conversation_compactor, summary_message
+from app.services.history_cache import HistoryWindow, history_cache
+from app.services.history_window import history_budget, select_history
+from app.services.rate_limiter import rate_limiter
+from app.services.response_cache import CachedResponse, response_cache
+from app.services.similarity_cache import similarity_cache
+from app.services.singleflight import StreamSubscription, singleflight
+from app.services.usage_writer import usage_writer
+from collections.abc import AsyncGenerator, Coroutine
 from sqlalchemy.ext.asyncio import AsyncSession
 
 log = logging.getLogger("app")
 
+# 客户端中途断开时记录的结束原因
+CLIENT_DISCONNECTED = 'client_disconnected'
+
 
 class ChatService:
     """聊天服务"""
 
+    def __init__(self):
+        # 客户端断开后在后台保存部分结果的任务
+        self._background: set[asyncio.Task] = set()
+
     def _content_to_storage(self, content) -> str:
         if isinstance(content, str):
             return content
@@ -124,32 +144,22 @@ class ChatService:
         if provider is None:
             raise ValueError('Provider must be specified')
 
-        # 2. 获取适配器
-        adapter: BaseLLMAdapter = model_registry.get_adapter(provider)
-
-        # 3. ✅ 转换消息格式为适配器需要的 ChatMessage
+        # 2. ✅ 转换消息格式为适配器需要的 ChatMessage
         chat_messages = self._convert_to_chat_messages(messages)
 
-        # 4. 如果有 conversation_id，加载历史消息
+        # 4. 如果有 conversation_id，按 Token 预算加载最近的历史消息
         if conversation_id:
-            conversation = await conversation_crud.get_with_messages(db, conversation_id, api_key_id)
-            if not conversation:
-                raise ValueError('Conversation not found')
-
-            # 验证 provider 是否一致
-            if conversation.provider != provider.value:
-                log.warning(f'Provider mismatch: conversation={conversation.provider}, request={provider.value}')
-
-            # 获取历史消息
-            history_messages = await conversation_crud.get_messages(db, conversation_id, limit=10)
-            historical = [ChatMessage(role=msg.role, content=self._content_from_storage(msg.content)) for msg in history_messages]
+            historical, saved_tokens = await self._load_history(
+                db, api_key_id, conversation_id, provider, model, chat_messages, kwargs.get('max_tokens')
+            )
             all_messages = historical + chat_messages  # ← 都是 ChatMessage 类型
         else:
             all_messages = chat_messages
-            conversation = None
+            saved_tokens = 0
 
         # 注入系统提示词
         request_msg = inject_system_prompt(all_messages)
+        model_catalog.preflight(provider, model, request_msg, kwargs.get('max_tokens'))
 
         # 5. 构建适配器请求（all_messages 已经是 List[ChatMessage]）
         chat_request = ChatRequest(
@@ -163,45 +173,59 @@ class ChatService:
             presence_penalty=kwargs.get('presence_penalty', 0.0),
         )
 
-        # 6. 调用 AI 模型
+        # 命中响应缓存时不调用上游
+        cache_key = self._cache_key(api_key_id, provider, chat_request, kwargs.get('cache'))
+        threshold = kwargs.get('similarity_threshold')
+        cached, cache_extra = await self._lookup_cache(api_key_id, provider, chat_request, cache_key, threshold)
+        if cached is not None:
+            response_time = time.time() - start_time
+            conversation_id = await self._record_cached(
+                db, api_key_id, conversation_id, chat_messages, provider, model, cached, cache_extra,
+                response_time, save_conversation,
+            )
+            return {
+                'id': f'cached-{uuid.uuid4().hex}',
+                'conversation_id': conversation_id,
+                'model': cached.model,
+                'provider': cached.provider,
+                'content': cached.content,
+                'finish_reason': cached.finish_reason,
+                'usage': cached.usage,
+                'cost': 0.0,
+                'response_time': response_time,
+                'fallback_hop': 0,
+                'cached': True,
+            }
+
+        # 6. 调用 AI 模型（按故障转移链路由，相同的进行中请求合并为一次）
         try:
-            response = await adapter.chat(chat_request)
+            route, response, coalesced = await self._chat_upstream(
+                provider, chat_request, self._flight_key(api_key_id, provider, chat_request, kwargs.get('cache'))
+            )
         except Exception as e:
             log.error(f'AI model error: {str(e)}', exc_info=True)
             raise
 
+        if response.content and not coalesced:
+            await self._store_cache(api_key_id, provider, chat_request, cache_key, threshold, CachedResponse(
+                route.provider.value, route.model, response.content, response.finish_reason, response.usage
+            ))
+
         # 7. 计算响应时间
         response_time = time.time() - start_time
 
-        # 8. 计算成本
-        cost = adapter.calculate_cost(response.usage, model)
-
-        # 9. 保存对话
-        if save_conversation:
-            if not conversation:
-                conversation = await self._create_conversation(
-                    db, api_key_id, model, provider, self._content_preview(chat_messages[0].content)
-                )
-
-            # 保存用户消息
-            for msg in chat_messages:
-                await conversation_crud.add_message(db, conversation.id, msg.role, self._content_to_storage(msg.content))
-
-            # 保存 AI 响应
-            await conversation_crud.add_message(
-                db, conversation.id, 'assistant', response.content, response.usage['completion_tokens']
-            )
+        # 8. 计算成本（按实际服务的路由计价）
+        usage, cost, extra_data = self._billing(
+            route, response.usage, self.route_extra(route, provider, model, saved_tokens), coalesced
+        )
 
-        # 10. 记录使用情况
-        await self._log_usage(
+        # 9. 保存对话并记录使用情况（一次数据库往返）
+        conversation_id = await self._save_turn(
             db,
-            api_key_id,
-            conversation.id if conversation else None,
-            model,
-            provider.value,
-            response.usage,
-            cost,
-            response_time,
+            self._usage_record(
+                api_key_id, conversation_id, route.model, route.provider.value, usage, cost, response_time, extra_data
+            ),
+            provider, model, chat_messages, response.content, response.usage['completion_tokens'], save_conversation,
         )
 
         # 11. 提交事务
@@ -210,7 +234,7 @@ class ChatService:
         # 12. 返回结果
         return {
             'id': response.id,
-            'conversation_id': conversation.id if conversation else None,
+            'conversation_id': conversation_id,
             'model': response.model,
             'provider': response.provider.value,
             'content': response.content,
@@ -218,6 +242,7 @@ class ChatService:
             'usage': response.usage,
             'cost': cost,
             'response_time': response_time,
+            'fallback_hop': route.hop,
         }
 
     def _chat_stream(
@@ -239,33 +264,29 @@ class ChatService:
 
         async def _stream_generator():
             """真正的异步生成器"""
+            nonlocal conversation_id  # 新建对话时回填
             start_time = time.time()
 
             # 1. 确定 provider
             if provider is None:
                 raise ValueError('Provider must be specified')
 
-            # 2. 获取适配器
-            adapter: BaseLLMAdapter = model_registry.get_adapter(provider)
-
-            # 3. ✅ 转换消息格式
+            # 2. ✅ 转换消息格式
             chat_messages = self._convert_to_chat_messages(messages)
 
-            # 4. 加载历史消息（如果有）
+            # 4. 按 Token 预算加载最近的历史消息（如果有）
             if conversation_id:
-                conversation = await conversation_crud.get_with_messages(db, conversation_id, api_key_id)
-                if not conversation:
-                    raise ValueError('Conversation not found')
-
-                history_messages = await conversation_crud.get_messages(db, conversation_id, limit=10)
-                historical = [ChatMessage(role=msg.role, content=msg.content) for msg in history_messages]
+                historical, saved_tokens = await self._load_history(
+                    db, api_key_id, conversation_id, provider, model, chat_messages, kwargs.get('max_tokens')
+                )
                 all_messages = historical + chat_messages
             else:
                 all_messages = chat_messages
-                conversation = None
+                saved_tokens = 0
 
             # 5. 注入系统提示词
             request_msg = inject_system_prompt(all_messages)
+            model_catalog.preflight(provider, model, request_msg, kwargs.get('max_tokens'))
 
             # 6. ✅ 构建请求
             chat_request = ChatRequest(
@@ -277,73 +298,118 @@ class ChatService:
                 top_p=kwargs.get('top_p', 1.0),
                 frequency_penalty=kwargs.get('frequency_penalty', 0.0),
                 presence_penalty=kwargs.get('presence_penalty', 0.0),
+                enable_thinking=kwargs.get('enable_thinking'),
             )
 
+            # 命中响应缓存时按 SSE 一次性回放缓存内容；先保存对话与使用记录再发送，客户端收到后断开也不会丢失
+            cache_key = self._cache_key(api_key_id, provider, chat_request, kwargs.get('cache'))
+            threshold = kwargs.get('similarity_threshold')
+            cached, cache_extra = await self._lookup_cache(api_key_id, provider, chat_request, cache_key, threshold)
+            if cached is not None:
+                conversation_id = await self._record_cached(
+                    db, api_key_id, conversation_id, chat_messages, provider, model, cached, cache_extra,
+                    time.time() - start_time, save_conversation,
+                )
+                yield {
+                    'id': f'cached-{uuid.uuid4().hex}',
+                    'conversation_id': conversation_id,
+                    'model': cached.model,
+                    'provider': cached.provider,
+                    'fallback_hop': 0,
+                    'content': cached.content,
+                    'reasoning_content': None,
+                    'finish_reason': cached.finish_reason,
+                    'usage': cached.usage,
+                    'cached': True,
+                }
+                return
+
             # 7. 流式调用
             full_content = ''
             finish_reason = None
             usage = None
+            route = None
+            stream = None
+            coalesced = False
 
             try:
-                async for chunk in adapter.chat_stream(chat_request):
+                # 首个块返回前可故障转移到下一跳；相同的进行中请求订阅同一路流
+                route, stream, coalesced = await self._open_upstream(
+                    provider, chat_request, self._flight_key(api_key_id, provider, chat_request, kwargs.get('cache'))
+                )
+                async for chunk in stream:
                     if chunk.content:
                         full_content += chunk.content
 
                     if chunk.finish_reason:
                         finish_reason = chunk.finish_reason
 
-                    # 捕获最终的 usage 信息
-                    if hasattr(chunk, 'usage') and chunk.usage:
+                    # 捕获 usage（通常在最后一个块）
+                    if chunk.usage:
                         usage = chunk.usage
 
                     # 流式返回每个 chunk
                     yield {
                         'id': getattr(chunk, 'id', None),
-                        'model': chunk.model if hasattr(chunk, 'model') else model,
-                        'provider': chunk.provider.value if hasattr(chunk, 'provider') else provider.value,
+                        'model': route.model,
+                        'provider': route.provider.value,
+                        'fallback_hop': route.hop,
                         'content': chunk.content,
+                        'reasoning_content': chunk.reasoning_content,
                         'finish_reason': chunk.finish_reason,
                         'usage': usage,
                     }
 
             except Exception as e:
                 log.error(f'Streaming error: {str(e)}', exc_info=True)
+                # 流中途失败：按已生成的内容记录部分用量，保证计费可见（合并的 follower 不重复计费）
+                if full_content and not coalesced:
+                    await self._log_partial_usage(
+                        db, api_key_id, conversation_id, route, request_msg, full_content, usage,
+                        time.time() - start_time, e, self.route_extra(route, provider, model),
+                    )
                 raise
+            except (asyncio.CancelledError, GeneratorExit):
+                # 客户端断开（任务被取消或生成器被关闭）：上游流在 finally 中立即关闭，
+                # 部分回复与用量在后台任务中用独立会话保存（当前任务处于取消状态，不能再等待数据库）
+                if route is not None:
+                    log.info(f'Client disconnected, upstream stream cancelled ({len(full_content)} chars generated)')
+                    self._spawn(self._record_disconnected(
+                        api_key_id, conversation_id, provider, model, route,
+                        chat_messages, request_msg, full_content, usage, time.time() - start_time,
+                        save_conversation, coalesced,
+                    ))
+                raise
+            finally:
+                # 及时关闭上游流，归还连接与并发名额；shield 保证取消状态下也能完整关闭
+                if stream is not None:
+                    await asyncio.shield(stream.aclose())
 
             # 8. 计算响应时间
             response_time = time.time() - start_time
 
-            # 9. 保存对话（流式模式下）
-            if save_conversation:
-                if not conversation:
-                    conversation = await self._create_conversation(
-                        db, api_key_id, model, provider, self._content_preview(chat_messages[0].content)
-                    )
-
-                # 保存用户消息
-                for msg in chat_messages:
-                    await conversation_crud.add_message(db, conversation.id, msg.role, self._content_to_storage(msg.content))
-
-                # 保存 AI 完整响应
-                completion_tokens = 0
-                if usage:
-                    completion_tokens = usage.get('completion_tokens', 0)
-
-                await conversation_crud.add_message(db, conversation.id, 'assistant', full_content, completion_tokens)
-
-            # 10. 记录使用情况
-            if usage:
-                cost = adapter.calculate_cost(usage, model)
-                await self._log_usage(
-                    db,
-                    api_key_id,
-                    conversation.id if conversation else None,
-                    model,
-                    provider.value,
-                    usage,
-                    cost,
-                    response_time,
-                )
+            # 上游未返回 usage 时使用本地估算
+            extra_data = self.route_extra(route, provider, model, saved_tokens)
+            if not usage:
+                usage = self.estimate_usage(request_msg, full_content)
+                extra_data['usage_estimated'] = True
+
+            # 只缓存正常结束的完整回复
+            if full_content and finish_reason and not coalesced:
+                await self._store_cache(api_key_id, provider, chat_request, cache_key, threshold, CachedResponse(
+                    route.provider.value, route.model, full_content, finish_reason, usage
+                ))
+
+            # 9. 保存对话并记录使用情况（按实际服务的路由记录，一次数据库往返）
+            billed_usage, cost, extra_data = self._billing(route, usage, extra_data, coalesced)
+            conversation_id = await self._save_turn(
+                db,
+                self._usage_record(
+                    api_key_id, conversation_id, route.model, route.provider.value, billed_usage, cost, response_time,
+                    extra_data,
+                ),
+                provider, model, chat_messages, full_content, usage.get('completion_tokens', 0), save_conversation,
+            )
 
             # 11. 提交事务
             await db.commit()
@@ -385,21 +451,319 @@ class ChatService:
 
         return chat_messages
 
-    async def _create_conversation(
-        self, db: AsyncSession, api_key_id: int, model: str, provider: ModelProvider, title: str
-    ) -> Conversation:
-        """创建新对话"""
-        conversation_data = ConversationCreate(
-            api_key_id=api_key_id, title=title or 'New Conversation', model_name=model, provider=provider.value
+    async def _load_history(
+        self,
+        db: AsyncSession,
+        api_key_id: int,
+        conversation_id: int,
+        provider: ModelProvider,
+        model: str,
+        chat_messages: list[ChatMessage],
+        max_tokens: int | None,
+    ) -> tuple[list[ChatMessage], int]:
+        """
+        加载历史窗口：从最新消息往前装入不超过预算的完整轮次，
+        预算为模型上下文长度减去输出预留、系统提示词与本轮消息
+        对话被压缩过时窗口为 摘要 + 摘要之后的消息；返回 (历史消息, 摘要节省的 Token 数)
+        命中历史缓存时不查询数据库（缓存键含 api_key_id，命中即已通过归属校验）
+        """
+        window = history_cache.get(api_key_id, conversation_id)
+        if window is None:
+            window = await self._read_history(db, api_key_id, conversation_id)
+            history_cache.put(
+                api_key_id, conversation_id, HistoryWindow(window.provider, list(window.messages), window.saved_tokens)
+            )
+
+        # 验证 provider 是否一致
+        if window.provider != provider.value:
+            log.warning(f'Provider mismatch: conversation={window.provider}, request={provider.value}')
+
+        conversation_compactor.maybe_compact(api_key_id, conversation_id, provider, model, window.messages)
+        budget = history_budget(provider, model, max_tokens, inject_system_prompt(chat_messages))
+        return select_history(window.messages, budget), window.saved_tokens
+
+    async def _read_history(self, db: AsyncSession, api_key_id: int, conversation_id: int) -> HistoryWindow:
+        """从数据库读取历史窗口：最新摘要（如有）+ 摘要之后最近的 HISTORY_MAX_MESSAGES 条消息"""
+        conversation = await conversation_crud.get_owned(db, conversation_id, api_key_id)
+        if not conversation:
+            raise ValueError('Conversation not found')
+
+        rows = await conversation_crud.get_recent_messages(
+            db, conversation_id, settings.HISTORY_MAX_MESSAGES, conversation.summarized_seq
+        )
+        history = [
+            ChatMessage(role=msg.role, content=self._content_from_storage(msg.content))
+            for msg in rows
+            if msg.role != SUMMARY_ROLE
+        ]
+        saved_tokens = 0
+        if conversation.summary_seq:
+            summary = await conversation_crud.get_message(db, conversation_id, conversation.summary_seq)
+            if summary is not None:
+                history.insert(0, summary_message(summary.content))
+                saved_tokens = max(0, conversation.summarized_tokens - summary.tokens)
+        return HistoryWindow(conversation.provider, history, saved_tokens)
+
+    async def _save_turn(
+        self,
+        db: AsyncSession,
+        record: UsageLogCreate,
+        provider: ModelProvider,
+        model: str,
+        chat_messages: list[ChatMessage],
+        content: str,
+        completion_tokens: int,
+        save_conversation: bool,
+    ) -> int | None:
+        """
+        一次数据库往返写入本轮：新建对话（没有对话时）、本轮消息与 AI 回复，使用记录交给异步写入
+        （未启用时随本轮一起写入）；不保存对话时只写使用记录。消息在提交后追加到历史缓存；返回对话 ID
+        """
+        conversation_id = record.conversation_id
+        write_behind = usage_writer.running
+        if save_conversation:
+            created = not conversation_id
+            new_conversation = None
+            if created:
+                title = self._content_preview(chat_messages[0].content) or 'New Conversation'
+                new_conversation = ConversationCreate(
+                    api_key_id=record.api_key_id, title=title, model_name=model, provider=provider.value
+                )
+            messages = [(msg.role, self._content_to_storage(msg.content), 0) for msg in chat_messages]
+            messages.append(('assistant', content, completion_tokens))
+            conversation_id = await conversation_crud.save_turn(
+                db, record.api_key_id, conversation_id or None, messages, new_conversation,
+                None if write_behind else record,
+            )
+            record.conversation_id = conversation_id
+            if conversation_id is not None:
+                history_cache.stage(
+                    db, record.api_key_id, conversation_id, provider.value,
+                    [*chat_messages, ChatMessage(role='assistant', content=content)], created,
+                )
+        if write_behind or not save_conversation:
+            await usage_writer.submit(db, record)
+
+        # 按实际用量扣减该密钥的 Token 限额
+        await rate_limiter.charge_tokens(record.api_key_id, record.total_tokens)
+        return conversation_id
+
+    def estimate_usage(self, request_messages: list[ChatMessage], completion: str) -> dict[str, int]:
+        """上游未返回 usage 时，用本地估算补齐"""
+        prompt_tokens = estimate_messages_tokens(request_messages)
+        completion_tokens = estimate_tokens(completion)
+        return {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        }
+
+    async def _chat_upstream(
+        self, provider: ModelProvider, chat_request: ChatRequest, flight_key: str | None
+    ) -> tuple[ChatRoute, ChatResponse, bool]:
+        """非流式上游调用，flight_key 不为空时与相同的进行中请求共享结果；返回 (路由, 回复, 是否为合并的 follower)"""
+        if flight_key is None:
+            route, response = await model_registry.chat_with_failover(provider, chat_request)
+            return route, response, False
+        (route, response), coalesced = await singleflight.call(
+            flight_key, lambda: model_registry.chat_with_failover(provider, chat_request)
         )
+        return route, response, coalesced
+
+    async def _open_upstream(
+        self, provider: ModelProvider, chat_request: ChatRequest, flight_key: str | None
+    ) -> tuple[ChatRoute, PrefetchedStream | StreamSubscription, bool]:
+        """打开上游流，flight_key 不为空时订阅相同的进行中请求；返回 (路由, 流, 是否为合并的 follower)"""
+        if flight_key is None:
+            route, stream = await model_registry.open_stream(provider, chat_request)
+            return route, stream, False
+        return await singleflight.open_stream(flight_key, lambda: model_registry.open_stream(provider, chat_request))
+
+    @staticmethod
+    def _flight_key(
+        api_key_id: int, provider: ModelProvider, chat_request: ChatRequest, use_cache: bool | None
+    ) -> str | None:
+        """
+        请求合并的键：只合并开启了响应缓存的请求（已接受相同请求复用同一回复），且只在同一 API Key 内合并；
+        未开启时返回 None
+        """
+        if not settings.SINGLEFLIGHT_ENABLED or not use_cache:
+            return None
+        return response_cache.make_key(api_key_id, provider, chat_request)
+
+    def _billing(self, route: ChatRoute, usage: dict, extra_data: dict, coalesced: bool) -> tuple[dict, float, dict]:
+        """
+        计费用量与成本：合并的 follower 没有产生上游调用，记录零 Token、零成本，
+        原始用量放在 extra_data.coalesced_usage
+        """
+        if coalesced:
+            return {}, 0.0, {**extra_data, 'coalesced': True, 'coalesced_usage': usage}
+        return usage, route.adapter.calculate_cost(usage, route.model), extra_data
+
+    def _cache_key(
+        self, api_key_id: int, provider: ModelProvider, chat_request: ChatRequest, use_cache: bool | None
+    ) -> str | None:
+        """开启响应缓存时返回缓存键"""
+        if not use_cache or not response_cache.enabled:
+            return None
+        return response_cache.make_key(api_key_id, provider, chat_request)
+
+    async def _lookup_cache(
+        self,
+        api_key_id: int,
+        provider: ModelProvider,
+        chat_request: ChatRequest,
+        cache_key: str | None,
+        threshold: float | None,
+    ) -> tuple[CachedResponse | None, dict]:
+        """先查完全相同的响应缓存，再按相似度阈值查近似缓存；返回命中的回复与使用记录的标记"""
+        if cache_key is not None:
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                return cached, {'cached': True}
+        if threshold and similarity_cache.enabled:
+            found = similarity_cache.get(api_key_id, provider, chat_request, threshold)
+            if found is not None:
+                similarity, cached = found
+                return cached, {'cached': True, 'similarity': round(similarity, 4)}
+        return None, {}
+
+    async def _store_cache(
+        self,
+        api_key_id: int,
+        provider: ModelProvider,
+        chat_request: ChatRequest,
+        cache_key: str | None,
+        threshold: float | None,
+        value: CachedResponse,
+    ) -> None:
+        """把上游回复写入已开启的缓存"""
+        if cache_key is not None:
+            await response_cache.put(cache_key, value)
+        if threshold and similarity_cache.enabled:
+            similarity_cache.put(api_key_id, provider, chat_request, value)
+
+    async def _record_cached(
+        self,
+        db: AsyncSession,
+        api_key_id: int,
+        conversation_id: int | None,
+        chat_messages: list[ChatMessage],
+        provider: ModelProvider,
+        model: str,
+        cached: CachedResponse,
+        cache_extra: dict,
+        response_time: float,
+        save_conversation: bool,
+    ) -> int | None:
+        """缓存命中：照常保存对话，并记录一条零成本、不占 Token 额度的使用记录；返回对话 ID"""
+        conversation_id = await self._save_turn(
+            db,
+            self._usage_record(
+                api_key_id, conversation_id, cached.model, cached.provider, {}, 0.0, response_time,
+                {**cache_extra, 'cached_usage': cached.usage},
+            ),
+            provider, model, chat_messages, cached.content, cached.usage.get('completion_tokens', 0), save_conversation,
+        )
+        await db.commit()
+        return conversation_id
+
+    async def _record_disconnected(
+        self,
+        api_key_id: int,
+        conversation_id: int | None,
+        provider: ModelProvider,
+        model: str,
+        route: ChatRoute,
+        chat_messages: list[ChatMessage],
+        request_messages: list[ChatMessage],
+        partial_content: str,
+        usage: dict | None,
+        response_time: float,
+        save_conversation: bool,
+        coalesced: bool,
+    ) -> None:
+        """客户端中途断开：保存已生成的部分回复，并按部分用量记录（finish_reason=client_disconnected）"""
+        extra_data = {**self.route_extra(route, provider, model), 'partial': True, 'finish_reason': CLIENT_DISCONNECTED}
+        if not usage:
+            usage = self.estimate_usage(request_messages, partial_content)
+            extra_data['usage_estimated'] = True
+        billed_usage, cost, extra_data = self._billing(route, usage, extra_data, coalesced)
+
+        try:
+            async with AsyncSessionLocal() as db:
+                await self._save_turn(
+                    db,
+                    self._usage_record(
+                        api_key_id, conversation_id, route.model, route.provider.value, billed_usage, cost, response_time,
+                        extra_data,
+                    ),
+                    provider, model, chat_messages, partial_content, usage.get('completion_tokens', 0),
+                    save_conversation and bool(partial_content),
+                )
+                await db.commit()
+        except Exception as e:
+            log.error(f'Failed to record disconnected stream: {e}')
 
-        conversation = await conversation_crud.create(db, conversation_data)
-        await db.flush()
-        await db.refresh(conversation)
+    def _spawn(self, coro: Coroutine) -> None:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
 
-        return conversation
+    async def drain(self) -> None:
+        """等待后台保存任务完成（应用关闭时调用）"""
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
 
-    async def _log_usage(
+    def route_extra(self, route: ChatRoute, provider: ModelProvider, model: str, saved_tokens: int = 0) -> dict:
+        """
+        使用记录的路由信息：上游尝试次数，发生故障转移时保留原始请求的路由；
+        历史使用了压缩摘要时记录节省的 Token 数
+        """
+        extra = {'attempts': route.attempts}
+        if route.hop:
+            extra.update(fallback_hop=route.hop, requested_provider=provider.value, requested_model=model)
+        if saved_tokens:
+            extra['compaction_saved_tokens'] = saved_tokens
+        return extra
+
+    async def _log_partial_usage(
+        self,
+        db: AsyncSession,
+        api_key_id: int,
+        conversation_id: int | None,
+        route: ChatRoute,
+        request_messages: list[ChatMessage],
+        partial_content: str,
+        usage: dict | None,
+        response_time: float,
+        error: Exception,
+        extra_data: dict | None = None,
+    ):
+        """流式中断时记录部分用量（失败不影响原异常的抛出）"""
+        partial_usage = usage or self.estimate_usage(request_messages, partial_content)
+        try:
+            await self.log_usage(
+                db,
+                api_key_id,
+                conversation_id,
+                route.model,
+                route.provider.value,
+                partial_usage,
+                route.adapter.calculate_cost(partial_usage, route.model),
+                response_time,
+                extra_data={
+                    **(extra_data or {}),
+                    'partial': True,
+                    'usage_estimated': usage is None,
+                    'error': str(error)[:200],
+                },
+            )
+            await db.commit()
+        except Exception as log_error:
+            log.error(f'Failed to record partial usage: {log_error}')
+
+    async def log_usage(
         self,
         db: AsyncSession,
         api_key_id: int,
@@ -409,9 +773,27 @@ class ChatService:
         usage: dict,
         cost: float,
         response_time: float,
+        extra_data: dict | None = None,
     ):
-        """记录使用情况"""
-        log_data = UsageLogCreate(
+        """记录使用情况并扣减 Token 限额（透传接口也通过它记录）"""
+        log_data = self._usage_record(api_key_id, conversation_id, model, provider, usage, cost, response_time, extra_data)
+        await usage_writer.submit(db, log_data)
+        # 按实际用量扣减该密钥的 Token 限额
+        await rate_limiter.charge_tokens(api_key_id, log_data.total_tokens)
+
+    @staticmethod
+    def _usage_record(
+        api_key_id: int,
+        conversation_id: int | None,
+        model: str,
+        provider: str,
+        usage: dict,
+        cost: float,
+        response_time: float,
+        extra_data: dict | None = None,
+    ) -> UsageLogCreate:
+        """构造使用记录"""
+        return UsageLogCreate(
             api_key_id=api_key_id,
             conversation_id=conversation_id,
             model_name=model,
@@ -421,10 +803,9 @@ class ChatService:
             total_tokens=usage.get('total_tokens', 0),
             cost=cost,
             response_time=response_time,
+            extra_data=extra_data,
         )
 
-        await usage_log_crud.create(db, log_data)
-
 
 # 全局实例
 chat_service = ChatService()
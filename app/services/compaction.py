@@ -0,0 +1,202 @@
+"""
+@File    : compaction.py
+@Author  : Martin
+@Desc    : 对话压缩：未摘要的历史超过阈值时，在后台用低成本模型把较早的轮次与已有摘要合并为新的滚动摘要，
+           之后的轮次发送 摘要 + 最近消息，而不是全部原始历史
+"""
+
+import asyncio
+import logging
+import time
+from app.adapters.base import ChatMessage, ChatRequest
+from app.adapters.model_registry import model_registry
+from app.adapters.sse import json_loads
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.enums import ModelProvider
+from app.core.tokens import estimate_messages_tokens, estimate_tokens
+from app.crud.conversation import conversation_crud
+from app.crud.usage_log import UsageLogCreate
+from app.services.history_cache import history_cache
+from app.services.history_window import history_budget, select_history
+from app.services.rate_limiter import rate_limiter
+from app.services.usage_writer import usage_writer
+
+log = logging.getLogger('app')
+
+# 摘要消息在 messages 表中的角色
+SUMMARY_ROLE = 'summary'
+
+_SUMMARY_PROMPT = (
+    'Summarize the conversation below so it can replace the original messages as context for future turns. '
+    'Merge the previous summary (if any) with the new messages. Keep facts, decisions, user preferences, '
+    'open questions and any names, numbers or code identifiers needed to continue. '
+    'Write in the language of the conversation and output only the summary.'
+)
+
+
+def summary_message(content: str) -> ChatMessage:
+    """发给上游的摘要消息（作为 system 消息放在历史开头）"""
+    return ChatMessage(role='system', content=f'Summary of the earlier conversation:\n{content}')
+
+
+def _text(content: str) -> str:
+    """存储的消息内容转为摘要用的纯文本（多模态内容只保留文本，图片记为 [image]）"""
+    if not content.startswith('['):
+        return content
+    try:
+        parts = json_loads(content)
+    except ValueError:
+        return content
+    if not isinstance(parts, list):
+        return content
+    return ' '.join(
+        part.get('text') or '' if part.get('type') == 'text' else '[image]' for part in parts if isinstance(part, dict)
+    )
+
+
+class ConversationCompactor:
+    """
+    对话压缩
+    - 每轮加载历史后检查未摘要部分的估算 Token 数，超过 COMPACTION_TRIGGER_TOKENS 时安排后台任务，不阻塞当前请求
+    - 保留最近 COMPACTION_KEEP_MESSAGES 条原文（从 user 消息开始），更早的消息与上一份摘要合并为新摘要
+    - 摘要作为 role=summary 的消息保存，对话记录其覆盖到的序号；保存后使该对话的历史缓存失效
+    """
+
+    def __init__(self):
+        self._running: set[int] = set()  # 正在压缩的对话
+        self._pending: set[asyncio.Task] = set()
+        self.compactions = 0
+        self.failures = 0
+        self.summarized_tokens = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.COMPACTION_ENABLED
+
+    def maybe_compact(
+        self, api_key_id: int, conversation_id: int, provider: ModelProvider, model: str, history: list[ChatMessage]
+    ) -> None:
+        """history 为对话当前的历史窗口（开头可能是摘要），未摘要部分超过阈值时在后台压缩"""
+        if not self.enabled or conversation_id in self._running:
+            return
+        raw = [msg for msg in history if msg.role != 'system']
+        if len(raw) <= settings.COMPACTION_KEEP_MESSAGES:
+            return
+        if estimate_messages_tokens(raw) < settings.COMPACTION_TRIGGER_TOKENS:
+            return
+
+        self._running.add(conversation_id)
+        task = asyncio.create_task(self._compact(api_key_id, conversation_id, provider, model))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+        task.add_done_callback(lambda _: self._running.discard(conversation_id))
+
+    def _target(self, provider: ModelProvider, model: str) -> tuple[ModelProvider, str]:
+        """生成摘要的模型：配置了 COMPACTION_MODEL 时使用它，否则使用对话本轮的模型"""
+        if settings.COMPACTION_MODEL:
+            return model_registry.parse_target(settings.COMPACTION_MODEL)
+        return provider, model
+
+    async def _compact(self, api_key_id: int, conversation_id: int, provider: ModelProvider, model: str) -> None:
+        try:
+            async with AsyncSessionLocal() as db:
+                conversation = await conversation_crud.get_owned(db, conversation_id, api_key_id)
+                if conversation is None:
+                    return
+                rows = await conversation_crud.get_recent_messages(
+                    db, conversation_id, settings.HISTORY_MAX_MESSAGES, conversation.summarized_seq
+                )
+                rows = [row for row in rows if row.role != SUMMARY_ROLE]
+                previous = None
+                if conversation.summary_seq:
+                    previous = await conversation_crud.get_message(db, conversation_id, conversation.summary_seq)
+                summarized_tokens = conversation.summarized_tokens
+
+            # 保留最近的原文，切分点落在 user 消息上，不拆开一轮问答
+            cut = len(rows) - settings.COMPACTION_KEEP_MESSAGES
+            while cut > 0 and rows[cut].role != 'user':
+                cut -= 1
+            if cut <= 0:
+                return
+            older = [ChatMessage(role=row.role, content=_text(row.content)) for row in rows[:cut]]
+            older_tokens = estimate_messages_tokens(older)
+
+            target_provider, target_model = self._target(provider, model)
+            instructions = ChatMessage(role='system', content=_SUMMARY_PROMPT)
+            previous_text = previous.content if previous is not None else ''
+            budget = history_budget(
+                target_provider, target_model, settings.COMPACTION_SUMMARY_MAX_TOKENS,
+                [instructions, ChatMessage(role='user', content=previous_text)],
+            )
+            # 摘要模型的上下文放不下时只摘要能放下的较新部分
+            transcript = '\n'.join(f'{msg.role}: {msg.content}' for msg in select_history(older, budget))
+            if previous_text:
+                transcript = f'Previous summary:\n{previous_text}\n\nNew messages:\n{transcript}'
+
+            start_time = time.time()
+            route, response = await model_registry.chat_with_failover(
+                target_provider,
+                ChatRequest(
+                    model=target_model,
+                    messages=[instructions, ChatMessage(role='user', content=transcript)],
+                    temperature=0.3,
+                    max_tokens=settings.COMPACTION_SUMMARY_MAX_TOKENS,
+                ),
+            )
+            summary = response.content.strip()
+            if not summary:
+                raise ValueError('Empty summary')
+
+            async with AsyncSessionLocal() as db:
+                message = await conversation_crud.save_summary(
+                    db, conversation_id, summary, estimate_tokens(summary), rows[cut - 1].seq,
+                    summarized_tokens + older_tokens,
+                )
+                if message is None:
+                    # 其他进程已保存了覆盖范围更大的摘要
+                    return
+                await usage_writer.submit(db, UsageLogCreate(
+                    api_key_id=api_key_id,
+                    conversation_id=conversation_id,
+                    model_name=route.model,
+                    provider=route.provider.value,
+                    prompt_tokens=response.usage.get('prompt_tokens', 0),
+                    completion_tokens=response.usage.get('completion_tokens', 0),
+                    total_tokens=response.usage.get('total_tokens', 0),
+                    cost=route.adapter.calculate_cost(response.usage, route.model),
+                    response_time=time.time() - start_time,
+                    extra_data={'compaction': True, 'summarized_messages': cut, 'summarized_tokens': older_tokens},
+                ))
+                await db.commit()
+            await rate_limiter.charge_tokens(api_key_id, response.usage.get('total_tokens', 0))
+
+            history_cache.invalidate(api_key_id, conversation_id)
+            self.compactions += 1
+            self.summarized_tokens += older_tokens
+            log.info(
+                f'Conversation {conversation_id} compacted: {cut} messages (~{older_tokens} tokens) '
+                f'-> summary (~{message.tokens} tokens)'
+            )
+        except Exception as e:
+            self.failures += 1
+            log.error(f'Conversation compaction failed: {e}')
+
+    async def drain(self) -> None:
+        """等待进行中的压缩任务（应用关闭时调用）"""
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+    def snapshot(self) -> dict:
+        """压缩统计，用于健康检查"""
+        return {
+            'enabled': self.enabled,
+            'running': len(self._running),
+            'compactions': self.compactions,
+            'failures': self.failures,
+            'summarized_tokens': self.summarized_tokens,
+        }
+
+
+# 全局实例
+conversation_compactor = ConversationCompactor()
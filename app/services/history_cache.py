@@ -0,0 +1,183 @@
+"""
+@File    : history_cache.py
+@Author  : Martin
+@Desc    : 对话历史缓存：按 (api_key_id, conversation_id) 缓存最近的历史消息窗口（已解析的 ChatMessage），
+           新消息在事务提交后追加到窗口末尾，后续轮次无需查询历史
+"""
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from app.adapters.base import ChatMessage
+from app.adapters.sse import json_dumps
+from app.core.config import settings
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+# 会话 info 中待提交追加的键
+_PENDING_KEY = 'history_cache_pending'
+
+# 每条消息除内容外的估算内存开销（字节）
+_MESSAGE_OVERHEAD_BYTES = 200
+
+
+def _message_size(message: ChatMessage) -> int:
+    content = message.content
+    size = len(content.encode()) if isinstance(content, str) else len(json_dumps(content))
+    return size + _MESSAGE_OVERHEAD_BYTES
+
+
+@dataclass
+class HistoryWindow:
+    """
+    一个对话的最近消息窗口（按时间正序，最多 HISTORY_MAX_MESSAGES 条）
+    对话被压缩过时，开头是作为 system 消息的摘要，saved_tokens 为摘要替代的原始消息 Token 数减去摘要本身
+    """
+
+    provider: str
+    messages: list[ChatMessage]
+    saved_tokens: int = 0
+
+
+@dataclass
+class _Entry:
+    window: HistoryWindow
+    expires_at: float
+    size: int = 0
+
+
+class HistoryCache:
+    """
+    对话历史 LRU 缓存
+    - 键包含 api_key_id：只有通过归属校验的密钥才会写入，命中即视为校验通过
+    - 按总字节数淘汰最久未用的对话；条目有 TTL，多进程部署时其他进程写入的消息最迟在 TTL 后可见
+    - 保存消息时先登记在数据库会话上，事务提交后才追加到窗口，回滚的消息不会进入缓存
+    """
+
+    def __init__(self):
+        self._entries: OrderedDict[tuple[int, int], _Entry] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.HISTORY_CACHE_MAX_BYTES > 0
+
+    def get(self, api_key_id: int, conversation_id: int) -> HistoryWindow | None:
+        """返回窗口的副本；未命中或已过期时返回 None"""
+        key = (api_key_id, conversation_id)
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.time():
+            self._discard(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        window = entry.window
+        return HistoryWindow(window.provider, list(window.messages), window.saved_tokens)
+
+    def put(self, api_key_id: int, conversation_id: int, window: HistoryWindow) -> None:
+        """写入从数据库加载的窗口"""
+        if not self.enabled:
+            return
+        key = (api_key_id, conversation_id)
+        self._discard(key)
+        messages, window.messages = window.messages, []
+        self._entries[key] = _Entry(window, time.time() + settings.HISTORY_CACHE_TTL)
+        self._extend(key, messages)
+
+    def stage(
+        self,
+        db: AsyncSession,
+        api_key_id: int,
+        conversation_id: int,
+        provider: str,
+        messages: list[ChatMessage],
+        created: bool = False,
+    ) -> None:
+        """
+        登记本轮保存的消息，db 的事务提交后追加到窗口
+        created 为 True 表示本轮新建的对话（消息即完整历史，直接建立窗口）；
+        已有对话的窗口不在缓存中时忽略，下次按需从数据库加载
+        """
+        if self.enabled:
+            db.info.setdefault(_PENDING_KEY, []).append((api_key_id, conversation_id, provider, messages, created))
+
+    def invalidate(self, api_key_id: int, conversation_id: int) -> None:
+        """删除或压缩对话时移除窗口"""
+        self._discard((api_key_id, conversation_id))
+
+    def _apply(self, pending: list[tuple]) -> None:
+        for api_key_id, conversation_id, provider, messages, created in pending:
+            key = (api_key_id, conversation_id)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._extend(key, messages)
+            elif created:
+                self.put(api_key_id, conversation_id, HistoryWindow(provider, messages))
+
+    def _extend(self, key: tuple[int, int], messages: list[ChatMessage]) -> None:
+        entry = self._entries[key]
+        cached = entry.window.messages
+        cached.extend(messages)
+        added = sum(map(_message_size, messages))
+        entry.size += added
+        self.size += added
+
+        # 窗口只保留最近 HISTORY_MAX_MESSAGES 条（开头的压缩摘要除外）
+        overflow = len(cached) - settings.HISTORY_MAX_MESSAGES
+        if overflow > 0:
+            pinned = 0
+            while pinned < len(cached) and cached[pinned].role == 'system':
+                pinned += 1
+            removed = sum(map(_message_size, cached[pinned : pinned + overflow]))
+            del cached[pinned : pinned + overflow]
+            entry.size -= removed
+            self.size -= removed
+
+        while self.size > settings.HISTORY_CACHE_MAX_BYTES and self._entries:
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+            self.evictions += 1
+
+    def _discard(self, key: tuple[int, int]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
+
+    def snapshot(self) -> dict:
+        """缓存统计，用于健康检查"""
+        total = self.hits + self.misses
+        return {
+            'conversations': len(self._entries),
+            'bytes': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            'evictions': self.evictions,
+        }
+
+
+# 全局实例
+history_cache = HistoryCache()
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        history_cache._apply(pending)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_pending(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
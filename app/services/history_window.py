@@ -0,0 +1,52 @@
+"""
+@File    : history_window.py
+@Author  : Martin
+@Desc    : 历史消息窗口：从最新消息往前，按模型的 Token 预算装入尽可能多的完整轮次
+"""
+
+from app.adapters.base import ChatMessage
+from app.core.config import settings
+from app.core.enums import ModelProvider
+from app.core.model_catalog import model_catalog
+from app.core.tokens import MESSAGE_OVERHEAD_TOKENS, estimate_content_tokens, estimate_messages_tokens
+
+
+def history_budget(provider: ModelProvider, model: str, max_tokens: int | None, fixed: list[ChatMessage]) -> int:
+    """
+    历史消息可用的 Token 数：上下文长度 - 输出预留 - 必发消息（系统提示词与本轮消息），
+    再受 HISTORY_MAX_TOKENS 限制
+    """
+    spec = model_catalog.lookup(provider, model)
+    context_length = (spec.context_length if spec else None) or settings.HISTORY_DEFAULT_CONTEXT
+    reserved = max_tokens or settings.HISTORY_RESERVED_OUTPUT_TOKENS
+    if spec and spec.max_output_tokens:
+        reserved = min(reserved, spec.max_output_tokens)
+
+    budget = context_length - reserved - estimate_messages_tokens(fixed)
+    if settings.HISTORY_MAX_TOKENS:
+        budget = min(budget, settings.HISTORY_MAX_TOKENS)
+    return max(0, budget)
+
+
+def select_history(history: list[ChatMessage], budget: int) -> list[ChatMessage]:
+    """
+    从最新消息往前累加估算 Token，超出预算即停止；history 按时间正序，返回值同样正序
+    窗口从 user 消息开始，不保留被截断轮次里孤立的 assistant 回复
+    开头的 system 消息（对话压缩摘要）始终保留，先从预算中扣除
+    """
+    pinned = 0
+    while pinned < len(history) and history[pinned].role == 'system':
+        budget -= MESSAGE_OVERHEAD_TOKENS + estimate_content_tokens(history[pinned].content)
+        pinned += 1
+
+    used = 0
+    start = len(history)
+    for index in range(len(history) - 1, pinned - 1, -1):
+        used += MESSAGE_OVERHEAD_TOKENS + estimate_content_tokens(history[index].content)
+        if used > budget:
+            break
+        start = index
+
+    while start < len(history) and history[start].role != 'user':
+        start += 1
+    return history[:pinned] + history[start:]
@@ -0,0 +1,113 @@
+"""
+@File    : model_list_cache.py
+@Author  : Martin
+@Desc    : 可用模型列表缓存：并发拉取、TTL + stale-while-revalidate、后台刷新、失败时返回上次成功的列表
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from app.adapters.model_registry import model_registry
+from app.core.config import settings
+from app.core.enums import ModelProvider
+
+log = logging.getLogger('app')
+
+
+@dataclass
+class _Entry:
+    models: list[str]
+    fetched_at: float
+
+
+class ModelListCache:
+    """
+    按供应商缓存模型列表
+    - 未过期：直接返回
+    - 已过期但在 stale 窗口内：先返回旧列表，后台刷新
+    - 无缓存或过旧：同步拉取（各供应商并发、单独超时），拉取失败时仍返回上次成功的列表
+    """
+
+    def __init__(self):
+        self._entries: dict[ModelProvider, _Entry] = {}
+        self._inflight: dict[ModelProvider, asyncio.Task] = {}
+        self._refresher: asyncio.Task | None = None
+
+    def _providers(self) -> list[ModelProvider]:
+        """已配置 API Key 的供应商"""
+        providers = []
+        for provider in model_registry.get_available_providers():
+            try:
+                model_registry.get_adapter(provider)
+            except ValueError:
+                continue
+            providers.append(provider)
+        return providers
+
+    async def _fetch(self, provider: ModelProvider) -> list[str]:
+        adapter = model_registry.get_adapter(provider)
+        async with asyncio.timeout(settings.MODEL_LIST_FETCH_TIMEOUT):
+            models = await adapter.get_available_models()
+        self._entries[provider] = _Entry(models=models, fetched_at=time.monotonic())
+        return models
+
+    def _refresh(self, provider: ModelProvider) -> asyncio.Task:
+        """发起（或复用正在进行的）刷新任务，同一供应商同时只有一个拉取请求"""
+        task = self._inflight.get(provider)
+        if task is None:
+            task = asyncio.create_task(self._fetch(provider))
+            self._inflight[provider] = task
+            task.add_done_callback(lambda t: self._on_refreshed(provider, t))
+        return task
+
+    def _on_refreshed(self, provider: ModelProvider, task: asyncio.Task) -> None:
+        self._inflight.pop(provider, None)
+        if not task.cancelled() and task.exception() is not None:
+            log.warning(f'Failed to refresh models for {provider}: {task.exception()!r}')
+
+    async def _get(self, provider: ModelProvider) -> list[str] | None:
+        entry = self._entries.get(provider)
+        if entry is not None:
+            age = time.monotonic() - entry.fetched_at
+            if age < settings.MODEL_LIST_TTL:
+                return entry.models
+            if age < settings.MODEL_LIST_TTL + settings.MODEL_LIST_STALE_TTL:
+                self._refresh(provider)
+                return entry.models
+
+        try:
+            # shield：调用方放弃等待时不取消共享的拉取任务
+            return await asyncio.shield(self._refresh(provider))
+        except Exception:
+            # 供应商不可用时返回上次成功的列表
+            return entry.models if entry is not None else None
+
+    async def get_all(self) -> list[tuple[ModelProvider, list[str]]]:
+        """获取所有已配置供应商的模型列表（并发）"""
+        providers = self._providers()
+        results = await asyncio.gather(*(self._get(provider) for provider in providers))
+        return [(provider, models) for provider, models in zip(providers, results) if models is not None]
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            providers = self._providers()
+            await asyncio.gather(*(self._refresh(provider) for provider in providers), return_exceptions=True)
+            await asyncio.sleep(settings.MODEL_LIST_REFRESH_INTERVAL)
+
+    def start(self) -> None:
+        """启动后台定时刷新（应用启动时调用）"""
+        if settings.MODEL_LIST_REFRESH_INTERVAL > 0 and self._refresher is None:
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        """停止后台刷新"""
+        tasks = [task for task in (self._refresher, *self._inflight.values()) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._refresher = None
+
+
+# 全局实例
+model_list_cache = ModelListCache()
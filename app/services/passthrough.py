@@ -0,0 +1,260 @@
+"""
+@File    : passthrough.py
+@Author  : Martin
+@Desc    : OpenAI 协议透传：请求体与上游 SSE 字节原样转发，回复内容与用量在响应结束后从旁路副本中解析并记录
+"""
+
+import asyncio
+import json
+import logging
+import re
+import time
+from app.adapters.base import ChatMessage, RawChatRequest, normalize_usage
+from app.adapters.model_registry import ChatRoute, model_registry
+from app.adapters.sse import DONE, SSEDecoder, json_loads, parse_delta
+from app.core.database import AsyncSessionLocal
+from app.core.enums import ModelProvider
+from app.core.model_catalog import model_catalog
+from app.services.chat_service import CLIENT_DISCONNECTED, chat_service
+from collections.abc import AsyncIterator, Coroutine
+
+log = logging.getLogger('app')
+
+# 只带 usage 的末尾块（choices 为空数组）与 SSE 事件分隔符
+_USAGE_ONLY_CHUNK = re.compile(rb'"choices"\s*:\s*\[\s*\]')
+_EVENT_END = re.compile(rb'(\r?\n\r?\n)')
+
+
+class _UsageChunkFilter:
+    """
+    从转发给客户端的字节中去掉只带 usage 的块（客户端没有要求 include_usage，是为计费向上游补开的）
+    按事件边界切分，不完整的事件留到下一段数据；不含空 choices 的数据整段原样放行，不逐个事件处理
+    """
+
+    __slots__ = ('_buffer',)
+
+    def __init__(self):
+        self._buffer = b''
+
+    def feed(self, raw: bytes) -> bytes:
+        buffer = self._buffer + raw if self._buffer else raw
+        lf, crlf = buffer.rfind(b'\n\n'), buffer.rfind(b'\r\n\r\n')
+        end = max(lf + 2 if lf >= 0 else 0, crlf + 4 if crlf >= 0 else 0)
+        if not end:
+            self._buffer = buffer
+            return b''
+        complete, self._buffer = buffer[:end], buffer[end:]
+        if not _USAGE_ONLY_CHUNK.search(complete):
+            return complete
+        parts = _EVENT_END.split(complete)
+        # parts 为 事件, 分隔符, 事件, 分隔符, ..., 末尾空串
+        return b''.join(
+            parts[i] + parts[i + 1] for i in range(0, len(parts) - 1, 2) if not _USAGE_ONLY_CHUNK.search(parts[i])
+        )
+
+    def flush(self) -> bytes:
+        buffer, self._buffer = self._buffer, b''
+        return b'' if _USAGE_ONLY_CHUNK.search(buffer) else buffer
+
+
+class PassthroughService:
+    """
+    OpenAI 协议透传
+    - 热路径只转发字节：上游的每段数据原样交给客户端，同时把引用追加到副本（tee）列表，不解析、不重新编码
+    - 响应结束（含客户端断开）后由后台任务解析副本，提取回复内容与 usage 并记录使用情况
+    - 透传接口是无状态的（与 OpenAI 一致，历史由客户端携带），不保存对话、不注入系统提示词
+    """
+
+    def __init__(self):
+        self._pending: set[asyncio.Task] = set()
+        self.active_streams = 0
+        self.forwarded_bytes = 0
+
+    @staticmethod
+    def _messages(body: dict) -> list[ChatMessage]:
+        """用于预检与用量估算的消息（工具调用等无文本内容的消息按空内容计）"""
+        return [ChatMessage(role=str(msg.get('role', 'user')), content=msg.get('content') or '') for msg in body['messages']]
+
+    def _prepare(
+        self, provider: ModelProvider, model: str, body: dict, max_tokens: int | None
+    ) -> tuple[RawChatRequest, list[ChatMessage]]:
+        """校验供应商与请求，返回透传请求"""
+        adapter = model_registry.get_adapter(provider)
+        if not adapter.OPENAI_COMPATIBLE:
+            raise ValueError(f'Provider {provider.value} does not support OpenAI passthrough')
+        messages = self._messages(body)
+        model_catalog.preflight(provider, model, messages, max_tokens)
+        return RawChatRequest(model=model, body=body), messages
+
+    async def complete(
+        self, api_key_id: int, provider: ModelProvider, model: str, body: dict, max_tokens: int | None = None
+    ) -> bytes:
+        """非流式透传，返回上游响应体原文"""
+        start_time = time.time()
+        request, messages = self._prepare(provider, model, body, max_tokens)
+        route, response = await model_registry.chat_raw_with_failover(provider, request)
+        self._spawn(
+            self._record(api_key_id, provider, model, route, messages, [response.content], False, time.time() - start_time)
+        )
+        return response.content
+
+    async def open_stream(
+        self, api_key_id: int, provider: ModelProvider, model: str, body: dict, max_tokens: int | None = None
+    ) -> AsyncIterator[bytes]:
+        """
+        打开流式透传：首个块到达前的错误（含故障转移用尽）直接抛出，调用方可以返回正常的错误响应；
+        之后返回的生成器只产出上游原始字节
+        上游支持时总是开启 stream_options.include_usage，按上游返回的实际用量计费；
+        客户端没有要求时，末尾只带 usage 的块只用于计费，不转发给客户端
+        """
+        start_time = time.time()
+        drop_usage = False
+        stream_options = body.get('stream_options') or {}
+        if model_registry.get_adapter(provider).STREAM_INCLUDE_USAGE and not stream_options.get('include_usage'):
+            body = {**body, 'stream_options': {**stream_options, 'include_usage': True}}
+            drop_usage = True
+        request, messages = self._prepare(provider, model, body, max_tokens)
+        route, stream = await model_registry.open_raw_stream(provider, request)
+        return self._forward(api_key_id, provider, model, route, messages, stream, start_time, drop_usage)
+
+    async def _forward(
+        self,
+        api_key_id: int,
+        provider: ModelProvider,
+        model: str,
+        route: ChatRoute,
+        messages: list[ChatMessage],
+        stream,
+        start_time: float,
+        drop_usage: bool = False,
+    ) -> AsyncIterator[bytes]:
+        tee: list[bytes] = []
+        usage_filter = _UsageChunkFilter() if drop_usage else None
+        disconnected = False
+        self.active_streams += 1
+        try:
+            async for raw in stream:
+                tee.append(raw)
+                if usage_filter is not None:
+                    raw = usage_filter.feed(raw)
+                    if not raw:
+                        continue
+                self.forwarded_bytes += len(raw)
+                yield raw
+            if usage_filter is not None and (rest := usage_filter.flush()):
+                self.forwarded_bytes += len(rest)
+                yield rest
+        except Exception as e:
+            log.error(f'Passthrough stream error: {e}')
+            # 响应头已发出，按 OpenAI 协议以 error 事件告知客户端
+            error = {'error': {'message': str(e) or type(e).__name__, 'type': 'upstream_error'}}
+            yield f'data: {json.dumps(error, ensure_ascii=False)}\n\n'.encode()
+        except (asyncio.CancelledError, GeneratorExit):
+            # 客户端断开：立即关闭上游，已转发的部分照常记录
+            disconnected = True
+            raise
+        finally:
+            self.active_streams -= 1
+            # 先安排记录再关闭上游：断开时当前任务处于取消状态，之后的 await 可能再次被取消
+            self._spawn(self._record(
+                api_key_id, provider, model, route, messages, tee, True, time.time() - start_time, disconnected
+            ))
+            await asyncio.shield(stream.aclose())
+
+    @staticmethod
+    def _parse_stream(tee: list[bytes]) -> tuple[str, str | None, dict | None]:
+        """从转发过的 SSE 字节中解析 (回复内容, finish_reason, usage)"""
+        decoder = SSEDecoder()
+        events = [data for raw in tee for data in decoder.feed(raw)]
+        events += decoder.flush()
+
+        parts: list[str] = []
+        finish_reason = usage = None
+        for data in events:
+            if data == DONE:
+                break
+            try:
+                content, _, reason, raw_usage = parse_delta(data)
+            except (ValueError, AttributeError):
+                continue
+            if content:
+                parts.append(content)
+            if reason:
+                finish_reason = reason
+            if raw_usage:
+                usage = normalize_usage(raw_usage)
+        return ''.join(parts), finish_reason, usage
+
+    @staticmethod
+    def _parse_body(body: bytes) -> tuple[str, str | None, dict | None]:
+        """从非流式响应体中解析 (回复内容, finish_reason, usage)"""
+        try:
+            data = json_loads(body)
+            choice = (data.get('choices') or [{}])[0]
+        except (ValueError, AttributeError):
+            return '', None, None
+        content = (choice.get('message') or {}).get('content') or ''
+        usage = normalize_usage(data['usage']) if data.get('usage') else None
+        return content, choice.get('finish_reason'), usage
+
+    async def _record(
+        self,
+        api_key_id: int,
+        provider: ModelProvider,
+        model: str,
+        route: ChatRoute,
+        messages: list[ChatMessage],
+        tee: list[bytes],
+        stream: bool,
+        response_time: float,
+        disconnected: bool = False,
+    ) -> None:
+        """解析副本并记录使用情况（在后台任务中执行，不占用转发路径）"""
+        try:
+            content, finish_reason, usage = self._parse_stream(tee) if stream else self._parse_body(tee[0])
+            extra_data = {**chat_service.route_extra(route, provider, model), 'passthrough': True}
+            if not usage:
+                usage = chat_service.estimate_usage(messages, content)
+                extra_data['usage_estimated'] = True
+            if finish_reason is None:
+                extra_data['partial'] = True
+            if disconnected:
+                extra_data['finish_reason'] = CLIENT_DISCONNECTED
+
+            async with AsyncSessionLocal() as db:
+                await chat_service.log_usage(
+                    db,
+                    api_key_id,
+                    None,
+                    route.model,
+                    route.provider.value,
+                    usage,
+                    route.adapter.calculate_cost(usage, route.model),
+                    response_time,
+                    extra_data=extra_data,
+                )
+                await db.commit()
+        except Exception as e:
+            log.error(f'Failed to record passthrough usage: {e}')
+
+    def _spawn(self, coro: Coroutine) -> None:
+        task = asyncio.create_task(coro)
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def drain(self) -> None:
+        """等待尚未写完的使用记录（应用关闭时调用）"""
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+    def snapshot(self) -> dict:
+        """透传统计，用于健康检查"""
+        return {
+            'active_streams': self.active_streams,
+            'forwarded_bytes': self.forwarded_bytes,
+            'pending_records': len(self._pending),
+        }
+
+
+# 全局实例
+passthrough_service = PassthroughService()
@@ -0,0 +1,196 @@
+"""
+@File    : rate_limiter.py
+@Author  : Martin
+@Desc    : API Key 级别的令牌桶限流（请求数 / Token 数），支持进程内与 Postgres 共享两种存储
+"""
+
+import logging
+import math
+import time
+from dataclasses import dataclass
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.api_key import APIKey
+from sqlalchemy import text
+
+log = logging.getLogger('app')
+
+
+@dataclass
+class BucketState:
+    """一次取令牌后的桶状态"""
+
+    allowed: bool
+    remaining: float
+    retry_after: float = 0.0  # 被拒绝时，距离有足够令牌的秒数
+
+
+class MemoryBucketStore:
+    """进程内令牌桶，单 worker 部署时使用"""
+
+    def __init__(self):
+        self._buckets: dict[str, tuple[float, float]] = {}  # bucket -> (令牌数, 更新时间)
+
+    def _refill(self, bucket: str, capacity: float, rate: float) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(bucket, (capacity, now))
+        return min(capacity, tokens + (now - updated) * rate)
+
+    async def take(self, bucket: str, capacity: float, rate: float, cost: float) -> BucketState:
+        tokens = self._refill(bucket, capacity, rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[bucket] = (tokens, time.monotonic())
+        return BucketState(allowed, tokens, 0.0 if allowed else (cost - tokens) / rate)
+
+    async def charge(self, bucket: str, capacity: float, rate: float, amount: float) -> None:
+        # 事后扣减允许透支，透支部分靠后续补充偿还
+        self._buckets[bucket] = (self._refill(bucket, capacity, rate) - amount, time.monotonic())
+
+
+# 先按经过的时间补充令牌，再尝试扣减；返回补充后的令牌数，由调用方判断是否放行
+_TAKE_SQL = text(
+    """
+    WITH cur AS (
+        SELECT LEAST(:capacity, tokens + EXTRACT(EPOCH FROM clock_timestamp() - updated_at)::float8 * :rate) AS refill
+        FROM rate_limit_buckets WHERE bucket = :bucket FOR UPDATE
+    )
+    UPDATE rate_limit_buckets AS b
+    SET tokens = CASE WHEN cur.refill >= :cost THEN cur.refill - :cost ELSE cur.refill END,
+        updated_at = clock_timestamp()
+    FROM cur WHERE b.bucket = :bucket
+    RETURNING cur.refill
+    """
+)
+_CHARGE_SQL = text(
+    """
+    UPDATE rate_limit_buckets
+    SET tokens = LEAST(:capacity, tokens + EXTRACT(EPOCH FROM clock_timestamp() - updated_at)::float8 * :rate) - :cost,
+        updated_at = clock_timestamp()
+    WHERE bucket = :bucket
+    RETURNING tokens
+    """
+)
+_INSERT_SQL = text(
+    """
+    INSERT INTO rate_limit_buckets (bucket, tokens, updated_at) VALUES (:bucket, :capacity, clock_timestamp())
+    ON CONFLICT (bucket) DO NOTHING
+    """
+)
+
+
+class PostgresBucketStore:
+    """
+    Postgres 共享令牌桶，多个 worker / 实例共享同一份限额
+    每次取令牌是一条带行锁的 UPDATE，桶不存在时先插入满桶再重试
+    """
+
+    async def _execute(self, statement, params: dict) -> float:
+        async with AsyncSessionLocal() as session:
+            refill = (await session.execute(statement, params)).scalar_one_or_none()
+            if refill is None:
+                await session.execute(_INSERT_SQL, params)
+                refill = (await session.execute(statement, params)).scalar_one()
+            await session.commit()
+        return float(refill)
+
+    async def take(self, bucket: str, capacity: float, rate: float, cost: float) -> BucketState:
+        params = {'bucket': bucket, 'capacity': capacity, 'rate': rate, 'cost': cost}
+        refill = await self._execute(_TAKE_SQL, params)
+        if refill >= cost:
+            return BucketState(True, refill - cost)
+        return BucketState(False, refill, (cost - refill) / rate)
+
+    async def charge(self, bucket: str, capacity: float, rate: float, amount: float) -> None:
+        await self._execute(_CHARGE_SQL, {'bucket': bucket, 'capacity': capacity, 'rate': rate, 'cost': amount})
+
+
+@dataclass
+class RateLimitResult:
+    """限流检查结果，用于生成 X-RateLimit-* 响应头"""
+
+    allowed: bool
+    headers: dict[str, str]
+    retry_after: float = 0.0
+
+
+class RateLimiter:
+    """
+    按 API Key 的请求数与 Token 数限流
+    请求数在准入时扣减；Token 数在准入时只要求桶内为正，实际用量在请求结束后扣减
+    """
+
+    def __init__(self):
+        self._store = PostgresBucketStore() if settings.RATE_LIMIT_BACKEND == 'postgres' else MemoryBucketStore()
+        # api_key_id -> (rpm, tpm)，准入检查时按密钥刷新，事后扣减 Token 时优先使用
+        self._limits: dict[int, tuple[int, int]] = {}
+
+    @staticmethod
+    def limits_for(api_key: APIKey) -> tuple[int, int]:
+        """密钥的每分钟请求数与 Token 数限额，未单独配置时使用全局默认，0 表示不限"""
+        rpm = api_key.rate_limit_rpm if api_key.rate_limit_rpm is not None else settings.RATE_LIMIT_DEFAULT_RPM
+        tpm = api_key.rate_limit_tpm if api_key.rate_limit_tpm is not None else settings.RATE_LIMIT_DEFAULT_TPM
+        return rpm, tpm
+
+    @staticmethod
+    def _headers(kind: str, limit: int, state: BucketState) -> dict[str, str]:
+        remaining = max(0, math.floor(state.remaining))
+        reset = max(0.0, (limit - state.remaining) / (limit / 60))
+        return {
+            f'X-RateLimit-Limit-{kind}': str(limit),
+            f'X-RateLimit-Remaining-{kind}': str(remaining),
+            f'X-RateLimit-Reset-{kind}': f'{reset:.1f}s',
+        }
+
+    async def check(self, api_key: APIKey) -> RateLimitResult:
+        """准入检查"""
+        rpm, tpm = self.limits_for(api_key)
+        self._limits[api_key.id] = (rpm, tpm)
+        headers: dict[str, str] = {}
+
+        if tpm:
+            # Token 桶只检查余额不扣减，余额不足 1 个（已透支）时拒绝
+            state = await self._store.take(f'tpm:{api_key.id}', tpm, tpm / 60, 0)
+            headers.update(self._headers('Tokens', tpm, state))
+            if state.remaining < 1:
+                return RateLimitResult(False, headers, (1 - state.remaining) / (tpm / 60))
+
+        if rpm:
+            state = await self._store.take(f'rpm:{api_key.id}', rpm, rpm / 60, 1)
+            headers.update(self._headers('Requests', rpm, state))
+            if not state.allowed:
+                return RateLimitResult(False, headers, state.retry_after)
+
+        return RateLimitResult(True, headers)
+
+    async def _tpm(self, api_key_id: int) -> int:
+        """
+        密钥的 Token 限额：本进程做过准入检查时直接使用，否则按 ID 读取密钥
+        （批量任务、对话压缩等后台调用，以及重启后尚未检查过的密钥）
+        """
+        limits = self._limits.get(api_key_id)
+        if limits is None:
+            async with AsyncSessionLocal() as session:
+                api_key = await session.get(APIKey, api_key_id)
+            if api_key is None:
+                return 0
+            limits = self._limits[api_key_id] = self.limits_for(api_key)
+        return limits[1]
+
+    async def charge_tokens(self, api_key_id: int, tokens: int) -> None:
+        """请求结束后按实际用量扣减 Token 桶"""
+        if tokens <= 0:
+            return
+        try:
+            tpm = await self._tpm(api_key_id)
+            if not tpm:
+                return
+            await self._store.charge(f'tpm:{api_key_id}', tpm, tpm / 60, tokens)
+        except Exception as e:
+            # 扣减失败不影响已完成的请求
+            log.error(f'Failed to charge rate limit tokens for key {api_key_id}: {e}')
+
+
+# 全局限流器实例
+rate_limiter = RateLimiter()
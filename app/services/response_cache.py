@@ -0,0 +1,195 @@
+"""
+@File    : response_cache.py
+@Author  : Martin
+@Desc    : 完全相同请求的响应缓存：内存 LRU + TTL，可选 SQLite 磁盘层（重启后仍可命中）
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from app.adapters.base import ChatRequest
+from app.core.config import settings
+from app.core.enums import ModelProvider
+
+log = logging.getLogger('app')
+
+# 磁盘层每写入多少次清理一次过期与超量条目
+_DISK_PRUNE_EVERY = 256
+
+
+@dataclass
+class CachedResponse:
+    """缓存的一次完整回复"""
+
+    provider: str
+    model: str
+    content: str
+    finish_reason: str
+    usage: dict[str, int]
+
+
+class ResponseCache:
+    """
+    按 API Key 与规范化后的请求哈希缓存回复（不同密钥之间不共享）
+    - 内存层：OrderedDict 实现 LRU，超出条目数淘汰最久未用的
+    - 磁盘层：SQLite，内存未命中时查询并回填内存；读写放在线程池里，不阻塞事件循环
+    """
+
+    def __init__(self):
+        self._entries: OrderedDict[str, tuple[float, CachedResponse]] = OrderedDict()  # key -> (过期时间, 回复)
+        self._disk: sqlite3.Connection | None = None
+        self._disk_lock = threading.Lock()
+        self._disk_writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.RESPONSE_CACHE_MAX_ENTRIES > 0
+
+    @staticmethod
+    def make_key(api_key_id: int, provider: ModelProvider, request: ChatRequest) -> str:
+        """
+        请求的规范哈希：只包含影响输出的字段，流式与非流式共用同一条缓存
+        包含 API Key：缓存按密钥隔离，一个密钥的回复不会返回给其他密钥
+        """
+        payload = {
+            'api_key_id': api_key_id,
+            'provider': provider.value,
+            'model': request.model,
+            'messages': [msg.model_dump(exclude_none=True) for msg in request.messages],
+            'temperature': request.temperature,
+            'max_tokens': request.max_tokens,
+            'top_p': request.top_p,
+            'frequency_penalty': request.frequency_penalty,
+            'presence_penalty': request.presence_penalty,
+            'enable_thinking': request.enable_thinking,
+        }
+        canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    async def get(self, key: str) -> CachedResponse | None:
+        """查询缓存，未命中或已过期时返回 None"""
+        now = time.time()
+        item = self._entries.get(key)
+        if item is not None:
+            expires_at, value = item
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        if self._disk is not None:
+            try:
+                item = await asyncio.to_thread(self._disk_get, key, now)
+            except sqlite3.Error as e:
+                log.warning(f'Response cache disk read failed: {e}')
+                item = None
+            if item is not None:
+                self._remember(key, *item)
+                self.hits += 1
+                self.disk_hits += 1
+                return item[1]
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, value: CachedResponse) -> None:
+        """写入缓存（内存与磁盘两层）"""
+        expires_at = time.time() + settings.RESPONSE_CACHE_TTL
+        self._remember(key, expires_at, value)
+        if self._disk is not None:
+            try:
+                await asyncio.to_thread(self._disk_put, key, expires_at, value)
+            except sqlite3.Error as e:
+                log.warning(f'Response cache disk write failed: {e}')
+
+    def _remember(self, key: str, expires_at: float, value: CachedResponse) -> None:
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > settings.RESPONSE_CACHE_MAX_ENTRIES:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    # ==================== 磁盘层（在线程池中执行） ====================
+
+    def _disk_get(self, key: str, now: float) -> tuple[float, CachedResponse] | None:
+        with self._disk_lock:
+            row = self._disk.execute('SELECT expires_at, value FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[0] <= now:
+                self._disk.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._disk.commit()
+                return None
+        return row[0], CachedResponse(**json.loads(row[1]))
+
+    def _disk_put(self, key: str, expires_at: float, value: CachedResponse) -> None:
+        data = json.dumps(asdict(value), ensure_ascii=False)
+        with self._disk_lock:
+            self._disk.execute(
+                'INSERT OR REPLACE INTO responses (key, expires_at, value) VALUES (?, ?, ?)', (key, expires_at, data)
+            )
+            self._disk_writes += 1
+            if self._disk_writes % _DISK_PRUNE_EVERY == 0:
+                self._disk.execute('DELETE FROM responses WHERE expires_at <= ?', (time.time(),))
+                # 超出上限时删除最早过期的条目
+                self._disk.execute(
+                    'DELETE FROM responses WHERE key IN '
+                    '(SELECT key FROM responses ORDER BY expires_at LIMIT max(0, (SELECT count(*) FROM responses) - ?))',
+                    (settings.RESPONSE_CACHE_DISK_MAX_ENTRIES,),
+                )
+            self._disk.commit()
+
+    def _open_disk(self, path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, expires_at REAL NOT NULL, value TEXT NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_responses_expires_at ON responses (expires_at)')
+        conn.commit()
+        return conn
+
+    async def open(self) -> None:
+        """打开磁盘层（应用启动时调用），打开失败时只使用内存缓存"""
+        if not self.enabled or not settings.RESPONSE_CACHE_DISK_PATH or self._disk is not None:
+            return
+        try:
+            self._disk = await asyncio.to_thread(self._open_disk, settings.RESPONSE_CACHE_DISK_PATH)
+            log.info(f'Response cache disk tier opened: {settings.RESPONSE_CACHE_DISK_PATH}')
+        except sqlite3.Error as e:
+            log.error(f'Failed to open response cache disk tier: {e}')
+
+    async def close(self) -> None:
+        """关闭磁盘层"""
+        if self._disk is not None:
+            disk, self._disk = self._disk, None
+            await asyncio.to_thread(disk.close)
+
+    def snapshot(self) -> dict:
+        """缓存状态，用于健康检查"""
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'entries': len(self._entries),
+            'disk': self._disk is not None,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# 全局实例
+response_cache = ResponseCache()
@@ -0,0 +1,219 @@
+"""
+@File    : similarity_cache.py
+@Author  : Martin
+@Desc    : 近似重复请求缓存：对规范化后的对话计算 SimHash 签名，分段 LSH 索引查找相似请求（纯进程内）
+"""
+
+import hashlib
+import json
+import re
+import time
+from collections import Counter, OrderedDict
+from app.adapters.base import ChatRequest
+from app.core.config import settings
+from app.core.enums import ModelProvider
+from app.services.response_cache import CachedResponse
+
+SIGNATURE_BITS = 64
+
+# 英文单词 / 数字作为一个词，其余非空白字符（中文、标点）逐字切分
+_TOKEN_RE = re.compile(r'[0-9a-z_]+|\S')
+
+# 位切片累加：把 64 位哈希的每一位展开到独立的 32 位计数槽，一次大整数加法完成 64 个计数器的累加
+_LANE_BITS = 32
+_LANE_MASK = (1 << _LANE_BITS) - 1
+_SPREAD = [sum(((byte >> i) & 1) << (_LANE_BITS * i) for i in range(8)) for byte in range(256)]
+
+
+def _hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def simhash(features: Counter[str]) -> int:
+    """带权 SimHash：每一位取所有特征哈希在该位上的加权多数"""
+    acc = 0
+    total = 0
+    for feature, weight in features.items():
+        h = _hash64(feature)
+        spread = 0
+        for k in range(8):
+            spread |= _SPREAD[(h >> (8 * k)) & 0xFF] << (_LANE_BITS * 8 * k)
+        acc += spread * weight
+        total += weight
+
+    signature = 0
+    for i in range(SIGNATURE_BITS):
+        if ((acc >> (_LANE_BITS * i)) & _LANE_MASK) * 2 > total:
+            signature |= 1 << i
+    return signature
+
+
+def conversation_features(request: ChatRequest) -> Counter[str] | None:
+    """
+    规范化对话并提取特征（词与相邻词对），忽略大小写与空白差异
+    包含图片等非文本内容时返回 None（无法比较相似度）
+    """
+    tokens: list[str] = []
+    for msg in request.messages:
+        if isinstance(msg.content, str):
+            text = msg.content
+        elif all(isinstance(part, dict) and part.get('type') == 'text' for part in msg.content):
+            text = ' '.join(part.get('text', '') for part in msg.content)
+        else:
+            return None
+        tokens.append(f'<{msg.role}>')
+        tokens.extend(_TOKEN_RE.findall(text.lower()))
+
+    features = Counter(tokens)
+    features.update(f'{a} {b}' for a, b in zip(tokens, tokens[1:]))
+    return features
+
+
+def request_scope(api_key_id: int, provider: ModelProvider, request: ChatRequest) -> int:
+    """
+    除消息以外影响输出的参数，只有参数完全一致的请求之间才比较相似度
+    包含 API Key：只在同一密钥的请求之间查找，一个密钥的回复不会返回给其他密钥
+    """
+    payload = {
+        'api_key_id': api_key_id,
+        'provider': provider.value,
+        'model': request.model,
+        'temperature': request.temperature,
+        'max_tokens': request.max_tokens,
+        'top_p': request.top_p,
+        'frequency_penalty': request.frequency_penalty,
+        'presence_penalty': request.presence_penalty,
+        'enable_thinking': request.enable_thinking,
+    }
+    return _hash64(json.dumps(payload, sort_keys=True, separators=(',', ':')))
+
+
+class SimilarityIndex:
+    """
+    SimHash 签名的分段 LSH 索引
+    64 位签名切成 bands 段，任意一段完全相同即为候选，再按汉明距离精确过滤
+    汉明距离小于 bands 的签名必然至少有一段相同（鸽巢原理），超出时为近似召回
+    条目数超过上限时按 LRU 淘汰
+    """
+
+    def __init__(self, bands: int, max_entries: int):
+        if SIGNATURE_BITS % bands:
+            raise ValueError(f'bands must divide {SIGNATURE_BITS}')
+        self.bands = bands
+        self.max_entries = max_entries
+        self._band_bits = SIGNATURE_BITS // bands
+        self._band_mask = (1 << self._band_bits) - 1
+        self._next_id = 0
+        # 条目 ID -> (作用域, 签名, 过期时间, 回复)
+        self._entries: OrderedDict[int, tuple[int, int, float, CachedResponse]] = OrderedDict()
+        # (作用域, 段序号, 段值) 打包成的整数 -> 条目 ID 集合
+        self._buckets: dict[int, set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _bucket_keys(self, scope: int, signature: int) -> list[int]:
+        return [
+            (scope << 72) | (band << 64) | ((signature >> (band * self._band_bits)) & self._band_mask)
+            for band in range(self.bands)
+        ]
+
+    def add(self, scope: int, signature: int, expires_at: float, value: CachedResponse) -> int:
+        """写入一条，返回因超出上限被淘汰的条目数"""
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (scope, signature, expires_at, value)
+        for key in self._bucket_keys(scope, signature):
+            self._buckets.setdefault(key, set()).add(entry_id)
+
+        evicted = 0
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            evicted += 1
+        return evicted
+
+    def _remove(self, entry_id: int) -> None:
+        scope, signature, _, _ = self._entries.pop(entry_id)
+        for key in self._bucket_keys(scope, signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def query(self, scope: int, signature: int, max_distance: int, now: float) -> tuple[int, CachedResponse] | None:
+        """返回汉明距离最小且不超过 max_distance 的未过期条目 (距离, 回复)"""
+        best_id, best_distance = None, max_distance + 1
+        expired = []
+        for key in self._bucket_keys(scope, signature):
+            for entry_id in self._buckets.get(key, ()):
+                _, candidate, expires_at, _ = self._entries[entry_id]
+                if expires_at <= now:
+                    expired.append(entry_id)
+                    continue
+                distance = (candidate ^ signature).bit_count()
+                if distance < best_distance:
+                    best_id, best_distance = entry_id, distance
+
+        for entry_id in set(expired):
+            self._remove(entry_id)
+        if best_id is None:
+            return None
+        self._entries.move_to_end(best_id)
+        return best_distance, self._entries[best_id][3]
+
+
+class SimilarityCache:
+    """按 API Key 阈值开启、按 API Key 隔离的近似缓存，相似度 = 1 - 汉明距离 / 64"""
+
+    def __init__(self):
+        self._index = SimilarityIndex(settings.SIMILARITY_CACHE_BANDS, settings.SIMILARITY_CACHE_MAX_ENTRIES)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.SIMILARITY_CACHE_MAX_ENTRIES > 0
+
+    def get(
+        self, api_key_id: int, provider: ModelProvider, request: ChatRequest, threshold: float
+    ) -> tuple[float, CachedResponse] | None:
+        """在该 API Key 的缓存中查找相似度不低于阈值的回复，返回 (相似度, 回复)"""
+        features = conversation_features(request)
+        if features is None:
+            return None
+        max_distance = int((1 - threshold) * SIGNATURE_BITS)
+        scope = request_scope(api_key_id, provider, request)
+        found = self._index.query(scope, simhash(features), max_distance, time.time())
+        if found is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        distance, value = found
+        return 1 - distance / SIGNATURE_BITS, value
+
+    def put(self, api_key_id: int, provider: ModelProvider, request: ChatRequest, value: CachedResponse) -> None:
+        """写入该 API Key 的缓存"""
+        features = conversation_features(request)
+        if features is None:
+            return
+        expires_at = time.time() + settings.RESPONSE_CACHE_TTL
+        scope = request_scope(api_key_id, provider, request)
+        self.evictions += self._index.add(scope, simhash(features), expires_at, value)
+
+    def snapshot(self) -> dict:
+        """缓存状态，用于健康检查"""
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'entries': len(self._index),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# 全局实例
+similarity_cache = SimilarityCache()
@@ -0,0 +1,178 @@
+"""
+@File    : singleflight.py
+@Author  : Martin
+@Desc    : 相同请求合并（singleflight）：同一时刻完全相同的请求只发一次上游调用，其余请求共享结果 / 流式广播
+"""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any
+from app.adapters.base import StreamChunk
+from app.adapters.model_registry import ChatRoute, PrefetchedStream
+
+
+@dataclass
+class _Call:
+    """进行中的非流式调用"""
+
+    task: asyncio.Task
+    waiters: int = 0
+
+
+@dataclass
+class _StreamFlight:
+    """进行中的流式调用：上游块依次追加到 chunks，订阅者各自按下标读取"""
+
+    pump: asyncio.Task | None = None
+    route: ChatRoute | None = None
+    chunks: list[StreamChunk] = field(default_factory=list)
+    done: bool = False
+    error: BaseException | None = None
+    subscribers: int = 0
+    _event: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def notify(self) -> None:
+        self._event.set()
+        self._event = asyncio.Event()
+
+    async def changed(self) -> None:
+        await self._event.wait()
+
+
+class StreamSubscription:
+    """
+    订阅一路共享的流，接口与 PrefetchedStream 一致（异步迭代 + aclose）
+    后加入的订阅者从第一个块开始回放；最后一个订阅者关闭时才取消上游
+    """
+
+    def __init__(self, flight: _StreamFlight):
+        self._flight = flight
+        self._index = 0
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> StreamChunk:
+        flight = self._flight
+        while self._index >= len(flight.chunks):
+            if flight.done:
+                if flight.error is not None:
+                    raise flight.error
+                raise StopAsyncIteration
+            await flight.changed()
+        chunk = flight.chunks[self._index]
+        self._index += 1
+        return chunk
+
+    async def aclose(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._flight.subscribers -= 1
+        if self._flight.subscribers == 0 and not self._flight.pump.done():
+            self._flight.pump.cancel()
+
+
+class SingleFlight:
+    """
+    以规范化请求哈希为键的进行中请求表
+    - 第一个请求（leader）发起上游调用，调用运行在独立任务里，leader 被取消不会影响其他等待者
+    - 之后到达的相同请求（follower）直接等待同一个结果或订阅同一路流
+    - 所有等待者都放弃后才取消上游调用
+    """
+
+    def __init__(self):
+        self._calls: dict[str, _Call] = {}
+        self._streams: dict[str, _StreamFlight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def call(self, key: str, fn: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """执行（或加入）一次非流式调用，返回 (结果, 是否为合并的 follower)"""
+        flight = self._calls.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = _Call(asyncio.create_task(fn()))
+            self._calls[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(self._calls, key, flight))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            # shield：单个等待者被取消时不取消共享的上游调用
+            return await asyncio.shield(flight.task), shared
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    async def open_stream(
+        self, key: str, open_fn: Callable[[], Awaitable[tuple[ChatRoute, PrefetchedStream]]]
+    ) -> tuple[ChatRoute, StreamSubscription, bool]:
+        """打开（或订阅）一路流式调用，返回 (路由, 订阅, 是否为合并的 follower)"""
+        flight = self._streams.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = _StreamFlight()
+            self._streams[key] = flight
+            flight.pump = asyncio.create_task(self._pump(key, flight, open_fn))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        flight.subscribers += 1
+        subscription = StreamSubscription(flight)
+        try:
+            # 等待首个块到达（上游已在 leader 中完成故障转移）
+            while flight.route is None:
+                if flight.done:
+                    raise flight.error or RuntimeError('Upstream stream closed before opening')
+                await flight.changed()
+        except BaseException:
+            await subscription.aclose()
+            raise
+        return flight.route, subscription, shared
+
+    async def _pump(
+        self, key: str, flight: _StreamFlight, open_fn: Callable[[], Awaitable[tuple[ChatRoute, PrefetchedStream]]]
+    ) -> None:
+        """读取上游流并广播给所有订阅者"""
+        stream = None
+        try:
+            flight.route, stream = await open_fn()
+            flight.notify()
+            async for chunk in stream:
+                flight.chunks.append(chunk)
+                flight.notify()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            self._forget(self._streams, key, flight)
+            if stream is not None:
+                await stream.aclose()
+            flight.done = True
+            flight.notify()
+
+    @staticmethod
+    def _forget(table: dict, key: str, flight) -> None:
+        # 只移除自己，避免误删之后同键的新调用
+        if table.get(key) is flight:
+            del table[key]
+
+    def snapshot(self) -> dict:
+        """合并统计，用于健康检查"""
+        return {
+            'inflight': len(self._calls) + len(self._streams),
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+        }
+
+
+# 全局实例
+singleflight = SingleFlight()
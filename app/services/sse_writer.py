@@ -0,0 +1,185 @@
+"""
+@File    : sse_writer.py
+@Author  : Martin
+@Desc    : 流式接口的 SSE 输出：预编码的固定字段 + 快速 JSON 编码（直接输出 UTF-8），可选按时间 / 字节数合并增量
+"""
+
+import asyncio
+from app.adapters.sse import json_dumps
+from app.core.config import settings
+from collections.abc import AsyncIterator
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+# 流式块的字段（顺序即输出顺序）；同一路流中前四个字段不变，只需编码一次
+STATIC_FIELDS = ('id', 'model', 'provider', 'fallback_hop')
+CHUNK_FIELDS = frozenset((*STATIC_FIELDS, 'content', 'reasoning_content', 'finish_reason', 'usage'))
+
+# 只有 content 的块（绝大多数）的固定结尾
+_CONTENT_ONLY_TAIL = b',"reasoning_content":null,"finish_reason":null,"usage":null}\n\n'
+
+
+class SSEWriter:
+    """
+    把聊天服务产出的块编码为 SSE 事件（每条流一个实例）
+    - 固定字段（id / model / provider / fallback_hop）编码一次后复用为事件前缀
+    - 开启合并窗口时，窗口内连续的增量合并为一个事件：距第一个增量满 window_ms 或累计满 max_bytes 即发送，
+      带 finish_reason / usage 的块立即发送
+    """
+
+    def __init__(self, window_ms: float | None = None, max_bytes: int | None = None):
+        self.window = (settings.SSE_COALESCE_MS if window_ms is None else window_ms) / 1000
+        self.max_bytes = settings.SSE_COALESCE_BYTES if max_bytes is None else max_bytes
+        self._static: tuple | None = None
+        self._prefix = b''
+
+    @staticmethod
+    def event(data: dict) -> bytes:
+        """编码任意事件（错误、缓存命中等非标准块）"""
+        return b'data: ' + json_dumps(data) + b'\n\n'
+
+    def encode(self, chunk: dict) -> bytes:
+        """编码一个流式块"""
+        if chunk.keys() != CHUNK_FIELDS:
+            return self.event(chunk)
+
+        static = (chunk['id'], chunk['model'], chunk['provider'], chunk['fallback_hop'])
+        if static != self._static:
+            # 前缀形如 data: {"id":null,"model":"...","provider":"...","fallback_hop":0,"content":
+            self._static = static
+            self._prefix = b'data: ' + json_dumps(dict(zip(STATIC_FIELDS, static)))[:-1] + b',"content":'
+
+        content = json_dumps(chunk['content'])
+        if chunk['reasoning_content'] is None and chunk['finish_reason'] is None and chunk['usage'] is None:
+            return self._prefix + content + _CONTENT_ONLY_TAIL
+        return b''.join((
+            self._prefix,
+            content,
+            b',"reasoning_content":',
+            json_dumps(chunk['reasoning_content']),
+            b',"finish_reason":',
+            json_dumps(chunk['finish_reason']),
+            b',"usage":',
+            json_dumps(chunk['usage']),
+            b'}\n\n',
+        ))
+
+    async def frames(self, chunks: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+        """
+        逐个产出 SSE 事件；源流出错时先发出已合并的内容再抛出
+        本生成器被关闭（客户端断开）时同时关闭源流，让上游立即停止
+        """
+        if self.window <= 0:
+            try:
+                async for chunk in chunks:
+                    yield self.encode(chunk)
+            finally:
+                await chunks.aclose()
+            return
+
+        coalescer = _Coalescer(self.window, self.max_bytes)
+        pump = asyncio.create_task(coalescer.pump(chunks))
+        try:
+            while True:
+                await coalescer.ready.wait()
+                coalescer.ready.clear()
+                batch, coalescer.out = coalescer.out, []
+                if batch:
+                    # 同一次唤醒里积攒的事件合并为一次写入
+                    yield b''.join(map(self.encode, batch))
+                if coalescer.done and not coalescer.out:
+                    if coalescer.error is not None:
+                        raise coalescer.error
+                    return
+        finally:
+            if not pump.done():
+                pump.cancel()
+            await asyncio.gather(pump, return_exceptions=True)
+            await chunks.aclose()
+
+
+class SSEResponse(StreamingResponse):
+    """
+    SSE 响应：无论正常结束、客户端断开（Starlette 取消发送任务）还是写入失败，都会关闭 body 生成器，
+    由生成器链把关闭传到上游流，而不是等垃圾回收
+    """
+
+    media_type = 'text/event-stream'
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+
+
+class _Coalescer:
+    """
+    在独立任务里读取源流并合并增量：每个增量只做列表追加，
+    每个窗口只安排一次定时器，到期、累计满 max_bytes 或遇到结束块时把合并结果交给写出端
+    """
+
+    def __init__(self, window: float, max_bytes: int):
+        self.window = window
+        self.max_bytes = max_bytes
+        self.out: list[dict] = []  # 待写出的块（按顺序）
+        self.ready = asyncio.Event()
+        self.done = False
+        self.error: Exception | None = None
+        self._head: dict | None = None  # 窗口内第一个块（提供固定字段）
+        self._content: list[str] = []
+        self._reasoning: list[str] = []
+        self._size = 0
+        self._timer: asyncio.TimerHandle | None = None
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        head = self._head
+        if head is not None:
+            self.out.append({
+                **head,
+                'content': ''.join(self._content),
+                'reasoning_content': ''.join(self._reasoning) or None,
+            })
+            self._head = None
+        self.ready.set()
+
+    def _same_stream(self, chunk: dict) -> bool:
+        head = self._head
+        return all(head[key] == chunk[key] for key in STATIC_FIELDS)
+
+    async def pump(self, chunks: AsyncIterator[dict]) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            async for chunk in chunks:
+                if chunk.keys() != CHUNK_FIELDS:
+                    # 非标准块（缓存命中、错误等）原样发送
+                    self._flush()
+                    self.out.append(chunk)
+                    continue
+                if self._head is not None and not self._same_stream(chunk):
+                    self._flush()
+                if self._head is None:
+                    self._head = chunk
+                    self._content, self._reasoning, self._size = [], [], 0
+                    self._timer = loop.call_later(self.window, self._flush)
+
+                content, reasoning = chunk['content'], chunk['reasoning_content']
+                if content:
+                    self._content.append(content)
+                    self._size += len(content.encode())
+                if reasoning:
+                    self._reasoning.append(reasoning)
+                    self._size += len(reasoning.encode())
+                if chunk['finish_reason'] or chunk['usage']:
+                    self._head = {**self._head, 'finish_reason': chunk['finish_reason'], 'usage': chunk['usage']}
+                    self._flush()
+                elif self._size >= self.max_bytes:
+                    self._flush()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._flush()
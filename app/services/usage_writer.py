@@ -0,0 +1,332 @@
+"""
+@File    : usage_writer.py
+@Author  : Martin
+@Desc    : 使用记录异步写入：请求事务提交后记录进入进程内队列，后台按条数或间隔批量 COPY 写入；
+           数据库不可用时写入本地文件，恢复后回放
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from app.adapters.sse import json_dumps, json_loads
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.crud.usage_log import UsageLogCreate, usage_log_crud
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+log = logging.getLogger('app')
+
+# 会话 info 中待提交入队的键
+_PENDING_KEY = 'usage_writer_pending'
+
+# 队列中的一条记录：(使用记录, 产生时间)
+_Row = tuple[UsageLogCreate, datetime]
+
+
+def _is_data_error(error: Exception) -> bool:
+    """记录本身无法写入（约束冲突、数据错误，如 API Key 已删除），重试也不会成功"""
+    sqlstate = getattr(error, 'sqlstate', None) or getattr(getattr(error, 'orig', None), 'sqlstate', None)
+    return bool(sqlstate) and sqlstate[:2] in ('22', '23')
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class UsageLogWriter:
+    """
+    使用记录写后队列
+    - submit 把记录登记在数据库会话上，事务提交后入队，回滚的记录不会写入
+    - 后台任务攒够 USAGE_WRITER_BATCH_SIZE 条或等待 USAGE_WRITER_FLUSH_INTERVAL 秒后写入一批（COPY）
+    - 队列满时请求最多等待 USAGE_WRITER_PUT_TIMEOUT 秒，仍满则在请求事务中直接写入（回到同步写入）
+    - 写入失败时整批写入本地文件（每个进程一个文件），每隔 USAGE_WRITER_RETRY_INTERVAL 秒重试并回放；
+      批次中个别记录无法写入时逐条写入并丢弃这些记录
+    - 应用关闭时写完队列中的记录；进程在回放中途退出时，已回放的部分下次可能重复写入
+    """
+
+    def __init__(self):
+        self._queue: asyncio.Queue[_Row] | None = None
+        self._space: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._retry_at = 0.0  # 数据库不可用时的下次重试时间
+        self._has_spill = False
+        self.written = 0
+        self.batches = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.overflows = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.USAGE_WRITER_ENABLED
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    @property
+    def _spill_dir(self) -> Path:
+        return Path(settings.USAGE_WRITER_SPILL_DIR)
+
+    @property
+    def _spill_path(self) -> Path:
+        return self._spill_dir / f'usage-{os.getpid()}.jsonl'
+
+    def start(self) -> None:
+        """启动后台写入（应用启动时调用），上次未回放的文件稍后回放"""
+        if not self.enabled or self._task is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._space = asyncio.Event()
+        self._has_spill = self._spill_dir.is_dir() and any(self._spill_dir.glob('*.jsonl'))
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """写完队列中的记录后停止（应用关闭时、所有请求与后台任务结束后调用）"""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def submit(self, db: AsyncSession, record: UsageLogCreate) -> None:
+        """登记一条使用记录，db 的事务提交后入队；未启动时在 db 的事务中直接写入"""
+        if self._task is None:
+            await usage_log_crud.insert(db, record)
+            return
+        if self._queue.qsize() >= settings.USAGE_WRITER_QUEUE_SIZE and not await self._wait_for_space():
+            self.overflows += 1
+            await usage_log_crud.insert(db, record)
+            return
+        db.info.setdefault(_PENDING_KEY, []).append(record)
+
+    async def _wait_for_space(self) -> bool:
+        try:
+            async with asyncio.timeout(settings.USAGE_WRITER_PUT_TIMEOUT):
+                while self._queue.qsize() >= settings.USAGE_WRITER_QUEUE_SIZE:
+                    self._space.clear()
+                    await self._space.wait()
+        except TimeoutError:
+            return False
+        return True
+
+    def _enqueue(self, records: list[UsageLogCreate]) -> None:
+        now = datetime.now(timezone.utc)
+        rows = [(record, now) for record in records]
+        if self._task is None:
+            # 登记后写入器已停止：直接写入文件，下次启动时回放
+            try:
+                self._append(rows)
+            except OSError as e:
+                self.dropped += len(rows)
+                log.error(f'Failed to spill {len(rows)} usage records: {e}')
+            return
+        for row in rows:
+            self._queue.put_nowait(row)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                first = await asyncio.wait_for(self._queue.get(), settings.USAGE_WRITER_RETRY_INTERVAL)
+            except TimeoutError:
+                await self._replay()
+                continue
+            batch = await self._collect(first)
+            self._space.set()
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            await self._replay()
+
+    async def _collect(self, first: _Row) -> list[_Row]:
+        """从 first 开始凑一批：达到批量上限或等待超过间隔为止"""
+        batch = [first]
+        deadline = time.monotonic() + settings.USAGE_WRITER_FLUSH_INTERVAL
+        while len(batch) < settings.USAGE_WRITER_BATCH_SIZE:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except TimeoutError:
+                break
+        return batch
+
+    async def _write(self, batch: list[_Row]) -> None:
+        if time.monotonic() < self._retry_at:
+            # 数据库不可用期间直接写入文件
+            await self._spill(batch)
+            return
+        remaining = await self._persist(batch)
+        if remaining:
+            await self._spill(remaining)
+
+    async def _insert(self, rows: list[_Row]) -> None:
+        async with AsyncSessionLocal() as db:
+            await usage_log_crud.bulk_insert(db, rows)
+            await db.commit()
+        self.written += len(rows)
+        self.batches += 1
+
+    async def _persist(self, rows: list[_Row]) -> list[_Row]:
+        """写入数据库，返回因数据库不可用而未写入的记录"""
+        try:
+            await self._insert(rows)
+            return []
+        except Exception as e:
+            if not _is_data_error(e):
+                self._unavailable(e)
+                return rows
+        # 批次中有无法写入的记录：逐条写入，丢弃这些记录
+        for i, row in enumerate(rows):
+            try:
+                await self._insert([row])
+            except Exception as e:
+                if not _is_data_error(e):
+                    self._unavailable(e)
+                    return rows[i:]
+                self.dropped += 1
+                log.error(f'Dropped usage record of API key {row[0].api_key_id}: {e}')
+        return []
+
+    def _unavailable(self, error: Exception) -> None:
+        self._retry_at = time.monotonic() + settings.USAGE_WRITER_RETRY_INTERVAL
+        log.warning(f'Usage log write failed, spilling to {self._spill_dir} until the database recovers: {error!r}')
+
+    async def _spill(self, rows: list[_Row]) -> None:
+        try:
+            await asyncio.to_thread(self._append, rows)
+        except OSError as e:
+            self.dropped += len(rows)
+            log.error(f'Failed to spill {len(rows)} usage records: {e}')
+
+    def _append(self, rows: list[_Row]) -> None:
+        lines = b''.join(
+            json_dumps({**record.model_dump(), 'created_at': created_at.isoformat()}) + b'\n'
+            for record, created_at in rows
+        )
+        self._spill_dir.mkdir(parents=True, exist_ok=True)
+        with open(self._spill_path, 'ab') as f:
+            f.write(lines)
+        self.spilled += len(rows)
+        self._has_spill = True
+
+    def _claim(self) -> list[Path]:
+        """取走本进程与已退出进程留下的文件（改名为本进程的回放文件，其他进程不会再取）"""
+        claimed = []
+        pid = os.getpid()
+        for path in sorted(self._spill_dir.glob('*.jsonl')):
+            # usage-<pid>.jsonl 或 replay-<pid>-<n>.jsonl
+            try:
+                owner = int(path.stem.split('-')[1])
+            except (IndexError, ValueError):
+                continue
+            if owner != pid and _process_alive(owner):
+                continue
+            if path.name.startswith(f'replay-{pid}-'):
+                claimed.append(path)
+                continue
+            target = self._spill_dir / f'replay-{pid}-{time.time_ns()}.jsonl'
+            try:
+                os.rename(path, target)
+            except FileNotFoundError:
+                continue
+            claimed.append(target)
+        return claimed
+
+    @staticmethod
+    def _read(path: Path) -> list[_Row]:
+        rows = []
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    data = json_loads(line)
+                    created_at = datetime.fromisoformat(data.pop('created_at'))
+                    rows.append((UsageLogCreate(**data), created_at))
+                except (ValueError, KeyError, TypeError) as e:
+                    # 进程写入中途退出留下的不完整行
+                    log.warning(f'Skipped invalid spilled usage record in {path.name}: {e}')
+        return rows
+
+    async def _replay(self) -> None:
+        """数据库恢复后回放文件中的记录"""
+        if not self._has_spill or time.monotonic() < self._retry_at:
+            return
+        self._has_spill = False
+        try:
+            paths = await asyncio.to_thread(self._claim)
+            for path in paths:
+                if not await self._replay_file(path):
+                    return
+        except OSError as e:
+            self._has_spill = True
+            log.error(f'Failed to replay spilled usage records: {e}')
+            return
+        if paths:
+            log.info(f'Replayed spilled usage records from {len(paths)} file(s)')
+
+    async def _replay_file(self, path: Path) -> bool:
+        """回放一个文件，数据库再次不可用时把未写入的记录放回本进程的文件并返回 False"""
+        rows = await asyncio.to_thread(self._read, path)
+        remaining = []
+        size = settings.USAGE_WRITER_BATCH_SIZE
+        for start in range(0, len(rows), size):
+            remaining = await self._persist(rows[start : start + size])
+            if remaining:
+                remaining += rows[start + size :]
+                break
+        self.replayed += len(rows) - len(remaining)
+        if remaining:
+            await self._spill(remaining)
+        await asyncio.to_thread(path.unlink, missing_ok=True)
+        return not remaining
+
+    def snapshot(self) -> dict:
+        """写入统计，用于健康检查"""
+        return {
+            'enabled': self.enabled,
+            'running': self.running,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'written': self.written,
+            'batches': self.batches,
+            'spilled': self.spilled,
+            'replayed': self.replayed,
+            'dropped': self.dropped,
+            'overflows': self.overflows,
+            'database_available': time.monotonic() >= self._retry_at,
+            'spill_pending': self._has_spill,
+        }
+
+
+# 全局实例
+usage_writer = UsageLogWriter()
+
+
+@event.listens_for(Session, 'after_commit')
+def _enqueue_pending(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        usage_writer._enqueue(pending)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_pending(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,140 @@
+"""
+@File    : bench_history_fetch.py
+@Author  : Martin
+@Desc    : 每轮历史读取的数据库耗时基准：对话长度分别为 10 / 1k / 100k 条消息时，
+           对比原来的读取方式（get_with_messages 加载整个对话 + 按 created_at 排序取消息）
+           与归属校验（不加载消息）+ 按 (conversation_id, seq) 索引倒序取最后 N 条，并输出新查询的执行计划
+           需要可用的 PostgreSQL（DATABASE_URL），数据写在独立的 schema 中，结束后删除
+
+运行：uv run python -m benchmarks.bench_history_fetch
+"""
+
+import asyncio
+import statistics
+import time
+from app.core.config import settings
+from app.crud.conversation import conversation_crud
+from app.models.api_key import APIKey
+from app.models.base import Base
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.models.user import User
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+SCHEMA = 'bench_history'
+SIZES = (10, 1_000, 100_000)
+WINDOW = 50  # 每轮读取的最近消息条数
+ROUNDS = 200
+BEFORE_ROUNDS = 20  # 原方式在 100k 条时单次较慢，少测几轮
+CONTENT_CHARS = 400
+
+
+async def _setup(engine) -> tuple[int, dict[int, int]]:
+    """建表并写入测试对话，返回 (API Key ID, {消息条数: 对话ID})"""
+    async with engine.begin() as conn:
+        await conn.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+        await conn.execute(text(f'CREATE SCHEMA {SCHEMA}'))
+        tables = [User.__table__, APIKey.__table__, Conversation.__table__, Message.__table__]
+        await conn.run_sync(lambda sync_conn: Base.metadata.create_all(sync_conn, tables=tables))
+
+    conversations = {}
+    async with AsyncSession(engine, expire_on_commit=False) as db:
+        user = User(username='bench', email='bench@example.com', hashed_password='x')
+        db.add(user)
+        await db.flush()
+        api_key = APIKey(key='bench', name='bench', user_id=user.id)
+        db.add(api_key)
+        await db.flush()
+        for size in SIZES:
+            conversation = Conversation(
+                api_key_id=api_key.id, title=f'{size}', model_name='deepseek-chat', provider='deepseek', last_seq=size
+            )
+            db.add(conversation)
+            await db.flush()
+            await db.execute(
+                text(
+                    """
+                    INSERT INTO messages (conversation_id, seq, role, content, tokens)
+                    SELECT :cid, g, CASE WHEN g % 2 = 1 THEN 'user' ELSE 'assistant' END, repeat('x', :chars), 100
+                    FROM generate_series(1, :size) AS g
+                    """
+                ),
+                {'cid': conversation.id, 'size': size, 'chars': CONTENT_CHARS},
+            )
+            conversations[size] = conversation.id
+        api_key_id = api_key.id
+        await db.commit()
+
+    async with engine.begin() as conn:
+        await conn.execute(text('ANALYZE messages'))
+        await conn.execute(text('ANALYZE conversations'))
+    return api_key_id, conversations
+
+
+async def _before(db: AsyncSession, conversation_id: int, api_key_id: int) -> None:
+    conversation = await conversation_crud.get_with_messages(db, conversation_id, api_key_id)
+    assert conversation is not None
+    await conversation_crud.get_messages(db, conversation_id, limit=WINDOW)
+    db.expunge_all()
+
+
+async def _after(db: AsyncSession, conversation_id: int, api_key_id: int) -> None:
+    conversation = await conversation_crud.get_owned(db, conversation_id, api_key_id)
+    assert conversation is not None
+    await conversation_crud.get_recent_messages(db, conversation_id, WINDOW)
+    db.expunge_all()
+
+
+async def _measure(engine, fetch, conversation_id: int, api_key_id: int, rounds: int) -> tuple[float, float]:
+    samples = []
+    async with AsyncSession(engine) as db:
+        await fetch(db, conversation_id, api_key_id)  # 预热
+        for _ in range(rounds):
+            start = time.perf_counter()
+            await fetch(db, conversation_id, api_key_id)
+            samples.append(time.perf_counter() - start)
+            await db.rollback()
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+async def _plan(engine, conversation_id: int) -> list[str]:
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            text(
+                'EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) '
+                'SELECT * FROM messages WHERE conversation_id = :cid ORDER BY seq DESC LIMIT :n'
+            ),
+            {'cid': conversation_id, 'n': WINDOW},
+        )
+        return [row[0] for row in result]
+
+
+async def main() -> None:
+    engine = create_async_engine(
+        str(settings.DATABASE_URL), connect_args={'server_settings': {'search_path': SCHEMA}}
+    )
+    try:
+        api_key_id, conversations = await _setup(engine)
+        print(f'history fetch per turn, last {WINDOW} messages, {CONTENT_CHARS} chars each')
+        for size in SIZES:
+            conversation_id = conversations[size]
+            before = await _measure(engine, _before, conversation_id, api_key_id, BEFORE_ROUNDS)
+            after = await _measure(engine, _after, conversation_id, api_key_id, ROUNDS)
+            print(
+                f'  {size:>7} messages  before p50 {before[0] * 1000:8.2f}ms p99 {before[1] * 1000:8.2f}ms'
+                f'  |  after p50 {after[0] * 1000:6.2f}ms p99 {after[1] * 1000:6.2f}ms'
+            )
+
+        print(f'plan for the tail query on the {SIZES[-1]}-message conversation:')
+        for line in await _plan(engine, conversations[SIZES[-1]]):
+            print(f'  {line}')
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+"""
+@File    : bench_http_pool.py
+@Author  : Martin
+@Desc    : 对比「每次请求新建客户端」与「长连接池」的单次请求延迟
+
+运行：uv run python -m benchmarks.bench_http_pool
+"""
+
+import asyncio
+import httpx
+import statistics
+import time
+from app.adapters.base import ChatMessage, ChatRequest
+from app.adapters.deepseek import DeepSeekerAdapter
+from benchmarks.mock_upstream import MockUpstream
+
+REQUESTS = 500
+
+
+async def _measure(call) -> list[float]:
+    samples = []
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        await call()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _report(name: str, samples: list[float]) -> float:
+    p50 = statistics.median(samples)
+    p99 = statistics.quantiles(samples, n=100)[98]
+    print(f'{name:<22} p50={p50:7.3f} ms  p99={p99:7.3f} ms')
+    return p50
+
+
+async def main():
+    upstream = await MockUpstream().start()
+    request = ChatRequest(model='mock-model', messages=[ChatMessage(role='user', content='ping')])
+    payload = {'model': 'mock-model', 'messages': [{'role': 'user', 'content': 'ping'}], 'stream': False}
+
+    async def fresh_client():
+        # 重构前的行为：每次调用都新建并关闭 AsyncClient
+        async with httpx.AsyncClient(base_url=upstream.base_url) as client:
+            response = await client.post('/chat/completions', json=payload)
+            response.raise_for_status()
+
+    adapter = DeepSeekerAdapter(api_key='bench', base_url=upstream.base_url)
+    await adapter.open()
+
+    connections_before = upstream.connections
+    fresh = _report('fresh client/request', await _measure(fresh_client))
+    fresh_connections = upstream.connections - connections_before
+
+    connections_before = upstream.connections
+    pooled = _report('pooled adapter client', await _measure(lambda: adapter.chat(request)))
+    pooled_connections = upstream.connections - connections_before
+
+    print(f'connections opened: fresh={fresh_connections} pooled={pooled_connections}')
+    print(f'saved per request (p50): {fresh - pooled:.3f} ms')
+
+    await adapter.close()
+    await upstream.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
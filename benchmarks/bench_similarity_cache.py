@@ -0,0 +1,91 @@
+"""
+@File    : bench_similarity_cache.py
+@Author  : Martin
+@Desc    : 近似缓存查找延迟基准：100 万条签名的 LSH 索引，分别测纯索引查找与含 SimHash 计算的完整查找
+
+运行：uv run python -m benchmarks.bench_similarity_cache
+"""
+
+import random
+import resource
+import statistics
+import time
+from app.adapters.base import ChatMessage, ChatRequest
+from app.core.enums import ModelProvider
+from app.services.response_cache import CachedResponse
+from app.services.similarity_cache import (
+    SimilarityIndex,
+    conversation_features,
+    request_scope,
+    simhash,
+)
+
+ENTRIES = 1_000_000
+QUERIES = 2_000
+BANDS = (4, 8)
+PROMPT = '请把下面这段订单信息整理成 JSON：订单号 {order}，客户 张三，金额 {amount} 元，下单时间 2025-11-0{day} 10:00。'
+
+
+def _request(order: int, amount: int, day: int, spaces: str = ' ') -> ChatRequest:
+    content = PROMPT.format(order=order, amount=amount, day=day).replace(' ', spaces)
+    return ChatRequest(model='deepseek-chat', messages=[ChatMessage(role='user', content=content)], temperature=0)
+
+
+def _percentiles(samples: list[float]) -> str:
+    samples = sorted(samples)
+    p50 = statistics.median(samples)
+    p99 = samples[int(len(samples) * 0.99)]
+    return f'p50 {p50 * 1e6:8.1f}us  p99 {p99 * 1e6:8.1f}us'
+
+
+def _flip(signature: int, bits: int) -> int:
+    for bit in random.sample(range(64), bits):
+        signature ^= 1 << bit
+    return signature
+
+
+def bench(bands: int) -> None:
+    random.seed(42)
+    value = CachedResponse('deepseek', 'deepseek-chat', '{"ok": true}', 'stop', {'total_tokens': 1})
+    base = _request(10001, 250, 3)
+    scope = request_scope(1, ModelProvider.DEEPSEEK, base)
+    index = SimilarityIndex(bands, ENTRIES)
+
+    start = time.perf_counter()
+    signatures = [random.getrandbits(64) for _ in range(ENTRIES - 1)]
+    for signature in signatures:
+        index.add(scope, signature, float('inf'), value)
+    index.add(scope, simhash(conversation_features(base)), float('inf'), value)
+    build = time.perf_counter() - start
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    # 纯索引查找：已有签名翻转 0~3 位（必定命中）与随机签名（基本未命中）
+    near, miss = [], []
+    for _ in range(QUERIES):
+        query = _flip(random.choice(signatures), random.randint(0, bands - 1))
+        t = time.perf_counter()
+        assert index.query(scope, query, bands - 1, 0.0) is not None
+        near.append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        index.query(scope, random.getrandbits(64), bands - 1, 0.0)
+        miss.append(time.perf_counter() - t)
+
+    # 完整查找：规范化 + SimHash + 索引查找，请求只有空白与订单号不同
+    full, hits = [], 0
+    requests = [_request(10001 + random.randint(0, 1), 250, 3, random.choice([' ', '  ', '\t'])) for _ in range(QUERIES)]
+    for request in requests:
+        t = time.perf_counter()
+        found = index.query(scope, simhash(conversation_features(request)), bands - 1, 0.0)
+        full.append(time.perf_counter() - t)
+        hits += found is not None
+
+    print(f'bands={bands} entries={len(index):,} build {build:.1f}s  max RSS {rss_mb:,.0f} MB')
+    print(f'  index near-dup  {_percentiles(near)}')
+    print(f'  index miss      {_percentiles(miss)}')
+    print(f'  full lookup     {_percentiles(full)}  hit rate {hits / QUERIES:.0%}')
+
+
+if __name__ == '__main__':
+    for bands in BANDS:
+        bench(bands)
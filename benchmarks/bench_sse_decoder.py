@@ -0,0 +1,73 @@
+"""
+@File    : bench_sse_decoder.py
+@Author  : Martin
+@Desc    : SSE 解析吞吐基准（tokens/s）：旧的 aiter_lines + json.loads 对比增量字节解码器
+
+运行：uv run python -m benchmarks.bench_sse_decoder
+"""
+
+import asyncio
+import json
+import time
+from app.adapters.base import StreamChunk
+from app.adapters.sse import iter_stream_chunks, json_loads
+from benchmarks.mock_upstream import sse_body
+from httpx._decoders import LineDecoder, TextDecoder
+
+TOKENS = 200_000
+NETWORK_CHUNK = 1400  # 模拟 TCP 分段
+ROUNDS = 3
+
+
+def _segments() -> list[bytes]:
+    body = sse_body([f'词{i % 10}' for i in range(TOKENS)])
+    return [body[i : i + NETWORK_CHUNK] for i in range(0, len(body), NETWORK_CHUNK)]
+
+
+async def _aiter(segments: list[bytes]):
+    for segment in segments:
+        yield segment
+
+
+async def legacy(segments: list[bytes]) -> int:
+    """重构前各适配器的写法：逐行解码为 str，strip/startswith 后完整 json.loads"""
+    count = 0
+    text_decoder, line_decoder = TextDecoder(), LineDecoder()
+    async for raw in _aiter(segments):
+        for line in line_decoder.decode(text_decoder.decode(raw)):
+            if not line.strip():
+                continue
+            if line.startswith('data: '):
+                data_str = line[6:]
+                if data_str == '[DONE]':
+                    return count
+                data = json.loads(data_str)
+                if data['choices'] and 'content' in data['choices'][0].get('delta', {}):
+                    StreamChunk(content=data['choices'][0]['delta']['content'], finish_reason=None)
+                    count += 1
+    return count
+
+
+async def incremental(segments: list[bytes]) -> int:
+    count = 0
+    async for chunk in iter_stream_chunks(_aiter(segments)):
+        if chunk.content:
+            count += 1
+    return count
+
+
+async def main():
+    segments = _segments()
+    print(f'json backend: {json_loads.__module__}')
+    for name, parser in (('legacy aiter_lines', legacy), ('incremental bytes', incremental)):
+        timings = []
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            count = await parser(segments)
+            timings.append(time.perf_counter() - start)
+        elapsed = min(timings)
+        print(f'{name:<20} {count / elapsed:>12,.0f} tokens/s  ({count} tokens in {elapsed:.3f}s)')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+"""
+@File    : bench_sse_writer.py
+@Author  : Martin
+@Desc    : SSE 输出 CPU 基准：每 1000 个流式 Token 的 CPU 耗时、写入次数与字节数
+           对比原来的逐块 json.dumps（ensure_ascii）与 SSEWriter（预编码前缀 + UTF-8，可选合并窗口）；
+           每个事件真实写入一个子进程管道，计入每次写入的系统调用开销（接收端 CPU 不计入）
+
+运行：uv run python -m benchmarks.bench_sse_writer
+"""
+
+import asyncio
+import json
+import time
+from app.services.sse_writer import SSEWriter
+
+STREAMS = 200
+TOKENS = 1000
+INTERVAL = 0.002  # 上游每个 Token 的间隔（秒）
+TEXT = '好的，下面是整理后的订单信息。订单号 10001，客户张三，金额 250 元，状态为已发货。'
+
+
+async def _source(tokens: list[str]):
+    """按聊天服务的格式产出块，Token 之间有固定间隔"""
+    for token in tokens:
+        await asyncio.sleep(INTERVAL)
+        yield {
+            'id': None,
+            'model': 'deepseek-chat',
+            'provider': 'deepseek',
+            'fallback_hop': 0,
+            'content': token,
+            'reasoning_content': None,
+            'finish_reason': None,
+            'usage': None,
+        }
+
+
+async def _baseline(chunks):
+    """原实现：每块一次 json.dumps，Starlette 再把 str 编码为 bytes"""
+    async for chunk in chunks:
+        yield f'data: {json.dumps(chunk)}\n\n'.encode('utf-8')
+
+
+async def _noop(chunks):
+    async for chunk in chunks:
+        yield b''
+
+
+async def _drain(frames, sink: asyncio.StreamWriter | None) -> tuple[int, int]:
+    count = size = 0
+    async for frame in frames:
+        count += 1
+        size += len(frame)
+        if sink is not None:
+            sink.write(frame)
+            await sink.drain()
+    return count, size
+
+
+async def run(make_frames, sink: asyncio.StreamWriter | None) -> tuple[float, int, int]:
+    # 1~2 个字符一个 Token
+    tokens = [TEXT[i % len(TEXT) : i % len(TEXT) + 1 + i % 2] for i in range(TOKENS)]
+    start = time.process_time()
+    results = await asyncio.gather(*(_drain(make_frames(_source(tokens)), sink) for _ in range(STREAMS)))
+    cpu = time.process_time() - start
+    frames = sum(r[0] for r in results) / STREAMS
+    size = sum(r[1] for r in results) / STREAMS
+    return cpu, frames, size
+
+
+async def main() -> None:
+    # 接收端：丢弃所有输入的子进程
+    sink = await asyncio.create_subprocess_exec('sh', '-c', 'cat > /dev/null', stdin=asyncio.subprocess.PIPE)
+    variants = [
+        ('source only', _noop),
+        ('json.dumps (before)', _baseline),
+        ('SSEWriter', lambda chunks: SSEWriter(0).frames(chunks)),
+        ('SSEWriter 20ms', lambda chunks: SSEWriter(20, 512).frames(chunks)),
+        ('SSEWriter 50ms', lambda chunks: SSEWriter(50, 512).frames(chunks)),
+    ]
+    base_cpu = None
+    print(f'{STREAMS} streams x {TOKENS} tokens, one token every {INTERVAL * 1000:.0f}ms')
+    for name, make_frames in variants:
+        cpu, frames, size = await run(make_frames, sink.stdin if base_cpu is not None else None)
+        if base_cpu is None:
+            base_cpu = cpu
+            print(f'  {name:<20} {cpu / STREAMS * 1000:7.2f} ms CPU / 1000 tokens (event loop + source)')
+            continue
+        net = (cpu - base_cpu) / STREAMS * 1000
+        print(f'  {name:<20} {net:7.2f} ms CPU / 1000 tokens  {frames:6.0f} writes  {size / 1024:7.1f} KB')
+
+    sink.stdin.close()
+    await sink.wait()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
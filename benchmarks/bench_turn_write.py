@@ -0,0 +1,151 @@
+"""
+@File    : bench_turn_write.py
+@Author  : Martin
+@Desc    : 每轮对话写入的数据库往返次数与耗时基准：
+           对比原来的逐条写入（创建对话 / 每条消息 / 使用记录各一次 flush + refresh）
+           与 conversation_crud.save_turn（一条语句写入对话、全部消息与使用记录），分别测新对话与已有对话
+           需要可用的 PostgreSQL（DATABASE_URL），数据写在独立的 schema 中，结束后删除
+
+运行：uv run python -m benchmarks.bench_turn_write
+"""
+
+import asyncio
+import itertools
+import statistics
+import time
+from app.core.config import settings
+from app.crud.conversation import ConversationCreate, conversation_crud
+from app.crud.usage_log import UsageLogCreate, usage_log_crud
+from app.models.api_key import APIKey
+from app.models.base import Base
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.models.usage_log import UsageLog
+from app.models.user import User
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+SCHEMA = 'bench_turn_write'
+ROUNDS = 300
+USER_MESSAGES = 1  # 每轮的用户消息条数（另有一条 AI 回复）
+CONTENT = '请把下面这段订单信息整理成 JSON：订单号 10001，客户张三，金额 250 元。' * 4
+
+# 原实现没有序号列，这里在进程内分配，不计入往返
+_existing_seq = itertools.count(1)
+
+
+def _usage(api_key_id: int, conversation_id: int | None) -> UsageLogCreate:
+    return UsageLogCreate(
+        api_key_id=api_key_id,
+        conversation_id=conversation_id,
+        model_name='deepseek-chat',
+        provider='deepseek',
+        prompt_tokens=120,
+        completion_tokens=80,
+        total_tokens=200,
+        cost=0.0001,
+        response_time=1.2,
+        extra_data={'attempts': 1},
+    )
+
+
+def _messages() -> list[tuple[str, str, int]]:
+    return [('user', CONTENT, 0)] * USER_MESSAGES + [('assistant', CONTENT, 80)]
+
+
+async def _before(db: AsyncSession, api_key_id: int, conversation_id: int | None) -> int:
+    """原实现：创建对话、每条消息、使用记录各自 flush + refresh"""
+    seqs = _existing_seq
+    if conversation_id is None:
+        conversation = await conversation_crud.create(
+            db, ConversationCreate(api_key_id=api_key_id, title='bench', model_name='deepseek-chat', provider='deepseek')
+        )
+        conversation_id = conversation.id
+        seqs = itertools.count(1)
+    for role, content, tokens in _messages():
+        message = Message(conversation_id=conversation_id, seq=next(seqs), role=role, content=content, tokens=tokens)
+        db.add(message)
+        await db.flush()
+        await db.refresh(message)
+    await usage_log_crud.create(db, _usage(api_key_id, conversation_id))
+    return conversation_id
+
+
+async def _after(db: AsyncSession, api_key_id: int, conversation_id: int | None) -> int:
+    """save_turn：一条语句写入本轮"""
+    new_conversation = None
+    if conversation_id is None:
+        new_conversation = ConversationCreate(
+            api_key_id=api_key_id, title='bench', model_name='deepseek-chat', provider='deepseek'
+        )
+    return await conversation_crud.save_turn(
+        db, api_key_id, conversation_id, _messages(), new_conversation, _usage(api_key_id, conversation_id)
+    )
+
+
+async def _measure(engine, write, api_key_id: int, existing: int | None) -> tuple[float, float, float]:
+    """返回 (每轮往返次数, p50 耗时, p99 耗时)；existing 为空时每轮新建对话"""
+    statements = 0
+
+    def count(*_):
+        nonlocal statements
+        statements += 1
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', count)
+    samples = []
+    try:
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            async with AsyncSession(engine, expire_on_commit=False) as db:
+                await write(db, api_key_id, existing)
+                await db.commit()
+            samples.append(time.perf_counter() - start)
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', count)
+    samples.sort()
+    # BEGIN 与 COMMIT 不经过 before_cursor_execute，各计一次
+    return statements / ROUNDS + 2, statistics.median(samples), samples[int(len(samples) * 0.99)]
+
+
+async def main() -> None:
+    engine = create_async_engine(str(settings.DATABASE_URL), connect_args={'server_settings': {'search_path': SCHEMA}})
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+            await conn.execute(text(f'CREATE SCHEMA {SCHEMA}'))
+            tables = [User.__table__, APIKey.__table__, Conversation.__table__, Message.__table__, UsageLog.__table__]
+            await conn.run_sync(lambda sync_conn: Base.metadata.create_all(sync_conn, tables=tables))
+
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            user = User(username='bench', email='bench@example.com', hashed_password='x')
+            db.add(user)
+            await db.flush()
+            api_key = APIKey(key='bench', name='bench', user_id=user.id)
+            db.add(api_key)
+            await db.flush()
+            api_key_id = api_key.id
+            existing = {}
+            for name in ('before', 'after'):
+                conversation = Conversation(api_key_id=api_key_id, title=name, model_name='deepseek-chat', provider='deepseek')
+                db.add(conversation)
+                await db.flush()
+                existing[name] = conversation.id
+            await db.commit()
+
+        print(f'{ROUNDS} turns, {USER_MESSAGES} user message(s) + 1 reply per turn')
+        for label, conversation in (('new conversation', None), ('existing conversation', True)):
+            for name, write in (('before', _before), ('save_turn', _after)):
+                target = existing['before' if write is _before else 'after'] if conversation else None
+                round_trips, p50, p99 = await _measure(engine, write, api_key_id, target)
+                print(
+                    f'  {label:<22} {name:<10} {round_trips:5.1f} round trips/turn'
+                    f'  p50 {p50 * 1000:6.2f}ms  p99 {p99 * 1000:6.2f}ms'
+                )
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
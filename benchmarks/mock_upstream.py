@@ -0,0 +1,104 @@
+"""
+@File    : mock_upstream.py
+@Author  : Martin
+@Desc    : 基准测试用的本地 OpenAI 兼容上游（仅标准库，支持 keep-alive 与 SSE）
+"""
+
+import asyncio
+import json
+
+COMPLETION = {
+    'id': 'chatcmpl-mock',
+    'object': 'chat.completion',
+    'model': 'mock-model',
+    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': 'pong'}, 'finish_reason': 'stop'}],
+    'usage': {'prompt_tokens': 5, 'completion_tokens': 1, 'total_tokens': 6},
+}
+
+
+def sse_body(tokens: list[str], usage: bool = True) -> bytes:
+    """构造 OpenAI 风格的 SSE 响应体"""
+    frames = []
+    for token in tokens:
+        chunk = {'id': 'chatcmpl-mock', 'choices': [{'index': 0, 'delta': {'content': token}, 'finish_reason': None}]}
+        frames.append(f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n')
+    last = {'id': 'chatcmpl-mock', 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]}
+    frames.append(f'data: {json.dumps(last)}\n\n')
+    if usage:
+        tail = {
+            'id': 'chatcmpl-mock',
+            'choices': [],
+            'usage': {'prompt_tokens': 5, 'completion_tokens': len(tokens), 'total_tokens': 5 + len(tokens)},
+        }
+        frames.append(f'data: {json.dumps(tail)}\n\n')
+    frames.append('data: [DONE]\n\n')
+    return ''.join(frames).encode()
+
+
+class MockUpstream:
+    """
+    极简 HTTP/1.1 服务
+    POST /chat/completions 根据 payload.stream 返回 JSON 或 SSE；GET /models 返回模型列表
+    """
+
+    def __init__(
+        self,
+        stream_tokens: list[str] | None = None,
+        delay: float = 0.0,
+        status: int = 200,
+        headers: dict[str, str] | None = None,
+    ):
+        self.stream_tokens = stream_tokens or ['po', 'ng']
+        self.delay = delay
+        self.status = status  # 非 200 时所有请求返回该错误码
+        self.headers = headers or {}  # 附加响应头，如 Retry-After、x-ratelimit-*
+        self.requests = 0
+        self.connections = 0
+        self._server: asyncio.Server | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f'http://{host}:{port}'
+
+    async def start(self) -> 'MockUpstream':
+        self._server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        return self
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                lines = head.decode('latin-1').split('\r\n')
+                method, path, _ = lines[0].split(' ', 2)
+                headers = {k.lower(): v.strip() for k, _, v in (line.partition(':') for line in lines[1:] if line)}
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                self.requests += 1
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+
+                if self.status != 200:
+                    payload, content_type = json.dumps({'error': 'mock failure'}).encode(), 'application/json'
+                elif method == 'GET' and path.endswith('/models'):
+                    payload, content_type = json.dumps({'data': [{'id': 'mock-model'}]}).encode(), 'application/json'
+                elif json.loads(body or b'{}').get('stream'):
+                    payload, content_type = sse_body(self.stream_tokens), 'text/event-stream'
+                else:
+                    payload, content_type = json.dumps(COMPLETION).encode(), 'application/json'
+
+                extra = ''.join(f'{k}: {v}\r\n' for k, v in self.headers.items())
+                writer.write(
+                    f'HTTP/1.1 {self.status} MOCK\r\nContent-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n'
+                    f'{extra}Connection: keep-alive\r\n\r\n'.encode()
+                    + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,107 @@
+"""
+@File    : test_circuit_breaker.py
+@Author  : Martin
+@Desc    : 熔断器：closed -> open -> half_open -> closed / open 的状态切换
+"""
+
+import pytest
+from app.adapters import circuit_breaker
+from app.adapters.circuit_breaker import CircuitBreaker, CircuitState
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = _Clock()
+    monkeypatch.setattr(circuit_breaker, 'time', fake)
+    return fake
+
+
+def _breaker(**kwargs) -> CircuitBreaker:
+    options = {'window_seconds': 60, 'min_requests': 4, 'failure_rate': 0.5, 'open_seconds': 30, 'half_open_probes': 1}
+    breaker = CircuitBreaker('test', **{**options, **kwargs})
+    breaker.enabled = True
+    return breaker
+
+
+def _trip(breaker: CircuitBreaker) -> None:
+    for failed in (False, True, False, True):
+        assert breaker.allow()
+        breaker.record(failed, 0.1)
+
+
+def test_opens_when_failure_rate_reached(clock):
+    breaker = _breaker()
+    for _ in range(3):
+        breaker.record(True, 0.1)
+    # 样本数不足 min_requests 时不熔断
+    assert breaker.state is CircuitState.CLOSED
+
+    breaker.record(False, 0.1)
+    assert breaker.state is CircuitState.OPEN
+    assert breaker.trips == 1
+    assert not breaker.allow()
+    assert breaker.score == 0.0
+
+
+def test_opens_on_slow_calls(clock):
+    breaker = _breaker(slow_call_seconds=5, slow_call_rate=0.5)
+    for latency in (1, 6, 1, 6):
+        breaker.record(False, latency)
+    assert breaker.state is CircuitState.OPEN
+
+
+def test_half_open_probe_success_closes(clock):
+    breaker = _breaker()
+    _trip(breaker)
+
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.state is CircuitState.HALF_OPEN
+    # 探测名额已用完
+    assert not breaker.allow()
+
+    breaker.record(False, 0.1)
+    assert breaker.state is CircuitState.CLOSED
+    assert breaker.allow()
+    assert breaker.snapshot()['requests'] == 0
+
+
+def test_half_open_probe_failure_reopens(clock):
+    breaker = _breaker()
+    _trip(breaker)
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state is CircuitState.OPEN
+    assert breaker.trips == 2
+    assert not breaker.allow()
+    assert breaker.snapshot()['retry_in'] == 30.0
+
+
+def test_cancelled_probe_returns_its_slot(clock):
+    breaker = _breaker()
+    _trip(breaker)
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_results_of_calls_sent_before_trip_are_ignored(clock):
+    breaker = _breaker()
+    _trip(breaker)
+    breaker.record(False, 0.1)
+    assert breaker.state is CircuitState.OPEN
+    assert breaker.snapshot()['requests'] == 0
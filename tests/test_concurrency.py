@@ -0,0 +1,72 @@
+"""
+@File    : test_concurrency.py
+@Author  : Martin
+@Desc    : 自适应并发限制：429 时乘性下降并按 Retry-After 暂停，延迟正常时加性增长
+"""
+
+import asyncio
+import httpx
+import pytest
+from app.adapters.concurrency import AdaptiveLimiter, ConcurrencyLimitError
+from app.core.config import settings
+
+
+@pytest.fixture
+def limiter(monkeypatch) -> AdaptiveLimiter:
+    monkeypatch.setattr(settings, 'PROVIDER_CONCURRENCY_INITIAL', 16)
+    monkeypatch.setattr(settings, 'PROVIDER_CONCURRENCY_MIN', 2)
+    monkeypatch.setattr(settings, 'PROVIDER_THROTTLE_BACKOFF', 0.5)
+    monkeypatch.setattr(settings, 'PROVIDER_QUEUE_TIMEOUT', 0.05)
+    limiter = AdaptiveLimiter()
+    limiter._last_decrease = float('-inf')
+    return limiter
+
+
+async def test_429_halves_limit(limiter):
+    await limiter.on_response(httpx.Response(429))
+    assert limiter.limit == 8
+    assert limiter.throttled == 1
+
+
+async def test_429s_in_one_round_decrease_once(limiter):
+    await limiter.on_response(httpx.Response(429))
+    await limiter.on_response(httpx.Response(429))
+    assert limiter.limit == 8
+    assert limiter.throttled == 2
+
+
+async def test_decrease_stops_at_min_limit(limiter):
+    for _ in range(5):
+        limiter._last_decrease = float('-inf')
+        await limiter.on_response(httpx.Response(429))
+    assert limiter.limit == 2
+
+
+async def test_retry_after_pauses_admission(limiter):
+    await limiter.on_response(httpx.Response(429, headers={'retry-after': '5'}))
+    assert limiter.snapshot()['paused_for'] > 4
+    # 暂停时间超过排队上限，直接拒绝而不是排队
+    with pytest.raises(ConcurrencyLimitError) as exc_info:
+        await limiter.acquire()
+    assert exc_info.value.retry_after > 4
+    assert limiter.rejected == 1
+
+
+async def test_success_does_not_decrease(limiter):
+    await limiter.on_response(httpx.Response(200))
+    limiter.observe_latency(0.1)
+    assert limiter.limit > 16
+
+
+async def test_queued_request_admitted_after_release(limiter):
+    limiter.limit = 2.0
+    await limiter.acquire()
+    await limiter.acquire()
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    assert limiter.queue_depth == 1
+
+    limiter.release()
+    await waiter
+    assert limiter.inflight == 2
+    assert limiter.queue_depth == 0
@@ -0,0 +1,153 @@
+"""
+@File    : test_singleflight.py
+@Author  : Martin
+@Desc    : 相同请求合并：follower 共享结果 / 流，leader 被取消不影响其他等待者
+"""
+
+import asyncio
+import pytest
+from app.services.singleflight import SingleFlight
+
+
+async def test_call_fans_out_one_result_to_followers():
+    flight = SingleFlight()
+    release = asyncio.Event()
+    calls = 0
+
+    async def upstream():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return 'answer'
+
+    leader = asyncio.create_task(flight.call('k', upstream))
+    await asyncio.sleep(0)
+    followers = [asyncio.create_task(flight.call('k', upstream)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await leader == ('answer', False)
+    assert await asyncio.gather(*followers) == [('answer', True)] * 3
+    assert calls == 1
+    assert flight.snapshot() == {'inflight': 0, 'leaders': 1, 'coalesced': 3}
+
+
+async def test_call_survives_leader_cancellation():
+    flight = SingleFlight()
+    release = asyncio.Event()
+    upstream_cancelled = False
+
+    async def upstream():
+        nonlocal upstream_cancelled
+        try:
+            await release.wait()
+        except asyncio.CancelledError:
+            upstream_cancelled = True
+            raise
+        return 'answer'
+
+    leader = asyncio.create_task(flight.call('k', upstream))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flight.call('k', upstream))
+    await asyncio.sleep(0)
+
+    leader.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    release.set()
+
+    assert await follower == ('answer', True)
+    assert not upstream_cancelled
+
+
+async def test_call_cancels_upstream_when_every_waiter_leaves():
+    flight = SingleFlight()
+    started = asyncio.Event()
+    upstream_cancelled = asyncio.Event()
+
+    async def upstream():
+        started.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            upstream_cancelled.set()
+            raise
+
+    waiters = [asyncio.create_task(flight.call('k', upstream)) for _ in range(2)]
+    await started.wait()
+    for waiter in waiters:
+        waiter.cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+
+    await asyncio.wait_for(upstream_cancelled.wait(), 1)
+    assert flight.snapshot()['inflight'] == 0
+
+
+class _Upstream:
+    """按需放行块的上游流"""
+
+    def __init__(self, chunks: list[str]):
+        self.chunks = chunks
+        self.opened = 0
+        self.closed = False
+        self.release = asyncio.Event()
+
+    async def open(self):
+        self.opened += 1
+        return 'route', self._stream()
+
+    async def _stream(self):
+        try:
+            yield self.chunks[0]
+            await self.release.wait()
+            for chunk in self.chunks[1:]:
+                yield chunk
+        finally:
+            self.closed = True
+
+
+async def _drain(subscription) -> list[str]:
+    return [chunk async for chunk in subscription]
+
+
+async def test_stream_replays_every_chunk_to_late_followers():
+    flight = SingleFlight()
+    upstream = _Upstream(['a', 'b', 'c'])
+
+    route, leader, leader_shared = await flight.open_stream('k', upstream.open)
+    _, follower, follower_shared = await flight.open_stream('k', upstream.open)
+    upstream.release.set()
+
+    assert route == 'route'
+    assert (leader_shared, follower_shared) == (False, True)
+    assert await asyncio.gather(_drain(leader), _drain(follower)) == [['a', 'b', 'c'], ['a', 'b', 'c']]
+    assert upstream.opened == 1
+
+
+async def test_stream_keeps_upstream_until_last_subscriber_closes():
+    flight = SingleFlight()
+    upstream = _Upstream(['a', 'b', 'c'])
+
+    _, leader, _ = await flight.open_stream('k', upstream.open)
+    _, follower, _ = await flight.open_stream('k', upstream.open)
+
+    # leader 断开：上游继续为 follower 读取
+    await leader.aclose()
+    upstream.release.set()
+    assert await _drain(follower) == ['a', 'b', 'c']
+    await follower.aclose()
+    assert upstream.closed
+
+
+async def test_stream_cancels_upstream_when_every_subscriber_closes():
+    flight = SingleFlight()
+    upstream = _Upstream(['a', 'b'])
+
+    _, leader, _ = await flight.open_stream('k', upstream.open)
+    _, follower, _ = await flight.open_stream('k', upstream.open)
+    await leader.aclose()
+    await follower.aclose()
+    await asyncio.sleep(0.01)
+
+    assert upstream.closed
+    assert flight.snapshot()['inflight'] == 0
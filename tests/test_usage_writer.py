@@ -0,0 +1,162 @@
+"""
+@File    : test_usage_writer.py
+@Author  : Martin
+@Desc    : 使用记录写入：数据库不可用时写入本地文件，恢复后回放；个别无法写入的记录被丢弃
+"""
+
+import time
+from datetime import datetime, timezone
+import pytest
+from app.core.config import settings
+from app.crud.usage_log import UsageLogCreate
+from app.services import usage_writer as usage_writer_module
+from app.services.usage_writer import UsageLogWriter
+
+
+class _Session:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def commit(self):
+        pass
+
+
+class _DataError(Exception):
+    """带 sqlstate 的数据库错误（外键约束冲突）"""
+
+    sqlstate = '23503'
+
+
+class _Database:
+    """替代 usage_log_crud.bulk_insert：可切换为不可用，或拒绝某个 API Key 的记录"""
+
+    def __init__(self):
+        self.rows: list[tuple[UsageLogCreate, datetime]] = []
+        self.available = True
+        self.rejected_key: int | None = None
+
+    async def bulk_insert(self, db, rows):
+        if not self.available:
+            raise ConnectionRefusedError('database is down')
+        if any(record.api_key_id == self.rejected_key for record, _ in rows):
+            raise _DataError('violates foreign key constraint')
+        self.rows.extend(rows)
+
+
+@pytest.fixture
+def database(monkeypatch, tmp_path) -> _Database:
+    database = _Database()
+    monkeypatch.setattr(settings, 'USAGE_WRITER_SPILL_DIR', str(tmp_path))
+    monkeypatch.setattr(settings, 'USAGE_WRITER_BATCH_SIZE', 2)
+    monkeypatch.setattr(usage_writer_module, 'AsyncSessionLocal', _Session)
+    monkeypatch.setattr(usage_writer_module.usage_log_crud, 'bulk_insert', database.bulk_insert)
+    return database
+
+
+def _rows(*api_key_ids: int) -> list[tuple[UsageLogCreate, datetime]]:
+    created_at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    return [
+        (
+            UsageLogCreate(
+                api_key_id=api_key_id, conversation_id=None, model_name='deepseek-chat', provider='deepseek',
+                prompt_tokens=10, completion_tokens=5, total_tokens=15, cost=0.001, response_time=0.2,
+                extra_data={'cached_tokens': 4},
+            ),
+            created_at,
+        )
+        for api_key_id in api_key_ids
+    ]
+
+
+async def test_spills_while_database_is_down_and_replays_after_recovery(database, tmp_path):
+    writer = UsageLogWriter()
+    database.available = False
+
+    await writer._write(_rows(1, 2, 3))
+    assert database.rows == []
+    assert writer.spilled == 3
+    assert [path.name for path in tmp_path.iterdir()] == [writer._spill_path.name]
+    assert not writer.snapshot()['database_available']
+
+    # 重试间隔内不回放
+    database.available = True
+    await writer._replay()
+    assert database.rows == []
+
+    writer._retry_at = time.monotonic()
+    await writer._replay()
+    assert database.rows == _rows(1, 2, 3)
+    assert writer.replayed == 3
+    assert list(tmp_path.iterdir()) == []
+    assert not writer.snapshot()['spill_pending']
+
+
+async def test_writes_spill_directly_until_retry_interval_passes(database):
+    writer = UsageLogWriter()
+    database.available = False
+    await writer._write(_rows(1))
+
+    # 数据库恢复，但重试时间未到：新的批次继续写入文件，不访问数据库
+    database.available = True
+    await writer._write(_rows(2))
+    assert database.rows == []
+    assert writer.spilled == 2
+
+
+async def test_replay_keeps_remaining_records_when_database_fails_again(database, tmp_path, monkeypatch):
+    writer = UsageLogWriter()
+    database.available = False
+    await writer._write(_rows(1, 2, 3, 4))
+
+    writer._retry_at = 0.0
+    calls = 0
+    bulk_insert = database.bulk_insert
+
+    async def fail_second_batch(db, rows):
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            raise ConnectionResetError('connection lost')
+        await bulk_insert(db, rows)
+
+    database.available = True
+    monkeypatch.setattr(usage_writer_module.usage_log_crud, 'bulk_insert', fail_second_batch)
+    await writer._replay()
+    assert database.rows == _rows(1, 2)
+    assert writer.replayed == 2
+
+    writer._retry_at = 0.0
+    await writer._replay()
+    assert database.rows == _rows(1, 2, 3, 4)
+    assert list(tmp_path.iterdir()) == []
+
+
+async def test_replays_files_left_by_exited_process(database, tmp_path, monkeypatch):
+    writer = UsageLogWriter()
+    (tmp_path / 'usage-999999.jsonl').write_bytes(
+        b''.join(
+            usage_writer_module.json_dumps({**record.model_dump(), 'created_at': created_at.isoformat()}) + b'\n'
+            for record, created_at in _rows(7, 8)
+        )
+        + b'{"api_key_id": 9, "trunc'
+    )
+    monkeypatch.setattr(usage_writer_module, '_process_alive', lambda pid: False)
+
+    writer._has_spill = True
+    await writer._replay()
+    assert database.rows == _rows(7, 8)
+    assert list(tmp_path.iterdir()) == []
+
+
+async def test_drops_only_records_that_cannot_be_written(database):
+    writer = UsageLogWriter()
+    database.rejected_key = 13
+
+    await writer._write(_rows(11, 12, 13, 14))
+    assert database.rows == _rows(11, 12, 14)
+    assert writer.dropped == 1
+    assert writer.spilled == 0
+    assert writer.snapshot()['database_available']